@@ -1,94 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.database import get_async_session
-from app.services.currency_service import CurrencyService
+from app.db.database import db, get_read_session
+from app.services.currency_service import CurrencyService, BULK_CHUNK_SIZE
+from app.services.rate_store import rate_store
+from app.services.store_sync import store_sync
+from app.services.asset_catalog import asset_catalog
+from app.services.conversion import conversion_engine
+from app.services.export_service import ExportService, EXPORT_FORMATS, EXPORT_RESOLUTIONS
+from app.services.history_service import HistoryService, INTERVALS, to_epoch, from_epoch
 from app.tasks.background import background_manager
+from app.tasks.compaction import compaction_manager
+from app.tasks.leader import leader_elector
 from app.schemas.currency import (
     CurrencyCreate, CurrencyResponse, CurrencyUpdate,
-    CurrencyListResponse, BackgroundTaskStatus
+    CurrencyListResponse, BackgroundTaskStatus, HistoryResponse, CompactionStatus,
+    ConversionResponse, RateMatrixResponse
 )
 from app.ws.manager import ws_manager
-from datetime import datetime
+from app.nats.client import nats_client
+from app.http.client import http_client
+from app.encoding import dumps
+from datetime import datetime, timedelta
+from typing import Optional
 from app.config import get_settings
-import httpx
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1", tags=["currencies"])
 settings = get_settings()
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Проверка If-None-Match (список тегов, W/ префикс, "*")."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+
 @router.get(
     "/provider/assets",
     summary="Получение валют с сервисов для парсинга",
 )
-async def get_available_assets_to_add():
+async def get_available_assets_to_add(request: Request):
     """
     Возвращает список всех доступных для отслеживания активов (Фиат + Крипта).
+
+    Каталог кэшируется (см. ASSETS_CACHE_TTL), ответ отдается с ETag.
     """
-    settings = get_settings()
-    async with httpx.AsyncClient(timeout=10) as client:
-        available_assets = {
-            "fiat": [],
-            "crypto": [],
-            "cbr": []
-        }
-        
-        # Получаем Фиат (Supported Codes)
-        try:
-            url = f"{settings.exchangerate_api_url}/{settings.base_currency}"
-            resp = await client.get(url)
-            if resp.status_code == 200:
-                data = resp.json()
-                available_assets["fiat"] = [
-                    {"code": k, "name": f"Fiat {k}"} for k in data.get("rates", {}).keys()
-                ]
-        except Exception as e:
-            available_assets["fiat_error"] = str(e)
-
-        # Получаем Крипту с Binance (Exchange Info)
-        try:
-            url = f"{settings.binance_api_url}/api/v3/exchangeInfo"
-            resp = await client.get(url)
-            if resp.status_code == 200:
-                data = resp.json()
-                symbols = data.get("symbols", [])
-                
-                crypto_list = []
-                for s in symbols:
-                    if s["status"] == "TRADING" and s["quoteAsset"] == "USDT":
-                        crypto_list.append({
-                            "code": s["baseAsset"], # BTC
-                            "symbol": s["symbol"],  # BTCUSDT
-                            "name": f"{s['baseAsset']}/USDT"
-                        })
-                # сортируем
-                available_assets["crypto"] = sorted(crypto_list, key=lambda x: x["code"])
-        except Exception as e:
-            available_assets["crypto_error"] = str(e)
-
-        # Получаем список ЦБ
-        try:
-            url = settings.cbr_api_url
-            resp = await client.get(url)
-            if resp.status_code == 200:
-                data = resp.json()
-                valute = data.get("Valute", {})
-                available_assets["cbr"] = [
-                    {
-                        "code": f"{v['CharCode']}RUB",
-                        "name": f"CBR {v['Name']} (RUB)",
-                        "nominal": v['Nominal']
-                    }
-                    for v in valute.values()
-                ]
-        except Exception as e:
-            available_assets["cbr_error"] = str(e)
-            
-        return {
-            "total_fiat": len(available_assets["fiat"]),
-            "total_crypto": len(available_assets["crypto"]),
-            "total_cbr": len(available_assets["cbr"]),
-            "assets": available_assets
-        }
+    body, etag = await asset_catalog.get()
+    headers = {"ETag": etag, "Cache-Control": f"max-age={int(asset_catalog.fresh_for())}"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get(
@@ -97,13 +65,60 @@ async def get_available_assets_to_add():
     summary="Получить все напарсенные валюты",
 )
 async def get_currencies(
-    session: AsyncSession = Depends(get_async_session)
+    request: Request,
+    c_type: Optional[str] = Query(None, alias="type", description="Тип: fiat, crypto, cbr"),
+    codes: Optional[str] = Query(None, description=f"Коды через запятую (до {BULK_CHUNK_SIZE})"),
+    prefix: Optional[str] = Query(None, description="Начало кода, например USD"),
+    updated_since: Optional[datetime] = Query(None, description="Обновленные не раньше (UTC)"),
+    after: Optional[int] = Query(None, description="Курсор: next_after предыдущей страницы"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Размер страницы"),
 ):
-    """Получение всех созданных валют."""
-    currencies = await CurrencyService.get_all_currencies(session)
+    """
+    Получение созданных валют.
+
+    Без параметров - весь список из кэша в памяти с ETag. С фильтрами - из БД
+    по индексам, страницами по ID: GET /api/v1/currencies?type=crypto&limit=100,
+    дальше - с after=<next_after>.
+    """
+    filtered = any(p is not None for p in (c_type, codes, prefix, updated_since, after, limit))
+    if not filtered and rate_store.loaded:
+        body, etag = rate_store.list_body()
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    code_list = None
+    if codes is not None:
+        code_list = list(dict.fromkeys(c.strip().upper() for c in codes.split(",") if c.strip()))
+        if len(code_list) > BULK_CHUNK_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Too many codes (max {BULK_CHUNK_SIZE})",
+            )
+
+    if updated_since is not None and updated_since.tzinfo is not None:
+        # В БД наивный UTC
+        updated_since = from_epoch(to_epoch(updated_since))
+
+    async with db.read_session() as session:
+        # На одну больше, чтобы понять, есть ли следующая страница
+        currencies = await CurrencyService.list_currencies(
+            session,
+            c_type=c_type,
+            codes=code_list,
+            prefix=prefix.upper() if prefix else None,
+            updated_since=updated_since,
+            after=after,
+            limit=limit + 1 if limit else None
+        )
+    next_after = None
+    if limit and len(currencies) > limit:
+        currencies = currencies[:limit]
+        next_after = currencies[-1].id
     return CurrencyListResponse(
         total=len(currencies),
-        currencies=[CurrencyResponse.from_orm(c) for c in currencies]
+        currencies=[CurrencyResponse.from_orm(c) for c in currencies],
+        next_after=next_after
     )
 
 
@@ -112,20 +127,26 @@ async def get_currencies(
     response_model=CurrencyResponse,
     summary="Получить выбранную валюту",
 )
-async def get_currency(
-    identifier: str,
-    session: AsyncSession = Depends(get_async_session),
-):
+async def get_currency(identifier: str):
     """
     Получить валюту по ID (число) или по коду (строка, например 'BTC', 'USDRUB').
     """
-    currency = None
+    if rate_store.loaded:
+        cached = rate_store.get(identifier)
+        if cached is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Currency with identifier '{identifier}' not found",
+            )
+        return cached
 
-    if identifier.isdigit():
-        currency = await CurrencyService.get_currency_by_id(session, int(identifier))
+    currency = None
+    async with db.read_session() as session:
+        if identifier.isdigit():
+            currency = await CurrencyService.get_currency_by_id(session, int(identifier))
 
-    if not currency:
-        currency = await CurrencyService.get_currency_by_code(session, identifier.upper())
+        if not currency:
+            currency = await CurrencyService.get_currency_by_code(session, identifier.upper())
 
     if not currency:
         raise HTTPException(
@@ -136,18 +157,227 @@ async def get_currency(
     return CurrencyResponse.from_orm(currency)
 
 
+@router.get(
+    "/currencies/{code}/history",
+    response_model=HistoryResponse,
+    summary="История курса (OHLC свечи)",
+)
+async def get_currency_history(
+    code: str,
+    start: Optional[datetime] = Query(None, alias="from", description="Начало (UTC), по умолчанию сутки назад"),
+    end: Optional[datetime] = Query(None, alias="to", description="Конец (UTC), по умолчанию сейчас"),
+    interval: str = Query("1h", description=f"Интервал свечи: {', '.join(INTERVALS)}"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Пример: GET /api/v1/currencies/BTC/history?from=2024-01-01T00:00:00&interval=15m
+    """
+    if interval not in INTERVALS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown interval '{interval}', expected one of: {', '.join(INTERVALS)}",
+        )
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=1)
+    start_ts, end_ts = to_epoch(start), to_epoch(end)
+    step = INTERVALS[interval]
+    
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must be before 'to'")
+    if (end_ts - start_ts) / step > settings.history_max_bars:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many bars requested (max {settings.history_max_bars}), use a larger interval",
+        )
+    
+    bars = await HistoryService.get_ohlc(session, code.upper(), start_ts, end_ts, step)
+    return HistoryResponse(
+        code=code.upper(),
+        interval=interval,
+        start=start,
+        end=end,
+        bars=bars
+    )
+
+
+class ExportResponse(StreamingResponse):
+    """
+    Потоковый ответ с таймаутом на отправку каждого куска.
+
+    Медленный или зависший клиент иначе держал бы слот выгрузки и
+    соединение пула чтения сколько угодно долго.
+    """
+
+    async def stream_response(self, send):
+        timeout = settings.export_send_timeout
+
+        async def send_with_timeout(message):
+            try:
+                await asyncio.wait_for(send(message), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Клиент выгрузки не принял данные за {timeout} сек, обрываем")
+                raise
+
+        await super().stream_response(send_with_timeout)
+
+
+def _export_response(body, fmt: str, filename: str) -> StreamingResponse:
+    return ExportResponse(
+        body,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+
+def _check_export(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown format '{fmt}', expected one of: {', '.join(EXPORT_FORMATS)}",
+        )
+    if ExportService.busy():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many exports in progress, retry later",
+            headers={"Retry-After": "5"},
+        )
+
+
+@router.get(
+    "/export/currencies",
+    summary="Потоковая выгрузка валют (NDJSON/CSV)",
+)
+async def export_currencies(
+    fmt: str = Query("ndjson", alias="format", description=f"Формат: {', '.join(EXPORT_FORMATS)}"),
+):
+    """
+    Пример: GET /api/v1/export/currencies?format=csv
+    """
+    _check_export(fmt)
+    return _export_response(ExportService.stream_currencies(fmt), fmt, "currencies")
+
+
+@router.get(
+    "/export/history",
+    summary="Потоковая выгрузка истории курсов (NDJSON/CSV)",
+)
+async def export_history(
+    codes: Optional[str] = Query(None, description="Коды через запятую, по умолчанию все"),
+    start: Optional[datetime] = Query(None, alias="from", description="Начало (UTC)"),
+    end: Optional[datetime] = Query(None, alias="to", description="Конец (UTC)"),
+    resolution: str = Query("raw", description=f"Разрешение: {', '.join(EXPORT_RESOLUTIONS)}"),
+    fmt: str = Query("ndjson", alias="format", description=f"Формат: {', '.join(EXPORT_FORMATS)}"),
+):
+    """
+    Пример: GET /api/v1/export/history?codes=BTC,ETH&from=2024-01-01T00:00:00&resolution=1m&format=csv
+    """
+    _check_export(fmt)
+    if resolution not in EXPORT_RESOLUTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown resolution '{resolution}', expected one of: {', '.join(EXPORT_RESOLUTIONS)}",
+        )
+    code_list = [c.strip().upper() for c in codes.split(",") if c.strip()] if codes else None
+    body = ExportService.stream_history(
+        fmt,
+        codes=code_list,
+        start=to_epoch(start) if start else None,
+        end=to_epoch(end) if end else None,
+        resolution=EXPORT_RESOLUTIONS[resolution]
+    )
+    return _export_response(body, fmt, f"history_{resolution}")
+
+
+@router.get(
+    "/convert",
+    response_model=ConversionResponse,
+    summary="Конвертация между любыми активами",
+)
+async def convert(
+    from_currency: str = Query(..., alias="from", description="Из какого актива (USD, BTC, RUB...)"),
+    to_currency: str = Query(..., alias="to", description="В какой актив"),
+    amount: float = Query(1.0, description="Сумма"),
+):
+    """
+    Пример: GET /api/v1/convert?from=BTC&to=RUB&amount=0.5
+    """
+    try:
+        rate, result = conversion_engine.convert(from_currency, to_currency, amount)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No rate for {e.args[0]}",
+        )
+    return ConversionResponse(
+        from_currency=from_currency.upper(),
+        to_currency=to_currency.upper(),
+        amount=amount,
+        rate=rate,
+        result=result
+    )
+
+
+@router.get(
+    "/matrix",
+    response_model=RateMatrixResponse,
+    summary="Матрица кросс-курсов",
+)
+async def get_rate_matrix(
+    codes: str = Query(..., description="Активы через запятую: USD,EUR,BTC"),
+):
+    """
+    Пример: GET /api/v1/matrix?codes=USD,EUR,RUB,BTC
+    """
+    assets = list(dict.fromkeys(c.strip().upper() for c in codes.split(",") if c.strip()))
+    if not assets:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No codes given")
+    if len(assets) > settings.convert_matrix_max_codes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many codes (max {settings.convert_matrix_max_codes})",
+        )
+    unknown = conversion_engine.unknown(assets)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No rate for {', '.join(unknown)}",
+        )
+    matrix = conversion_engine.matrix(assets)
+    # Матрица может быть большой - сериализуем сразу, без валидации модели
+    return Response(
+        content=dumps({"codes": assets, "rates": matrix.tolist()}),
+        media_type="application/json"
+    )
+
+
+async def _find_currency(session: AsyncSession, identifier: str):
+    """Валюта по ID или коду."""
+    currency = None
+    if identifier.isdigit():
+        currency = await CurrencyService.get_currency_by_id(session, int(identifier))
+    if not currency:
+        currency = await CurrencyService.get_currency_by_code(session, identifier.upper())
+    return currency
+
+
 @router.post(
     "/currencies", 
     response_model=CurrencyResponse, 
     status_code=status.HTTP_201_CREATED,
     summary="Создать валюту",
 )
-async def create_currency(
-    currency: CurrencyCreate,
-    session: AsyncSession = Depends(get_async_session)
-):
-    db_currency = await CurrencyService.create_currency(session, currency)
-    return CurrencyResponse.from_orm(db_currency)
+async def create_currency(currency: CurrencyCreate):
+    # Все записи - через очередь писателя (одно соединение на запись)
+    async def create(session):
+        db_currency = await CurrencyService.create_currency(session, currency, commit=False)
+        return CurrencyResponse.from_orm(db_currency)
+
+    response = await db.writer.submit(create)
+    rate_store.upsert([response])
+    # Следующий цикл источника перепишет курс, даже если документ не менялся
+    background_manager.invalidate_providers()
+    await store_sync.publish([response], invalidate=True)
+    return response
 
 
 @router.patch(
@@ -155,30 +385,33 @@ async def create_currency(
     response_model=CurrencyResponse,
     summary="Обновление валюты по ID или коду",
 )
-async def patch_currency(
-    identifier: str,
-    currency_update: CurrencyUpdate,
-    session: AsyncSession = Depends(get_async_session),
-):
+async def patch_currency(identifier: str, currency_update: CurrencyUpdate):
     """
     Примеры:
       PATCH /api/v1/currencies/1
       PATCH /api/v1/currencies/BTC
     """
-    currency = None
-    if identifier.isdigit():
-        currency = await CurrencyService.get_currency_by_id(session, int(identifier))
-    if not currency:
-        currency = await CurrencyService.get_currency_by_code(session, identifier.upper())
+    async def update(session):
+        currency = await _find_currency(session, identifier)
+        if not currency:
+            return None
+        updated = await CurrencyService.update_currency(
+            session, currency.id, currency_update, commit=False
+        )
+        return CurrencyResponse.from_orm(updated)
 
-    if not currency:
+    response = await db.writer.submit(update)
+    if response is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Currency not found",
         )
 
-    updated = await CurrencyService.update_currency(session, currency.id, currency_update)
-    return CurrencyResponse.from_orm(updated)
+    rate_store.upsert([response])
+    # Следующий цикл источника перепишет курс, даже если документ не менялся
+    background_manager.invalidate_providers()
+    await store_sync.publish([response], invalidate=True)
+    return response
 
 
 @router.delete(
@@ -186,21 +419,37 @@ async def patch_currency(
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Удалить валюту"
 )
-async def delete_currency(
-    identifier: str,
-    session: AsyncSession = Depends(get_async_session)
-):
-    currency = None
-    if identifier.isdigit():
-        currency = await CurrencyService.get_currency_by_id(session, int(identifier))
-    
-    if not currency:
-        currency = await CurrencyService.get_currency_by_code(session, identifier.upper())
-        
-    if not currency:
+async def delete_currency(identifier: str):
+    async def remove(session):
+        currency = await _find_currency(session, identifier)
+        if not currency:
+            return None
+        await CurrencyService.delete_currency(session, currency.id, commit=False)
+        return currency.code
+
+    code = await db.writer.submit(remove)
+    if code is None:
         raise HTTPException(status_code=404, detail="Not found")
 
-    await CurrencyService.delete_currency(session, currency.id)
+    rate_store.remove(code)
+    await store_sync.publish(removed=[code])
+
+
+def _leader_status() -> dict:
+    """Кто лидер: без выбора лидера фоновые задачи крутит этот узел."""
+    if settings.leader_election == "none":
+        node_id = leader_elector.node_id
+        return {"node_id": node_id, "leader": node_id if background_manager.is_leader else None}
+    return {"node_id": leader_elector.node_id, "leader": leader_elector.leader}
+
+
+def _require_leader():
+    """Ручной запуск фоновых задач - только на узле, который их крутит (иначе 409)."""
+    if not background_manager.is_leader:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "This node does not run background tasks", **_leader_status()},
+        )
 
 
 @router.post(
@@ -209,7 +458,12 @@ async def delete_currency(
     summary="Запустить фоновую задачу"
 )
 async def run_background_task():
-    """Manually trigger background task."""
+    """
+    Manually trigger background task.
+
+    Только на узле, который обновляет курсы (иначе 409 с текущим лидером).
+    """
+    _require_leader()
     await background_manager.run_once()
     status_data = background_manager.get_status()
     
@@ -217,7 +471,12 @@ async def run_background_task():
         status=status_data["status"],
         message=status_data["message"],
         updated_at=status_data["updated_at"],
-        currencies_count=status_data["currencies_count"]
+        currencies_count=status_data["currencies_count"],
+        duration_ms=status_data["duration_ms"],
+        skipped_unchanged=status_data["skipped_unchanged"],
+        suppressed_events=status_data["suppressed_events"],
+        providers=background_manager.get_providers_status(),
+        **_leader_status()
     )
 
 
@@ -234,10 +493,41 @@ async def get_task_status():
         status=status_data["status"],
         message=status_data["message"],
         updated_at=status_data["updated_at"],
-        currencies_count=status_data["currencies_count"]
+        currencies_count=status_data["currencies_count"],
+        duration_ms=status_data["duration_ms"],
+        skipped_unchanged=status_data["skipped_unchanged"],
+        suppressed_events=status_data["suppressed_events"],
+        providers=background_manager.get_providers_status(),
+        **_leader_status()
     )
 
 
+@router.post(
+    "/tasks/compaction/run",
+    response_model=CompactionStatus,
+    summary="Запустить сжатие истории"
+)
+async def run_compaction():
+    """
+    Manually trigger history compaction.
+
+    Только на лидере, как и /tasks/run: иначе сжатие пошло бы параллельно с лидером.
+    """
+    _require_leader()
+    await compaction_manager.run_once()
+    return CompactionStatus(**compaction_manager.get_status())
+
+
+@router.get(
+    "/tasks/compaction/status",
+    response_model=CompactionStatus,
+    summary="Получить статус сжатия истории"
+)
+async def get_compaction_status():
+    """Get history compaction status."""
+    return CompactionStatus(**compaction_manager.get_status())
+
+
 @router.get(
     "/health",
     summary="Узнать работоспособность сервиса"
@@ -247,5 +537,11 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow(),
-        "active_ws_connections": ws_manager.get_active_count()
+        "active_ws_connections": ws_manager.get_active_count(),
+        "ws": ws_manager.get_stats(),
+        "nats": nats_client.get_stats(),
+        "http": http_client.get_stats(),
+        "assets_cache": asset_catalog.get_stats(),
+        "conversion": conversion_engine.get_stats(),
+        "db_writer": db.writer.get_stats() if db.writer else None
     }
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 from functools import lru_cache
 
 
@@ -9,14 +9,41 @@ class Settings(BaseSettings):
     # БД
     database_url: str = "sqlite+aiosqlite:///./data/currency_monitor.db"
     
-    # NATS
+    # NATS (nats_enabled=False - не подключаемся и не публикуем)
+    nats_enabled: bool = True
     nats_url: str = "nats://localhost:4222"
     nats_subject: str = "currency.updates"
+    # Публиковать в currency.updates.<type>.<code> (батчи - в currency.updates.batch)
+    # вместо одного общего subject. Несовместимо с подписчиками на currency.updates -
+    # включать после перевода их на currency.updates.>
+    nats_per_currency_subjects: bool = False
+    nats_flush_timeout: int = 5  # сек
+    # Публиковать в NATS одно сообщение "batch" за цикл вместо события на валюту
+    nats_batch_mode: bool = False
+    # Изменения кэша курсов для других воркеров/реплик (каждая запись в БД, без порога)
+    nats_sync_subject: str = "currency.sync"
+    nats_sync_batch_size: int = 1000  # валют в одном сообщении синхронизации
+    
+    # Максимум событий в одном сообщении "batch" (0 - без разбиения)
+    event_batch_size: int = 500
     
     # API настройки
     background_task_interval: int = 60  # сек
     api_timeout: int = 10  # сек
     
+    # HTTP клиент к внешним источникам (один на приложение)
+    http2: bool = False  # нужен пакет h2 (pip install "httpx[http2]")
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 60  # сек
+    # Повторы с экспоненциальной паузой и джиттером: сетевые ошибки, 429, 5xx
+    http_retries: int = 2
+    http_retry_backoff: float = 0.5  # сек, первая пауза (до джиттера)
+    http_retry_max_backoff: float = 5  # сек
+    # Автомат: после N ошибок подряд не ходим в источник cooldown секунд
+    http_breaker_failure_threshold: int = 5
+    http_breaker_cooldown: float = 30  # сек
+    
     # Внешний API который парсим (Fiat)
     exchangerate_api_url: str = "https://api.exchangerate-api.com/v4/latest"
     base_currency: str = "USD"
@@ -27,6 +54,92 @@ class Settings(BaseSettings):
     # Внешний API который парсим (Crypto - Binance)
     binance_api_url: str = "https://api.binance.com"
     
+    # Источники курсов ("fiat", "binance", "binance_stream", "cbr"), у каждого
+    # свое расписание, таймаут и число повторов
+    # пример: PROVIDER_INTERVALS={"binance": 1, "cbr": 3600}
+    providers_enabled: List[str] = ["fiat", "binance", "cbr"]
+    provider_intervals: Dict[str, float] = {}  # сек, по умолчанию background_task_interval
+    provider_timeouts: Dict[str, float] = {}  # сек, по умолчанию api_timeout
+    provider_retries: Dict[str, int] = {}  # по умолчанию http_retries
+    
+    # Кэш каталога активов (/provider/assets): свежий ttl секунд, потом до
+    # stale_ttl отдается старый с обновлением в фоне
+    assets_cache_ttl: int = 3600
+    assets_stale_ttl: int = 86400
+    
+    # Поток Binance для источника "binance_stream": все тикеры (!miniTicker@arr)
+    # или только перечисленные символы к USDT
+    binance_ws_url: str = "wss://stream.binance.com:9443"
+    binance_ws_symbols: List[str] = []
+    
+    # SQLite: WAL, одно соединение на запись и пул соединений на чтение
+    sqlite_tuning: bool = True
+    sqlite_read_pool_size: int = 4
+    sqlite_synchronous: str = "NORMAL"  # в WAL не теряет целостность, только последние транзакции при сбое ОС
+    sqlite_cache_size_kb: int = 65536
+    sqlite_mmap_size_mb: int = 256
+    sqlite_busy_timeout_ms: int = 5000
+    # Максимум задач записи, объединяемых в одну транзакцию
+    db_write_batch_size: int = 50
+    
+    # История курсов (точки пишет фоновая задача)
+    history_enabled: bool = True
+    history_max_bars: int = 5000  # максимум свечей в одном ответе
+    
+    # Потоковые выгрузки держат соединение пула чтения весь ответ: одновременно
+    # не больше export_max_concurrent (и всегда меньше sqlite_read_pool_size)
+    export_max_concurrent: int = 2
+    export_send_timeout: float = 30.0  # сек на отправку куска клиенту, потом обрыв
+    
+    # Сжатие истории: raw -> 1m -> 1h -> 1d по срокам хранения
+    history_compaction_enabled: bool = True
+    history_compaction_interval: int = 3600  # сек между проходами
+    history_compaction_batch_rows: int = 50000  # строк источника в одной транзакции
+    history_raw_retention_hours: int = 24
+    history_1m_retention_days: int = 7
+    history_1h_retention_days: int = 90
+    history_1d_retention_days: int = 0  # 0 - хранить всегда
+    
+    # Пороги изменения по типу ("fiat", "crypto", "cbr"), ниже которых
+    # событие не рассылается (курс в БД все равно обновляется)
+    # пример: MIN_CHANGE_PERCENT={"crypto": 0.01, "fiat": 0.001}
+    min_change_abs: Dict[str, float] = {}
+    min_change_percent: Dict[str, float] = {}
+    
+    # Откуда веб-сокеты получают обновления:
+    # "local" - напрямую от фоновой задачи этого процесса,
+    # "nats" - из NATS (несколько воркеров/реплик, задача работает на одном узле)
+    ws_fanout_mode: str = "local"
+    ws_fanout_window_ms: int = 20  # окно сбора сообщений NATS в одну рассылку
+    
+    # Запускать фоновые задачи (обновление курсов, сжатие истории) в этом процессе
+    # (при включенном выборе лидера - может ли узел стать лидером)
+    run_background_tasks: bool = True
+    
+    # Выбор лидера для фоновых задач между процессами/репликами:
+    # "none" - задачи крутит каждый процесс, "db" - аренда строкой в БД
+    # (процессы на одной машине), "nats_kv" - аренда в NATS JetStream KV
+    leader_election: str = "none"
+    leader_lease_ttl: int = 10  # сек, лидер продлевает аренду каждые ttl/3
+    leader_kv_bucket: str = "currency_monitor_leader"
+    node_id: str = ""  # по умолчанию hostname-pid
+    
+    # WebSocket: размер очереди отправки на клиента и политика для медленных
+    # "drop_oldest" - выкидываем старые, "conflate" - только последнее по валюте,
+    # "disconnect" - отключаем клиента
+    ws_send_queue_size: int = 10000
+    ws_slow_consumer_policy: str = "drop_oldest"
+    # Максимум подписок по кодам на одного клиента
+    ws_max_subscriptions: int = 1000
+    
+    # Кросс-курсы: активы, которые считаем равными 1:1 (USDT <-> USD связывает
+    # крипту с фиатом), и максимум активов в одной матрице /matrix
+    convert_pegs: Dict[str, str] = {"USDT": "USD"}
+    convert_matrix_max_codes: int = 200
+    
+    # Метрики Prometheus на /metrics (выключено - запись метрик ничего не делает)
+    metrics_enabled: bool = True
+    
     # Уровень логирования
     log_level: str = "INFO"
     
@@ -1,28 +1,228 @@
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.db.models import Base
 from app.config import get_settings
+from app.metrics import metrics
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Задача записи: корутина job(session), commit делает писатель
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class DBWriter:
+    """
+    Единственный писатель в БД.
+
+    Задачи записи ставятся в очередь, писатель забирает все накопившиеся
+    (до max_batch) и выполняет их одной транзакцией с одним commit. Если
+    транзакция падает, задачи пачки повторяются по одной, чтобы ошибка
+    одной не отменяла остальные.
+    """
+
+    def __init__(self, session_factory: sessionmaker, max_batch: int):
+        self.session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._current: List[Tuple[WriteJob, asyncio.Future]] = []
+        self.stats = {
+            "jobs": 0,
+            "transactions": 0,
+            "failed_jobs": 0,
+            "last_batch_jobs": 0,
+            "last_commit_ms": None,
+            "max_commit_ms": 0.0,
+        }
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Писатель БД остановлен"))
+
+    async def submit(self, job: WriteJob) -> Any:
+        """Выполнить job(session) в очереди записи и вернуть его результат."""
+        if self._task is None:
+            # Писатель не запущен (скрипты, тесты) - пишем сразу
+            async with self.session_factory() as session:
+                result = await job(session)
+                await session.commit()
+                return result
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((job, future))
+        return await future
+
+    async def _run(self):
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                self._current = batch
+                await self._execute(batch)
+                self._current = []
+        except asyncio.CancelledError:
+            for _, future in self._current:
+                if not future.done():
+                    future.set_exception(RuntimeError("Писатель БД остановлен"))
+            raise
+
+    async def _execute(self, batch: List[Tuple[WriteJob, asyncio.Future]]):
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as session:
+                results = [await job(session) for job, _ in batch]
+                await session.commit()
+        except Exception as e:
+            if len(batch) > 1:
+                logger.warning(f"Пачка записи из {len(batch)} задач откатилась ({e!r}), повторяем по одной")
+                for item in batch:
+                    await self._execute([item])
+                return
+            self.stats["failed_jobs"] += 1
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        commit_ms = (time.perf_counter() - started) * 1000
+        self.stats["jobs"] += len(batch)
+        self.stats["transactions"] += 1
+        self.stats["last_batch_jobs"] = len(batch)
+        self.stats["last_commit_ms"] = round(commit_ms, 2)
+        self.stats["max_commit_ms"] = max(self.stats["max_commit_ms"], round(commit_ms, 2))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "queued": self._queue.qsize()}
+
+    def collect_metrics(self):
+        """Очередь и транзакции писателя для /metrics."""
+        yield ("currency_db_writer_queue_depth", "gauge", "Задач в очереди писателя БД",
+               [({}, self._queue.qsize())])
+        yield ("currency_db_writer_jobs_total", "counter", "Выполнено задач записи",
+               [({}, self.stats["jobs"])])
+        yield ("currency_db_writer_transactions_total", "counter", "Транзакций писателя",
+               [({}, self.stats["transactions"])])
+        yield ("currency_db_writer_failed_jobs_total", "counter", "Задач записи с ошибкой",
+               [({}, self.stats["failed_jobs"])])
+
 
 class Database:
-    """Ассинхронный БД менаджер."""
+    """
+    Ассинхронный БД менаджер.
+
+    Для SQLite (sqlite_tuning) - WAL, настроенные pragma, одно соединение на
+    запись (все записи идут через очередь DBWriter) и отдельный пул
+    соединений только на чтение: в WAL читатели не ждут писателя. Аренда
+    лидера пишется коротким отдельным соединением (lease_session), чтобы
+    продление не стояло в очереди за большими пачками записи.
+    """
     
-    def __init__(self):
-        self.settings = get_settings()
+    def __init__(self, settings=None):
+        self.settings = settings or get_settings()
         self.engine = None
+        self.read_engine = None
         self.async_session = None
+        self.read_session = None
+        self.lease_engine = None
+        self.lease_session = None
+        self.writer: Optional[DBWriter] = None
+    
+    @property
+    def sqlite_tuned(self) -> bool:
+        url = self.settings.database_url
+        # У in-memory БД у каждого соединения своя база - пул читателей не годится
+        return self.settings.sqlite_tuning and url.startswith("sqlite") and ":memory:" not in url
+    
+    def _sqlite_pragmas(self, dbapi_connection, read_only: bool):
+        """Pragma на каждое новое соединение."""
+        pragmas = [
+            "PRAGMA journal_mode=WAL",
+            f"PRAGMA synchronous={self.settings.sqlite_synchronous}",
+            f"PRAGMA cache_size=-{self.settings.sqlite_cache_size_kb}",
+            f"PRAGMA mmap_size={self.settings.sqlite_mmap_size_mb * 1024 * 1024}",
+            f"PRAGMA busy_timeout={self.settings.sqlite_busy_timeout_ms}",
+            "PRAGMA temp_store=MEMORY",
+        ]
+        if read_only:
+            pragmas.append("PRAGMA query_only=ON")
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
     
     async def connect(self):
         """Инциализация подключения к БД."""
-        self.engine = create_async_engine(
-            self.settings.database_url,
-            echo=False,
-            future=True,
-            pool_pre_ping=True,
-        )
+        if self.sqlite_tuned:
+            # Одно соединение на запись и пул на чтение (по умолчанию для
+            # файловой SQLite aiosqlite берет NullPool и открывает соединение на каждый запрос)
+            self.engine = create_async_engine(
+                self.settings.database_url,
+                echo=False,
+                future=True,
+                pool_pre_ping=True,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=1,
+                max_overflow=0,
+            )
+            self.read_engine = create_async_engine(
+                self.settings.database_url,
+                echo=False,
+                future=True,
+                pool_pre_ping=True,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=self.settings.sqlite_read_pool_size,
+                max_overflow=0,
+            )
+            event.listen(
+                self.engine.sync_engine, "connect",
+                lambda conn, _: self._sqlite_pragmas(conn, read_only=False)
+            )
+            event.listen(
+                self.read_engine.sync_engine, "connect",
+                lambda conn, _: self._sqlite_pragmas(conn, read_only=True)
+            )
+            # Соединение на одну операцию с арендой, закрывается сразу
+            self.lease_engine = create_async_engine(
+                self.settings.database_url,
+                echo=False,
+                future=True,
+                poolclass=NullPool,
+            )
+            event.listen(
+                self.lease_engine.sync_engine, "connect",
+                lambda conn, _: self._sqlite_pragmas(conn, read_only=False)
+            )
+        else:
+            self.engine = create_async_engine(
+                self.settings.database_url,
+                echo=False,
+                future=True,
+                pool_pre_ping=True,
+            )
+            self.read_engine = self.engine
+            self.lease_engine = self.engine
         
         self.async_session = sessionmaker(
             self.engine,
@@ -31,15 +231,45 @@ class Database:
             autocommit=False,
             autoflush=False,
         )
+        self.read_session = sessionmaker(
+            self.read_engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autocommit=False,
+            autoflush=False,
+        )
+        self.lease_session = sessionmaker(
+            self.lease_engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autocommit=False,
+            autoflush=False,
+        )
         
-        # Создаем таблицы
+        # Создаем таблицы и индексы, добавленные в уже существующие таблицы
+        # (create_all создает индексы только вместе с новой таблицей)
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(self._create_missing_indexes)
+        
+        self.writer = DBWriter(self.async_session, self.settings.db_write_batch_size)
+        await self.writer.start()
         
-        logger.info("Успешно подключились к БД и таблицы созданы")
+        logger.info(f"Успешно подключились к БД и таблицы созданы (SQLite tuning: {self.sqlite_tuned})")
+    
+    @staticmethod
+    def _create_missing_indexes(conn):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
     
     async def disconnect(self):
         """Закрытие соединения к БД."""
+        if self.writer:
+            await self.writer.stop()
+        for engine in (self.read_engine, self.lease_engine):
+            if engine is not None and engine is not self.engine:
+                await engine.dispose()
         if self.engine:
             await self.engine.dispose()
             logger.info("Отключились от БД")
@@ -51,12 +281,13 @@ class Database:
 
 # Global database instance
 db = Database()
+metrics.add_collector(lambda: db.writer.collect_metrics() if db.writer else ())
 
 
-async def get_async_session() -> AsyncSession:
-    """Dependency for getting async session."""
-    if db.async_session is None:
+async def get_read_session() -> AsyncSession:
+    """Dependency: сессия только на чтение (пул читателей)."""
+    if db.read_session is None:
         raise RuntimeError("БД не проинцилизирована")
     
-    async with db.async_session() as session:
+    async with db.read_session() as session:
         yield session
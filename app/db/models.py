@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, DateTime, Integer
+from sqlalchemy import Column, String, Float, DateTime, Integer, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -14,9 +14,66 @@ class Currency(Base):
     name = Column(String(100), nullable=False)
     rate = Column(Float, nullable=False)
     previous_rate = Column(Float, nullable=True)
-    type = Column(String(10), default="fiat")  # 'fiat' or 'crypto'
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    type = Column(String(10), default="fiat", index=True)  # 'fiat' or 'crypto'
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     def __repr__(self):
         return f"<Currency {self.code} ({self.type}): {self.rate}>"
+
+
+
+class RateHistory(Base):
+    """История курсов: append-only точки (code, ts, rate)"""
+    
+    __tablename__ = "rate_history"
+    
+    id = Column(Integer, primary_key=True)
+    code = Column(String(10), nullable=False)
+    ts = Column(Float, nullable=False)  # unix time (UTC), сек
+    rate = Column(Float, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_rate_history_code_ts", "code", "ts"),
+        Index("ix_rate_history_ts", "ts"),  # для сжатия по времени
+    )
+    
+    def __repr__(self):
+        return f"<RateHistory {self.code} @{self.ts}: {self.rate}>"
+
+
+class RateHistoryBar(Base):
+    """Сжатая история: OHLC свечи разрешения resolution (сек)"""
+    
+    __tablename__ = "rate_history_bars"
+    
+    id = Column(Integer, primary_key=True)
+    code = Column(String(10), nullable=False)
+    resolution = Column(Integer, nullable=False)  # 60, 3600, 86400
+    ts = Column(Float, nullable=False)  # начало свечи, unix time (UTC)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_rate_history_bars_code_res_ts", "code", "resolution", "ts", unique=True),
+        Index("ix_rate_history_bars_res_ts", "resolution", "ts"),
+    )
+    
+    def __repr__(self):
+        return f"<RateHistoryBar {self.code} {self.resolution}s @{self.ts}>"
+
+
+class LeaderLease(Base):
+    """Аренда лидерства фоновых задач (одна строка на имя аренды)"""
+    
+    __tablename__ = "leader_leases"
+    
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(100), nullable=False)
+    expires_at = Column(Float, nullable=False)  # unix time
+    
+    def __repr__(self):
+        return f"<LeaderLease {self.name}: {self.holder} until {self.expires_at}>"
@@ -0,0 +1,181 @@
+"""Сериализация сообщений для NATS и WebSocket (один раз на событие)."""
+
+import json
+import math
+import struct
+from datetime import datetime, timezone
+from typing import Any, List, Tuple, Union
+
+from pydantic import BaseModel
+
+try:  # orjson опционален, если установлен - используем его
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """Сериализовать объект в JSON байты."""
+    if isinstance(obj, BaseModel):
+        # pydantic-core сериализует модели сам (Rust), без промежуточного dict
+        return obj.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    """Разобрать JSON (байты или строку)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class EncodedFrame:
+    """
+    Уже сериализованное сообщение.
+
+    Байты уходят в NATS как есть, текст для WebSocket декодируется один раз
+    и переиспользуется для всех клиентов. Для клиентов compact событие
+    разбирается (тоже один раз) только при первом обращении к compact.
+    """
+
+    __slots__ = ("data", "_text", "_event", "_compact")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._text = None
+        self._event = None
+        self._compact = None
+
+    @classmethod
+    def encode(cls, obj: Any) -> "EncodedFrame":
+        return cls(dumps(obj))
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.data.decode("utf-8")
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def event(self) -> dict:
+        """Разобранное сообщение."""
+        if self._event is None:
+            self._event = loads(self.data)
+        return self._event
+
+    @property
+    def is_update(self) -> bool:
+        """Событие "updated" - в compact передается бинарной строкой."""
+        return self.event.get("type") == "updated"
+
+    @property
+    def compact(self) -> Union["EncodedFrame", "BinaryFrame"]:
+        """Кадр для клиента compact: обновление - бинарно, остальное - этот же JSON."""
+        if self._compact is None:
+            self._compact = BinaryFrame(encode_compact([self])) if self.is_update else self
+        return self._compact
+
+
+class BinaryFrame:
+    """Бинарное сообщение WebSocket, общее для всех клиентов."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def encode_batch(frames: List[EncodedFrame], chunk: int = 1, chunks: int = 1) -> EncodedFrame:
+    """
+    Склеить уже закодированные события в одно сообщение "batch".
+
+    Формат: {"type": "batch", "chunk": номер части, "chunks": всего частей,
+    "count": событий в части, "events": [PriceChangeEvent, ...]}. События не
+    сериализуются повторно - их байты вставляются как есть.
+    """
+    header = dumps({"type": "batch", "chunk": chunk, "chunks": chunks, "count": len(frames)})
+    return EncodedFrame(
+        header[:-1] + b',"events":[' + b",".join(f.data for f in frames) + b"]}"
+    )
+
+
+def encode_batches(frames: List[EncodedFrame], size: int = 0) -> List[EncodedFrame]:
+    """Порезать события на сообщения "batch" по size штук (0 - одним сообщением)."""
+    size = size or len(frames)
+    parts = [frames[i:i + size] for i in range(0, len(frames), size)]
+    return [
+        encode_batch(part, chunk=i + 1, chunks=len(parts))
+        for i, part in enumerate(parts)
+    ]
+
+
+# Компактный бинарный формат обновлений (encoding=compact), little-endian:
+#   заголовок: версия (uint8), вид (uint8, 1 - обновления), N (uint32)
+#   колонки:   id валюты uint32[N], rate float64[N],
+#              previous_rate float64[N] (NaN - нет), updated_at float64[N] (unix, сек)
+# Коды по id клиент берет из сообщений "codes" (при подключении и при появлении
+# новых валют) и событий "created" (JSON).
+COMPACT_VERSION = 1
+COMPACT_UPDATES = 1
+_COMPACT_HEADER = struct.Struct("<BBI")
+
+# (id, rate, previous_rate, updated_at)
+CompactRow = Tuple[int, float, float | None, float]
+
+
+def _epoch(value: str) -> float:
+    """ISO время из события (наивное UTC) в unix секунды."""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def encode_compact(frames: List[EncodedFrame]) -> bytes:
+    """Склеить события "updated" в одно бинарное сообщение по колонкам."""
+    currencies = [frame.event["currency"] for frame in frames]
+    n = len(currencies)
+    previous = [c["previous_rate"] for c in currencies]
+    return _COMPACT_HEADER.pack(COMPACT_VERSION, COMPACT_UPDATES, n) + struct.pack(
+        f"<{n}I{n}d{n}d{n}d",
+        *[c["id"] for c in currencies],
+        *[c["rate"] for c in currencies],
+        *[math.nan if p is None else p for p in previous],
+        *[_epoch(c["updated_at"]) for c in currencies],
+    )
+
+
+def encode_compact_batches(frames: List[EncodedFrame], size: int = 0) -> List[Union[EncodedFrame, BinaryFrame]]:
+    """
+    События цикла для клиента compact в режиме batch.
+
+    "created" уходят JSON сообщениями "batch" первыми (из них клиент узнает
+    id новых кодов), "updated" - бинарными сообщениями по size штук.
+    """
+    created = [frame for frame in frames if not frame.is_update]
+    updated = [frame for frame in frames if frame.is_update]
+    messages: List[Union[EncodedFrame, BinaryFrame]] = encode_batches(created, size) if created else []
+    step = size or len(updated)
+    messages.extend(
+        BinaryFrame(encode_compact(updated[i:i + step]))
+        for i in range(0, len(updated), step)
+    )
+    return messages
+
+
+def decode_compact(data: bytes) -> List[CompactRow]:
+    """Разобрать бинарное сообщение обновлений (для клиентов на Python и бенчмарков)."""
+    version, kind, n = _COMPACT_HEADER.unpack_from(data)
+    if version != COMPACT_VERSION or kind != COMPACT_UPDATES:
+        raise ValueError(f"Unsupported compact message: version {version}, kind {kind}")
+    values = struct.unpack_from(f"<{n}I{n}d{n}d{n}d", data, _COMPACT_HEADER.size)
+    ids, rates, previous, updated = (values[i * n:(i + 1) * n] for i in range(4))
+    return [
+        (id_, rate, None if math.isnan(prev) else prev, ts)
+        for id_, rate, prev, ts in zip(ids, rates, previous, updated)
+    ]
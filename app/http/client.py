@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import random
+import time
+import httpx
+from app.config import get_settings
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Источник временно отключен автоматом после серии ошибок."""
+
+
+class CircuitBreaker:
+    """
+    Автомат на источник: closed -> open после failure_threshold ошибок подряд,
+    через cooldown секунд - half_open с одним пробным запросом.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Когда ушел пробный запрос (если он потерялся - через cooldown пускаем новый)
+        self._probe_started: Optional[float] = None
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к источнику."""
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half_open" and (
+            self._probe_started is None or now - self._probe_started >= self.cooldown
+        ):
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Источник {self.name} снова доступен")
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_started is not None or self.failures >= self.failure_threshold:
+            self.times_opened += 1
+            logger.warning(f"Источник {self.name} отключен на {self.cooldown:.0f} с после {self.failures} ошибок")
+            self.opened_at = time.monotonic()
+            self._probe_started = None
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def get_status(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "times_opened": self.times_opened,
+            "retry_in": round(self.retry_in(), 1),
+        }
+
+
+class HTTPClient:
+    """
+    Общий HTTP клиент к внешним источникам на все время жизни приложения.
+
+    Держит пул keep-alive соединений (по желанию HTTP/2), повторяет запросы
+    с экспоненциальной паузой и джиттером и не ходит в источник, пока его
+    автомат открыт.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "rejected": 0,
+        }
+
+    async def start(self):
+        """Создать пул соединений."""
+        if self.client is not None:
+            return
+        self.http2 = self.settings.http2
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 недоступен (нет пакета h2), используем HTTP/1.1")
+                self.http2 = False
+        self.client = httpx.AsyncClient(
+            timeout=self.settings.api_timeout,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.settings.http_max_connections,
+                max_keepalive_connections=self.settings.http_max_keepalive_connections,
+                keepalive_expiry=self.settings.http_keepalive_expiry
+            )
+        )
+        logger.info(f"HTTP клиент создан (HTTP/2: {self.http2})")
+
+    async def close(self):
+        """Закрыть пул соединений."""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            logger.info("HTTP клиент закрыт")
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        """Автомат источника (создается при первом обращении)."""
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(
+                name,
+                self.settings.http_breaker_failure_threshold,
+                self.settings.http_breaker_cooldown
+            )
+        return self.breakers[name]
+
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная пауза с полным джиттером."""
+        cap = min(
+            self.settings.http_retry_max_backoff,
+            self.settings.http_retry_backoff * 2 ** attempt
+        )
+        return random.uniform(0, cap)
+
+    async def get(
+        self,
+        url: str,
+        source: str,
+        retries: Optional[int] = None,
+        timeout: Optional[float] = None,
+        headers: Optional[dict] = None
+    ) -> httpx.Response:
+        """
+        GET к источнику source с повторами и автоматом.
+
+        Повторяются сетевые ошибки, таймауты и ответы 429/5xx; последний
+        такой ответ возвращается как есть, последняя ошибка - пробрасывается.
+        """
+        await self.start()
+        breaker = self.breaker(source)
+        if not breaker.allow():
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(
+                f"Источник {source} отключен, повтор через {breaker.retry_in():.0f} с"
+            )
+
+        retries = self.settings.http_retries if retries is None else retries
+        timeout = timeout or self.settings.api_timeout
+        for attempt in range(retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+            self.stats["requests"] += 1
+            try:
+                # wait_for ограничивает весь запрос, а не отдельные чтения
+                response = await asyncio.wait_for(
+                    self.client.get(url, headers=headers, timeout=timeout), timeout
+                )
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                if attempt < retries:
+                    logger.warning(f"{source}: {e!r}, повтор {attempt + 1}/{retries}")
+                    continue
+                self.stats["failures"] += 1
+                breaker.record_failure()
+                raise
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                logger.warning(f"{source}: HTTP {response.status_code}, повтор {attempt + 1}/{retries}")
+                continue
+            if response.status_code >= 500 or response.status_code == 429:
+                self.stats["failures"] += 1
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+    def get_stats(self) -> dict:
+        return {
+            "connected": self.client is not None,
+            "http2": self.http2,
+            **self.stats,
+            "breakers": {name: b.get_status() for name, b in self.breakers.items()},
+        }
+
+
+# Global HTTP client instance
+http_client = HTTPClient()
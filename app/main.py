@@ -1,14 +1,22 @@
 import logging
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings
 from app.db.database import db
 from app.nats.client import nats_client
-from app.ws.manager import ws_manager
+from app.http.client import http_client
+from app.ws.manager import ws_manager, ENCODING_COMPACT, ENCODING_JSON, WS_ENCODINGS
+from app.ws.fanout import nats_fanout
+from app.services.rate_store import rate_store
+from app.services.store_sync import store_sync
 from app.tasks.background import background_manager
+from app.tasks.compaction import compaction_manager
+from app.tasks.leader import leader_elector
 from app.api.routes import router as api_router
+from app.metrics import metrics
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +25,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def start_background_tasks():
+    """Запуск фоновых задач (на лидере)."""
+    settings = get_settings()
+    await background_manager.start()
+    if settings.history_compaction_enabled:
+        await compaction_manager.start()
+
+
+async def stop_background_tasks():
+    """Остановка фоновых задач."""
+    await background_manager.stop()
+    await compaction_manager.stop()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifecycle."""
@@ -25,21 +47,47 @@ async def lifespan(app: FastAPI):
     settings = get_settings()
     
     await db.connect()
+    async with db.read_session() as session:
+        await rate_store.load(session)
+    await http_client.start()
+    
+    if settings.nats_enabled:
+        try:
+            await nats_client.connect()
+        except Exception as e:
+            logger.error(f"Не удалось подключиться к NATS: {e}")
     
     try:
-        await nats_client.connect()
+        # Кэш курсов этого процесса следит за записями других
+        await store_sync.start()
     except Exception as e:
-        logger.error(f"Не удалось подключиться к NATS: {e}")
+        logger.error(f"Не удалось подписаться на синхронизацию кэша в NATS: {e}")
     
-    await background_manager.start()
+    if settings.ws_fanout_mode == "nats":
+        # Без NATS переключается на локальную рассылку
+        await nats_fanout.start()
+    
+    if settings.run_background_tasks:
+        if settings.leader_election == "none":
+            await start_background_tasks()
+        else:
+            await leader_elector.start(
+                on_elected=start_background_tasks,
+                on_demoted=stop_background_tasks
+            )
     logger.info("Успешно приложение запущенно")
     
     yield
     
     # ВЫХОД ЙОУ
     logger.info("Выход из приложения...")
-    await background_manager.stop()
+    await leader_elector.stop()
+    await stop_background_tasks()
+    await nats_fanout.stop()
+    await store_sync.stop()
+    await ws_manager.close_all()
     await nats_client.disconnect()
+    await http_client.close()
     await db.disconnect()
     
     logger.info("Успешно приложение завершенно")
@@ -69,20 +117,47 @@ app.include_router(api_router)
 
 @app.websocket("/ws/currencies")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time currency updates."""
-    await ws_manager.connect(websocket)
+    """
+    WebSocket endpoint for real-time currency updates.
+
+    ?mode=batch - получать одно сообщение "batch" за цикл вместо события на валюту,
+    режим можно сменить сообщением {"action": "set_mode", "mode": "batch" | "single"}.
+    ?codes=BTC,USDEUR&types=cbr - подписка сразу при подключении (по умолчанию "*"),
+    дальше {"action": "subscribe" | "unsubscribe", "codes": [...], "types": [...]}.
+    Коды сверх WS_MAX_SUBSCRIPTIONS и неизвестные типы не подписываются - клиент
+    получает {"type": "error", "rejected": {"codes": [...], "types": [...]}}.
+    ?encoding=compact - обновления бинарными сообщениями (id, курсы, время по колонкам),
+    коды по id - в сообщении "codes" сразу после подключения; по умолчанию JSON.
+    Сжатие permessage-deflate согласуется uvicorn, если клиент его предлагает.
+    """
+    params = websocket.query_params
+    batch = params.get("mode") == "batch"
+    codes = [c for c in params.get("codes", "").split(",") if c]
+    types = [t for t in params.get("types", "").split(",") if t]
+    encoding = params.get("encoding", ENCODING_JSON)
+    if encoding not in WS_ENCODINGS:
+        encoding = ENCODING_JSON
+    await ws_manager.connect(websocket, batch=batch, codes=codes, types=types, encoding=encoding)
     
     try:
         # Отправка сообщения
         await ws_manager.send_personal(
             websocket,
-            {"type": "connected", "message": "Connected to currency updates"}
+            {
+                "type": "connected",
+                "message": "Connected to currency updates",
+                "mode": "batch" if batch else "single",
+                "encoding": encoding
+            }
         )
+        if encoding == ENCODING_COMPACT:
+            await ws_manager.send_personal(websocket, ws_manager.codes_message())
         
         # Пока сооединение активно все идет
         while True:
             data = await websocket.receive_text()
             logger.debug(f"Received from WebSocket client: {data}")
+            await ws_manager.handle_client_message(websocket, data)
             
     except WebSocketDisconnect:
         await ws_manager.disconnect(websocket)
@@ -102,6 +177,14 @@ async def root():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse, summary="Метрики Prometheus")
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Log startup."""
@@ -0,0 +1,169 @@
+"""
+Метрики в текстовом формате Prometheus (/metrics).
+
+Запись в горячем пути - это поиск корзины и пара сложений без блокировок
+(все в одном event loop); текст собирается только при запросе /metrics.
+Метрики, которые и так считаются в get_stats() (очереди, счетчики), не
+дублируются в горячем пути, а снимаются коллекторами в момент запроса.
+С metrics_enabled=False запись метрик ничего не делает.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from app.config import get_settings
+
+# Секунды: от долей миллисекунды (публикация в NATS) до десятков секунд (скачивание)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Штуки: события за цикл, глубина очереди клиента (снимается коллектором)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+# (имя, тип, описание, [(метки, значение)]) - то, что отдает коллектор
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гистограмма с метками; значения меток передаются позиционно."""
+
+    type = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str,
+                 labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики по корзинам (не накопительные)..., +Inf, сумма]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        if not self.registry.enabled:
+            return
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.label_names, labels, le)} {cumulative}")
+            text = _labels_text(self.label_names, labels)
+            lines.append(f"{self.name}_sum{text} {series[-1]!r}")
+            lines.append(f"{self.name}_count{text} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Счетчик с метками."""
+
+    type = "counter"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labels: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        if not self.registry.enabled:
+            return
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_labels_text(self.label_names, labels)} {_number(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class MetricsRegistry:
+    """Все метрики процесса и коллекторы, снимаемые при запросе."""
+
+    def __init__(self):
+        self.enabled = get_settings().metrics_enabled
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(self, name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(self, name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        """collector() вызывается при каждом запросе /metrics."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, m_type, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {m_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels_text(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
+
+# Обновление курсов
+provider_fetch_seconds = metrics.histogram(
+    "currency_provider_fetch_seconds", "Скачивание документа источника", ["provider"]
+)
+provider_parse_seconds = metrics.histogram(
+    "currency_provider_parse_seconds", "Разбор документа источника", ["provider"]
+)
+provider_cycles_total = metrics.counter(
+    "currency_provider_cycles_total", "Циклы источников по результату", ["provider", "result"]
+)
+db_write_seconds = metrics.histogram(
+    "currency_db_write_seconds", "Запись курсов и истории за цикл (с ожиданием в очереди писателя)", ["provider"]
+)
+cycle_events = metrics.histogram(
+    "currency_cycle_events", "Событий разослано за цикл источника", ["provider"], COUNT_BUCKETS
+)
+
+# Рассылка
+nats_publish_seconds = metrics.histogram(
+    "currency_nats_publish_seconds", "Публикация пачки сообщений в NATS с flush"
+)
+ws_broadcast_seconds = metrics.histogram(
+    "currency_ws_broadcast_seconds", "Раскладка сообщений по очередям веб-сокет клиентов"
+)
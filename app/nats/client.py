@@ -1,8 +1,10 @@
 import nats
-import json
 import logging
+import time
 from app.config import get_settings
-from typing import Callable, Optional
+from app.encoding import EncodedFrame, dumps
+from app.metrics import metrics, nats_publish_seconds
+from typing import Callable, Iterable, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
@@ -12,8 +14,17 @@ class NATSClient:
     
     def __init__(self):
         self.settings = get_settings()
-        self.nc: nats.NATS
+        self.nc: Optional[nats.NATS] = None
         self.subscriptions = {}
+        self.stats = {
+            "messages_published": 0,
+            "bytes_published": 0,
+            "batches_flushed": 0,
+            "last_batch_messages": 0,
+            "last_publish_ms": None,
+            "max_publish_ms": 0.0,
+            "last_pending_bytes": 0,
+        }
     
     async def connect(self):
         """Подключение к серверу NATS."""
@@ -30,18 +41,109 @@ class NATSClient:
             await self.nc.drain()
             logger.info("Отключились от NATS сервера")
     
-    async def publish(self, subject: str, message: dict):
-        """Опубликовать сообщение в определнный subject"""
+    async def subscribe(self, subject: str, handler: Callable):
+        """Подписаться на subject, handler(msg) - корутина."""
         if not self.nc:
-            logger.warning("NATS клиент не подключен к серверу, пропускаем публикацию")
+            raise RuntimeError("NATS клиент не подключен к серверу")
+        sub = await self.nc.subscribe(subject, cb=handler)
+        self.subscriptions[subject] = sub
+        logger.info(f"Подписались на NATS subject: {subject}")
+        return sub
+    
+    async def unsubscribe(self, subject: str):
+        """Отписаться от subject."""
+        sub = self.subscriptions.pop(subject, None)
+        if sub is not None:
+            await sub.unsubscribe()
+    
+    def currency_subject(self, c_type: str, code: str) -> str:
+        """
+        Subject события валюты: currency.updates.<type>.<code>.
+        
+        Подписчики фильтруют на стороне сервера: currency.updates.crypto.*,
+        currency.updates.*.BTC, currency.updates.> и т.д.
+        """
+        if not self.settings.nats_per_currency_subjects:
+            return self.settings.nats_subject
+        return f"{self.settings.nats_subject}.{c_type}.{code}"
+    
+    def batch_subject(self) -> str:
+        """Subject сообщений "batch" за цикл."""
+        if not self.settings.nats_per_currency_subjects:
+            return self.settings.nats_subject
+        return f"{self.settings.nats_subject}.batch"
+    
+    @staticmethod
+    def _payload(message: Union[dict, bytes, EncodedFrame]) -> bytes:
+        if isinstance(message, EncodedFrame):
+            return message.data
+        if isinstance(message, bytes):
+            return message
+        return dumps(message)
+    
+    async def publish(self, subject: str, message: Union[dict, bytes, EncodedFrame]):
+        """Опубликовать сообщение в определнный subject (dict или готовые байты)."""
+        await self.publish_batch([(subject, message)])
+    
+    async def publish_batch(
+        self,
+        messages: Iterable[Tuple[str, Union[dict, bytes, EncodedFrame]]]
+    ):
+        """
+        Опубликовать пачку сообщений и один раз сделать flush.
+        
+        nc.publish только складывает данные в буфер клиента, поэтому
+        пачка уходит на сервер одной записью в сокет, без ожидания на каждое.
+        """
+        if not self.nc:
+            if self.settings.nats_enabled:
+                logger.warning("NATS клиент не подключен к серверу, пропускаем публикацию")
             return
         
+        started = time.perf_counter()
+        count = 0
+        size = 0
         try:
-            payload = json.dumps(message, default=str).encode("utf-8")
-            await self.nc.publish(subject, payload)
+            for subject, message in messages:
+                payload = self._payload(message)
+                await self.nc.publish(subject, payload)
+                count += 1
+                size += len(payload)
+            self.stats["last_pending_bytes"] = self.nc.pending_data_size
+            await self.nc.flush(timeout=self.settings.nats_flush_timeout)
         except Exception as e:
-            logger.error(f"Ошибка публикации сообщений в NATS: {subject}: {e}")
+            logger.error(f"Ошибка публикации сообщений в NATS ({count} отправлено): {e}")
+        
+        elapsed = time.perf_counter() - started
+        nats_publish_seconds.observe(elapsed)
+        elapsed_ms = elapsed * 1000
+        self.stats["messages_published"] += count
+        self.stats["bytes_published"] += size
+        self.stats["batches_flushed"] += 1
+        self.stats["last_batch_messages"] = count
+        self.stats["last_publish_ms"] = round(elapsed_ms, 3)
+        self.stats["max_publish_ms"] = round(max(self.stats["max_publish_ms"], elapsed_ms), 3)
+    
+    def get_stats(self) -> dict:
+        """Метрики публикации."""
+        return {
+            "connected": bool(self.nc and self.nc.is_connected),
+            "pending_bytes": self.nc.pending_data_size if self.nc else 0,
+            **self.stats,
+        }
+    
+    def collect_metrics(self):
+        """Счетчики публикации для /metrics."""
+        yield ("currency_nats_connected", "gauge", "Подключен ли клиент к NATS",
+               [({}, int(bool(self.nc and self.nc.is_connected)))])
+        yield ("currency_nats_messages_published_total", "counter", "Опубликовано сообщений",
+               [({}, self.stats["messages_published"])])
+        yield ("currency_nats_bytes_published_total", "counter", "Опубликовано байт",
+               [({}, self.stats["bytes_published"])])
+        yield ("currency_nats_pending_bytes", "gauge", "Байт в буфере клиента, не отправленных на сервер",
+               [({}, self.nc.pending_data_size if self.nc else 0)])
 
 
 # Global NATS client
 nats_client = NATSClient()
+metrics.add_collector(nats_client.collect_metrics)
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.encoding import loads
+from app.metrics import provider_fetch_seconds, provider_parse_seconds
+
+logger = logging.getLogger(__name__)
+
+# (type, code, name, rate) - формат, который ждет CurrencyService
+RateRow = Tuple[str, str, str, float]
+
+# Документ не изменился с последней обработанной версии
+NOT_MODIFIED = object()
+
+
+class RateProvider(ABC):
+    """
+    Внешний источник курсов.
+
+    fetch скачивает документ, parse превращает его в код -> курс, row строит
+    строку для CurrencyService. Расписание (interval), таймаут и число
+    повторов (retries) у каждого источника свои; циклы одного источника не
+    пересекаются, поэтому за цикл у него ровно один запрос.
+    """
+
+    name: str = ""
+    currency_type: str = ""
+    # Потоковый источник: держит соединение сам (start/stop), а цикл источника
+    # забирает только изменившиеся курсы, без HTTP запроса
+    streaming: bool = False
+    default_interval: Optional[float] = None  # сек, если не задан в настройках
+
+    def __init__(
+        self,
+        settings,
+        interval: Optional[float] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None
+    ):
+        self.settings = settings
+        self.interval = interval or self.default_interval or settings.background_task_interval
+        self.timeout = timeout or settings.api_timeout
+        self.retries = retries
+        self.last_status = {
+            "status": "idle",
+            "updated_at": None,
+            "currencies_count": 0,
+            "duration_ms": None,
+            "interval": self.interval,
+            "not_modified": 0,
+        }
+        # Валидаторы последнего обработанного документа: ETag, Last-Modified, хэш
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._digest: Optional[bytes] = None
+        self._pending_validators: Optional[tuple] = None
+
+    async def start(self):
+        """Запуск фоновой работы источника (для потоковых)."""
+
+    async def stop(self):
+        """Остановка фоновой работы источника."""
+
+    @abstractmethod
+    async def fetch(self, client) -> Any:
+        """Скачать документ источника (бросает исключение при ошибке, NOT_MODIFIED - без изменений)."""
+
+    async def get_document(self, client, url: str) -> Any:
+        """
+        GET с условными заголовками (ETag/Last-Modified) и сравнением хэша тела.
+
+        Если сервер ответил 304 или тело совпало с последним обработанным,
+        возвращает NOT_MODIFIED - тогда не будет ни разбора, ни записи, ни событий.
+        Иначе - тело ответа как есть, JSON разбирается уже в get_rates (время разбора).
+        """
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+        response = await client.get(
+            url, self.name, retries=self.retries, timeout=self.timeout, headers=headers
+        )
+        if response.status_code == 304:
+            return NOT_MODIFIED
+        if response.status_code != 200:
+            raise RuntimeError(f"{self.name} API error: {response.status_code}")
+
+        digest = hashlib.blake2b(response.content, digest_size=16).digest()
+        self._pending_validators = (
+            response.headers.get("etag"), response.headers.get("last-modified"), digest
+        )
+        if digest == self._digest:
+            # Тело то же, но валидаторы могли смениться - запоминаем новые
+            self.mark_processed()
+            return NOT_MODIFIED
+        return response.content
+
+    def mark_processed(self):
+        """Документ записан - следующие запросы сравниваем с ним."""
+        if self._pending_validators is not None:
+            self._etag, self._last_modified, self._digest = self._pending_validators
+            self._pending_validators = None
+
+    def invalidate(self):
+        """Забыть валидаторы: следующий документ обработается полностью."""
+        self._etag = self._last_modified = self._digest = None
+        self._pending_validators = None
+
+    @abstractmethod
+    def parse(self, document: Any) -> Dict[str, float]:
+        """Разобрать документ в код источника -> курс."""
+
+    @abstractmethod
+    def row(self, code: str, rate: float) -> RateRow:
+        """Строка для БД по коду источника."""
+
+    @property
+    def default_codes(self) -> List[str]:
+        """Стоковые коды источника из настроек."""
+        return []
+
+    def rows(self, rates: Dict[str, float], codes: Iterable[str] | None = None) -> List[RateRow]:
+        """Строки для БД: все курсы или только перечисленные коды."""
+        codes = rates.keys() if codes is None else codes
+        return [self.row(code, rates[code]) for code in codes if code in rates]
+
+    async def get_rates(self, client) -> Optional[Dict[str, float]]:
+        """
+        Скачать и разобрать документ.
+
+        None - документ не изменился; ошибки пробрасываются.
+        """
+        started = time.perf_counter()
+        document = await self.fetch(client)
+        fetched = time.perf_counter()
+        provider_fetch_seconds.observe(fetched - started, self.name)
+        if document is NOT_MODIFIED:
+            return None
+        if isinstance(document, bytes):
+            document = loads(document)
+        rates = self.parse(document)
+        provider_parse_seconds.observe(time.perf_counter() - fetched, self.name)
+        return rates
+
+    def get_status(self) -> dict:
+        return self.last_status
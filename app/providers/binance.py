@@ -0,0 +1,29 @@
+from typing import Any, Dict, List
+from app.providers.base import RateProvider, RateRow
+
+
+class BinanceProvider(RateProvider):
+    """Крипто курсы с Binance (только USDT пары)."""
+
+    name = "binance"
+    currency_type = "crypto"
+
+    async def fetch(self, client) -> Any:
+        url = f"{self.settings.binance_api_url}/api/v3/ticker/price"
+        return await self.get_document(client, url)
+
+    def parse(self, document: Any) -> Dict[str, float]:
+        results = {}
+        for item in document:
+            symbol = item["symbol"]
+            if symbol.endswith("USDT"):
+                # Извлекаем код криптовалюты (убираем USDT)
+                results[symbol[:-4]] = float(item["price"])
+        return results
+
+    def row(self, code: str, rate: float) -> RateRow:
+        return ("crypto", code, f"Crypto {code}/USDT", rate)
+
+    @property
+    def default_codes(self) -> List[str]:
+        return self.settings.default_crypto_currencies
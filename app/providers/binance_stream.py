@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Any, Dict
+import websockets
+from app.encoding import loads
+from app.providers.binance import BinanceProvider
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_MAX_DELAY = 30.0  # сек
+
+
+class BinanceStreamProvider(BinanceProvider):
+    """
+    Крипто курсы из WebSocket потока Binance (miniTicker).
+
+    Соединение держится постоянно, последняя цена по символу лежит в памяти,
+    а цикл источника раз в interval забирает изменившиеся цены одной пачкой.
+    Пачка считается записанной только после mark_processed: если запись
+    упала, ее цены уйдут со следующей пачкой.
+    """
+
+    name = "binance_stream"
+    streaming = True
+    default_interval = 0.5
+
+    def __init__(self, settings, **kwargs):
+        super().__init__(settings, **kwargs)
+        self.latest: Dict[str, float] = {}  # код -> последняя цена
+        self._changed: Dict[str, float] = {}  # изменилось с прошлой пачки
+        self._in_flight: Dict[str, float] = {}  # отдано в цикл, еще не записано
+        self._task = None
+        self.last_status.update(connected=False, messages=0, reconnects=0)
+
+    @property
+    def url(self) -> str:
+        """Все тикеры (!miniTicker@arr) или только перечисленные символы к USDT."""
+        base = self.settings.binance_ws_url.rstrip("/")
+        symbols = self.settings.binance_ws_symbols
+        if not symbols:
+            return f"{base}/ws/!miniTicker@arr"
+        streams = "/".join(f"{symbol.lower()}usdt@miniTicker" for symbol in symbols)
+        return f"{base}/stream?streams={streams}"
+
+    async def start(self):
+        if self._task: return
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._task: self._task.cancel()
+        self._task = None
+
+    async def _consume(self):
+        """Читаем поток, при обрыве переподключаемся с растущей паузой."""
+        delay = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.url, open_timeout=self.timeout, max_size=None) as ws:
+                    logger.info(f"Подключено к потоку Binance: {self.url}")
+                    self.last_status["connected"] = True
+                    delay = 1.0
+                    async for message in ws:
+                        self.last_status["messages"] += 1
+                        self.apply(loads(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Поток Binance оборвался: {e!r}, переподключение через {delay:.0f} с")
+            finally:
+                self.last_status["connected"] = False
+            self.last_status["reconnects"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def apply(self, document: Any):
+        """Обновить последние цены из сообщения потока."""
+        if isinstance(document, dict):
+            # Комбинированный поток оборачивает тикер в {"stream": ..., "data": ...}
+            document = document.get("data", document)
+        tickers = document if isinstance(document, list) else [document]
+        for ticker in tickers:
+            symbol = ticker.get("s", "")
+            if not symbol.endswith("USDT"):
+                continue
+            code = symbol[:-4]
+            price = float(ticker["c"])
+            if self.latest.get(code) != price:
+                self.latest[code] = price
+                self._changed[code] = price
+
+    async def fetch(self, client) -> Any:
+        """Забрать изменившиеся с прошлой записанной пачки цены (новые поверх незаписанных)."""
+        self._in_flight = {**self._in_flight, **self._changed}
+        self._changed = {}
+        return dict(self._in_flight)
+
+    def mark_processed(self):
+        """Пачка записана."""
+        super().mark_processed()
+        self._in_flight = {}
+
+    def parse(self, document: Any) -> Dict[str, float]:
+        return document
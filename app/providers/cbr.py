@@ -0,0 +1,26 @@
+from typing import Any, Dict, List
+from app.providers.base import RateProvider, RateRow
+
+
+class CBRProvider(RateProvider):
+    """Курсы ЦБ РФ (к RUB за 1 единицу)."""
+
+    name = "cbr"
+    currency_type = "cbr"
+
+    async def fetch(self, client) -> Any:
+        return await self.get_document(client, self.settings.cbr_api_url)
+
+    def parse(self, document: Any) -> Dict[str, float]:
+        valute = document.get("Valute", {})
+        return {
+            code: item["Value"] / item["Nominal"]
+            for code, item in valute.items()
+        }
+
+    def row(self, code: str, rate: float) -> RateRow:
+        return ("cbr", f"{code}RUB", f"CBR {code}/RUB", rate)
+
+    @property
+    def default_codes(self) -> List[str]:
+        return self.settings.default_cbr_currencies
@@ -0,0 +1,27 @@
+from typing import Any, Dict, List
+from app.providers.base import RateProvider, RateRow
+
+
+class FiatProvider(RateProvider):
+    """Фиатные курсы к base_currency (exchangerate-api)."""
+
+    name = "fiat"
+    currency_type = "fiat"
+
+    async def fetch(self, client) -> Any:
+        url = f"{self.settings.exchangerate_api_url}/{self.settings.base_currency}"
+        return await self.get_document(client, url)
+
+    def parse(self, document: Any) -> Dict[str, float]:
+        rates = dict(document.get("rates", {}))
+        # Курс базовой валюты к самой себе не храним
+        rates.pop(self.settings.base_currency, None)
+        return rates
+
+    def row(self, code: str, rate: float) -> RateRow:
+        base = self.settings.base_currency
+        return ("fiat", f"{base}{code}", f"Fiat {base}/{code}", rate)
+
+    @property
+    def default_codes(self) -> List[str]:
+        return self.settings.default_fiat_currencies
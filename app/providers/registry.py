@@ -0,0 +1,30 @@
+from typing import List
+from app.providers.base import RateProvider
+from app.providers.fiat import FiatProvider
+from app.providers.binance import BinanceProvider
+from app.providers.binance_stream import BinanceStreamProvider
+from app.providers.cbr import CBRProvider
+
+# Имя источника -> класс (имена используются в PROVIDERS_ENABLED и PROVIDER_*)
+PROVIDER_CLASSES = {
+    FiatProvider.name: FiatProvider,
+    BinanceProvider.name: BinanceProvider,
+    BinanceStreamProvider.name: BinanceStreamProvider,
+    CBRProvider.name: CBRProvider,
+}
+
+
+def create_providers(settings) -> List[RateProvider]:
+    """Источники из настроек со своими расписаниями и таймаутами."""
+    providers = []
+    for name in settings.providers_enabled:
+        if name not in PROVIDER_CLASSES:
+            raise ValueError(f"Unknown provider: {name}")
+        providers.append(PROVIDER_CLASSES[name](
+            settings,
+            interval=settings.provider_intervals.get(name),
+            timeout=settings.provider_timeouts.get(name),
+            retries=settings.provider_retries.get(name)
+        ))
+    return providers
+
@@ -0,0 +1,83 @@
+"""
+Локальная замена потока Binance (!miniTicker@arr) для разработки и тестов.
+
+    python -m app.providers.replay --port 9001
+    python -m app.providers.replay --port 9001 --file recorded.jsonl
+
+Без файла раз в --interval секунд рассылает тикеры --symbols символов со
+случайным блужданием цен; с файлом - проигрывает записанные сообщения
+(по одному JSON на строку) по кругу. Приложение подключается через
+BINANCE_WS_URL=ws://127.0.0.1:9001 и PROVIDERS_ENABLED='["binance_stream"]'.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+
+def generated_frames(symbols: int, seed: int = 0):
+    """Бесконечные сообщения !miniTicker@arr со случайным блужданием цен."""
+    rnd = random.Random(seed)
+    prices = {f"C{i}USDT": float(i + 1) for i in range(symbols)}
+    prices["BTCUSDT"] = 50000.0
+    prices["ETHUSDT"] = 3000.0
+    while True:
+        # Как и Binance, шлем только тикеры, изменившиеся за интервал
+        moved = rnd.sample(sorted(prices), max(1, len(prices) // 2))
+        now = int(time.time() * 1000)
+        tickers = []
+        for symbol in moved:
+            prices[symbol] = round(prices[symbol] * (1 + rnd.uniform(-0.001, 0.001)), 8)
+            tickers.append({"e": "24hrMiniTicker", "E": now, "s": symbol, "c": str(prices[symbol])})
+        yield json.dumps(tickers)
+
+
+def recorded_frames(path: str):
+    """Записанные сообщения из файла по кругу."""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return itertools.cycle(lines)
+
+
+async def serve(host: str, port: int, interval: float, frames_factory):
+    async def handler(websocket):
+        logger.info(f"Клиент подключен: {websocket.path}")
+        try:
+            for frame in frames_factory():
+                await websocket.send(frame)
+                await asyncio.sleep(interval)
+        except websockets.ConnectionClosed:
+            logger.info("Клиент отключен")
+
+    async with websockets.serve(handler, host, port):
+        logger.info(f"Поток тикеров на ws://{host}:{port}")
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный поток тикеров в формате Binance")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--interval", type=float, default=1.0, help="сек между сообщениями")
+    parser.add_argument("--symbols", type=int, default=500, help="символов без --file")
+    parser.add_argument("--file", help="JSONL с записанными сообщениями")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.file:
+        factory = lambda: recorded_frames(args.file)
+    else:
+        factory = lambda: generated_frames(args.symbols)
+    asyncio.run(serve(args.host, args.port, args.interval, factory))
+
+
+if __name__ == "__main__":
+    main()
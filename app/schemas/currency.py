@@ -27,15 +27,82 @@ class CurrencyResponse(CurrencyBase):
 class CurrencyListResponse(BaseModel):
     total: int
     currencies: list[CurrencyResponse]
+    next_after: Optional[int] = None  # курсор следующей страницы (after=...), None - последняя
 
 class PriceChangeEvent(BaseModel):
     type: str
     currency: CurrencyResponse
     change_percent: Optional[float] = None
 
+class OHLCBar(BaseModel):
+    """Свеча за интервал."""
+    time: datetime  # начало интервала (UTC)
+    open: float
+    high: float
+    low: float
+    close: float
+    count: int  # точек в свече
+
+class HistoryResponse(BaseModel):
+    code: str
+    interval: str
+    start: datetime
+    end: datetime
+    bars: list[OHLCBar]
+
+class ConversionResponse(BaseModel):
+    """Конвертация суммы по кросс-курсу."""
+    from_currency: str
+    to_currency: str
+    amount: float
+    rate: float  # сколько to_currency за 1 from_currency
+    result: float
+
+class RateMatrixResponse(BaseModel):
+    """Матрица кросс-курсов: rates[i][j] - сколько codes[j] за 1 codes[i]."""
+    codes: list[str]
+    rates: list[list[float]]
+
+class ProviderStatus(BaseModel):
+    """Status of one rate provider loop."""
+    status: str  # "running", "success", "failed", "idle"
+    message: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    interval: float  # сек между циклами источника
+    currencies_count: int = 0
+    duration_ms: Optional[float] = None
+    skipped_unchanged: int = 0
+    suppressed_events: int = 0
+    not_modified: int = 0  # циклов без изменений документа
+    connected: Optional[bool] = None  # потоковый источник: есть ли соединение
+    messages: Optional[int] = None  # потоковый источник: получено сообщений
+    reconnects: Optional[int] = None
+
 class BackgroundTaskStatus(BaseModel):
     """Status of background task."""
     status: str  # "running", "success", "failed", "idle"
     message: str
     updated_at: datetime
-    currencies_count: int = 0
\ No newline at end of file
+    currencies_count: int = 0
+    duration_ms: Optional[float] = None  # длительность последнего цикла
+    skipped_unchanged: int = 0  # курсы без изменений, не писались в БД
+    suppressed_events: int = 0  # изменения ниже порога, не рассылались
+    node_id: Optional[str] = None  # этот узел
+    leader: Optional[str] = None  # узел, который сейчас обновляет курсы
+    providers: dict[str, ProviderStatus] = {}  # статус по источникам
+
+class CompactionStatus(BaseModel):
+    """Status of history compaction task."""
+    status: str  # "running", "success", "failed", "idle"
+    message: str
+    updated_at: datetime
+    rows_compacted: int = 0
+    rows_deleted: int = 0
+    duration_ms: Optional[float] = None
+
+class StoreSyncMessage(BaseModel):
+    """Изменения кэша курсов для других воркеров/реплик (subject nats_sync_subject)."""
+    origin: str  # узел-отправитель, свои сообщения не применяются
+    upserted: list[CurrencyResponse] = []
+    removed: list[str] = []
+    invalidate: bool = False  # источники должны переписать курсы в следующем цикле
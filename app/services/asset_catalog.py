@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+from app.encoding import dumps
+from app.http.client import http_client
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("fiat", "crypto", "cbr")
+ERROR_TTL = 60  # сек, сколько свежим считается каталог, собранный с ошибками
+
+
+class AssetCatalog:
+    """
+    Кэш каталога активов источников для /provider/assets.
+
+    Ответ собирается и сериализуется один раз за обновление и отдается с ETag.
+    Свежим считается assets_cache_ttl секунд, дальше до assets_stale_ttl
+    отдается старый с обновлением в фоне. Одновременные промахи ждут
+    одно общее обновление, поэтому в источники уходит не больше одного
+    набора запросов за раз.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._assets: Dict[str, List[dict]] = {}  # последний удачный список по источнику
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._fetched_at: Optional[float] = None
+        self._fresh_for = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "stale_hits": 0, "refreshes": 0}
+
+    def age(self) -> Optional[float]:
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def fresh_for(self) -> float:
+        """Сколько секунд каталог еще свежий."""
+        age = self.age()
+        return 0.0 if age is None else max(0.0, self._fresh_for - age)
+
+    async def get(self) -> Tuple[bytes, str]:
+        """Готовый JSON каталога и его ETag."""
+        age = self.age()
+        if age is not None and age < self._fresh_for:
+            self.stats["hits"] += 1
+            return self._body, self._etag
+        if age is not None and age < self.settings.assets_stale_ttl:
+            # Отдаем старый, обновляем в фоне
+            self.stats["stale_hits"] += 1
+            self._start_refresh()
+            return self._body, self._etag
+        # Каталога нет или он слишком старый - ждем общее обновление;
+        # shield - отключившийся клиент не отменяет его для остальных
+        await asyncio.shield(self._start_refresh())
+        return self._body, self._etag
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self._refresh_task
+
+    async def refresh(self):
+        """Скачать каталоги всех источников параллельно и пересобрать ответ."""
+        self.stats["refreshes"] += 1
+        results = await asyncio.gather(
+            self._fetch_fiat(), self._fetch_crypto(), self._fetch_cbr(),
+            return_exceptions=True
+        )
+
+        errors = {}
+        for source, result in zip(SOURCES, results):
+            if isinstance(result, BaseException):
+                # Оставляем последний удачный список источника
+                logger.error(f"Ошибка загрузки каталога {source}: {result!r}")
+                errors[f"{source}_error"] = str(result)
+            else:
+                self._assets[source] = result
+
+        available_assets = {source: self._assets.get(source, []) for source in SOURCES}
+        available_assets.update(errors)
+        self._body = dumps({
+            "total_fiat": len(available_assets["fiat"]),
+            "total_crypto": len(available_assets["crypto"]),
+            "total_cbr": len(available_assets["cbr"]),
+            "assets": available_assets
+        })
+        self._etag = f'"{hashlib.blake2b(self._body, digest_size=16).hexdigest()}"'
+        self._fetched_at = time.monotonic()
+        self._fresh_for = self.settings.assets_cache_ttl
+        if errors:
+            self._fresh_for = min(self._fresh_for, ERROR_TTL)
+
+    async def _get_json(self, url: str, source: str):
+        resp = await http_client.get(url, source)
+        if resp.status_code != 200:
+            raise RuntimeError(f"{source} API error: {resp.status_code}")
+        return resp.json()
+
+    async def _fetch_fiat(self) -> List[dict]:
+        """Фиат (Supported Codes)."""
+        url = f"{self.settings.exchangerate_api_url}/{self.settings.base_currency}"
+        data = await self._get_json(url, "fiat")
+        return [
+            {"code": k, "name": f"Fiat {k}"} for k in data.get("rates", {}).keys()
+        ]
+
+    async def _fetch_crypto(self) -> List[dict]:
+        """Крипта с Binance (Exchange Info), только торгуемые USDT пары."""
+        url = f"{self.settings.binance_api_url}/api/v3/exchangeInfo"
+        data = await self._get_json(url, "binance")
+        crypto_list = []
+        for s in data.get("symbols", []):
+            if s["status"] == "TRADING" and s["quoteAsset"] == "USDT":
+                crypto_list.append({
+                    "code": s["baseAsset"], # BTC
+                    "symbol": s["symbol"],  # BTCUSDT
+                    "name": f"{s['baseAsset']}/USDT"
+                })
+        return sorted(crypto_list, key=lambda x: x["code"])
+
+    async def _fetch_cbr(self) -> List[dict]:
+        """Список валют ЦБ."""
+        data = await self._get_json(self.settings.cbr_api_url, "cbr")
+        return [
+            {
+                "code": f"{v['CharCode']}RUB",
+                "name": f"CBR {v['Name']} (RUB)",
+                "nominal": v['Nominal']
+            }
+            for v in data.get("Valute", {}).values()
+        ]
+
+    def get_stats(self) -> dict:
+        age = self.age()
+        return {**self.stats, "age": None if age is None else round(age, 1)}
+
+
+# Global asset catalog
+asset_catalog = AssetCatalog()
@@ -0,0 +1,215 @@
+import heapq
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from app.config import get_settings
+from app.services.rate_store import rate_store
+
+logger = logging.getLogger(__name__)
+
+# Стоимость ребра по типу источника: при нескольких путях до актива берется
+# самый дешевый (прямой фиатный курс к базовой валюте важнее курса ЦБ через RUB)
+EDGE_COSTS = {"fiat": 1, "peg": 1, "crypto": 1, "cbr": 3}
+
+# (base, quote, rate, type): 1 base = rate quote
+Edge = Tuple[str, str, float, str]
+
+
+def split_pair(c_type: str, code: str) -> Optional[Tuple[str, str]]:
+    """Пара (base, quote) по коду валюты из БД."""
+    if c_type == "crypto":
+        return code, "USDT"
+    if len(code) == 6:
+        # USDEUR (fiat), USDRUB (cbr), в т.ч. созданные вручную
+        return code[:3], code[3:]
+    return None
+
+
+class ConversionEngine:
+    """
+    Кросс-курсы между любыми активами (фиат, крипта, ЦБ).
+
+    Курсы из кэша курсов - ребра графа активов. От базовой валюты строится
+    дерево кратчайших путей (см. EDGE_COSTS), и для каждого актива хранится
+    его стоимость в базовой валюте в массиве NumPy. Курс from -> to - это
+    value[from] / value[to], а матрица курсов для набора активов - внешнее
+    произведение value и 1 / value, поэтому она всегда согласована.
+
+    При изменении курсов пересчитываются только поддеревья изменившихся
+    ребер; полная перестройка - только если появились/пропали ребра.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.pivot = self.settings.base_currency
+        self._index: Dict[str, int] = {}  # актив -> позиция в _values
+        self._values = np.empty(0)  # стоимость актива в pivot (nan - нет пути)
+        self._edges: Dict[str, Edge] = {}  # код валюты из БД -> ребро
+        self._tree: Dict[str, Tuple[str, str]] = {}  # актив -> (родитель, код ребра)
+        self._children: Dict[str, List[str]] = {}
+        self._dirty: Set[str] = set()
+        self._rebuild = True
+        self.stats = {"rebuilds": 0, "incremental_updates": 0}
+        rate_store.add_listener(self._on_rates_changed)
+
+    def _on_rates_changed(self, codes: Optional[List[str]]):
+        """Кэш курсов изменился (None - целиком)."""
+        if codes is None:
+            self._rebuild = True
+        else:
+            self._dirty.update(codes)
+
+    def _sync(self):
+        """Применить накопленные изменения кэша курсов перед запросом."""
+        if self._rebuild:
+            self._full_rebuild()
+            return
+        if not self._dirty:
+            return
+        codes, self._dirty = self._dirty, set()
+        changed = []
+        for code in codes:
+            edge = self._edge_for(code)
+            old = self._edges.get(code)
+            if edge is None and old is None:
+                continue
+            if edge is None or old is None or edge[:2] != old[:2] or edge[3] != old[3]:
+                # Поменялась структура графа
+                self._full_rebuild()
+                return
+            self._edges[code] = edge
+            changed.append(code)
+        self._recompute(changed)
+
+    def _edge_for(self, code: str) -> Optional[Edge]:
+        currency = rate_store.get(code)
+        if currency is None or not currency.rate or currency.rate <= 0:
+            return None
+        pair = split_pair(currency.type, currency.code)
+        if pair is None or pair[0] == pair[1]:
+            return None
+        return pair[0], pair[1], currency.rate, currency.type
+
+    def _full_rebuild(self):
+        """Собрать граф и дерево путей от базовой валюты заново."""
+        self._rebuild = False
+        self._dirty.clear()
+        self._edges = {}
+        for currency in rate_store.all():
+            edge = self._edge_for(currency.code)
+            if edge is not None:
+                self._edges[currency.code] = edge
+
+        adjacency: Dict[str, List[Tuple[str, str, int]]] = {}
+        for code, (base, quote, _, c_type) in self._edges.items():
+            cost = EDGE_COSTS.get(c_type, EDGE_COSTS["cbr"])
+            adjacency.setdefault(base, []).append((quote, code, cost))
+            adjacency.setdefault(quote, []).append((base, code, cost))
+        for asset, target in self.settings.convert_pegs.items():
+            adjacency.setdefault(asset, []).append((target, f"peg:{asset}", EDGE_COSTS["peg"]))
+            adjacency.setdefault(target, []).append((asset, f"peg:{asset}", EDGE_COSTS["peg"]))
+
+        assets = sorted(set(adjacency) | {self.pivot})
+        self._index = {asset: i for i, asset in enumerate(assets)}
+        self._values = np.full(len(assets), np.nan)
+        self._tree = {}
+        self._children = {}
+
+        # Дейкстра от базовой валюты: дерево самых дешевых путей
+        self._values[self._index[self.pivot]] = 1.0
+        best = {self.pivot: 0}
+        heap = [(0, self.pivot)]
+        while heap:
+            cost, asset = heapq.heappop(heap)
+            if cost > best[asset]:
+                continue
+            for neighbour, code, edge_cost in adjacency.get(asset, []):
+                new_cost = cost + edge_cost
+                if new_cost < best.get(neighbour, new_cost + 1):
+                    best[neighbour] = new_cost
+                    self._tree[neighbour] = (asset, code)
+                    heapq.heappush(heap, (new_cost, neighbour))
+        for asset, (parent, _) in self._tree.items():
+            self._children.setdefault(parent, []).append(asset)
+        self._fill(self.pivot)
+        self.stats["rebuilds"] += 1
+
+    def _factor(self, parent: str, child: str, code: str) -> float:
+        """value[child] = value[parent] * factor."""
+        if code.startswith("peg:"):
+            return 1.0
+        base, quote, rate, _ = self._edges[code]
+        return rate if child == base else 1.0 / rate
+
+    def _fill(self, root: str):
+        """Пересчитать стоимости всех потомков root."""
+        stack = [root]
+        values, index = self._values, self._index
+        while stack:
+            parent = stack.pop()
+            parent_value = values[index[parent]]
+            for child in self._children.get(parent, ()):
+                code = self._tree[child][1]
+                values[index[child]] = parent_value * self._factor(parent, child, code)
+                stack.append(child)
+
+    def _recompute(self, codes: Iterable[str]):
+        """Пересчитать поддеревья под изменившимися ребрами дерева."""
+        roots = set()
+        for code in codes:
+            base, quote, _, _ = self._edges[code]
+            for child, parent in ((base, quote), (quote, base)):
+                if self._tree.get(child) == (parent, code):
+                    roots.add(parent)
+        for root in roots:
+            self._fill(root)
+        if roots:
+            self.stats["incremental_updates"] += 1
+
+    def _value(self, asset: str) -> float:
+        i = self._index.get(asset.upper())
+        if i is None:
+            raise KeyError(asset)
+        value = self._values[i]
+        if np.isnan(value):
+            raise KeyError(asset)
+        return value
+
+    def rate(self, from_asset: str, to_asset: str) -> float:
+        """Сколько to_asset за 1 from_asset (KeyError - актив неизвестен или недостижим)."""
+        self._sync()
+        return float(self._value(from_asset) / self._value(to_asset))
+
+    def convert(self, from_asset: str, to_asset: str, amount: float) -> Tuple[float, float]:
+        """(курс, сумма в to_asset)."""
+        rate = self.rate(from_asset, to_asset)
+        return rate, amount * rate
+
+    def matrix(self, assets: List[str]) -> np.ndarray:
+        """Матрица курсов: [i][j] - сколько assets[j] за 1 assets[i]."""
+        self._sync()
+        values = np.array([self._value(asset) for asset in assets])
+        return np.outer(values, 1.0 / values)
+
+    def unknown(self, assets: Iterable[str]) -> List[str]:
+        """Активы, для которых нет курса."""
+        self._sync()
+        missing = []
+        for asset in assets:
+            try:
+                self._value(asset)
+            except KeyError:
+                missing.append(asset)
+        return missing
+
+    def assets(self) -> List[str]:
+        """Все активы, для которых есть курс."""
+        self._sync()
+        return [a for a, i in self._index.items() if not np.isnan(self._values[i])]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "assets": int(np.count_nonzero(~np.isnan(self._values)))}
+
+
+# Global conversion engine
+conversion_engine = ConversionEngine()
@@ -1,11 +1,17 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.db.models import Currency
 from app.schemas.currency import CurrencyCreate, CurrencyUpdate, CurrencyResponse
+from datetime import datetime
+from typing import Iterable, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Сколько строк отправляем в одном INSERT (лимит переменных SQLite)
+BULK_CHUNK_SIZE = 500
+
 
 class CurrencyService:
     """Основная БД логика для курсов валют."""
@@ -16,6 +22,41 @@ class CurrencyService:
         result = await session.execute(select(Currency))
         return result.scalars().all()
 
+    @staticmethod
+    async def list_currencies(
+        session: AsyncSession,
+        c_type: str | None = None,
+        codes: Iterable[str] | None = None,
+        prefix: str | None = None,
+        updated_since: datetime | None = None,
+        after: int | None = None,
+        limit: int | None = None
+    ) -> list[Currency]:
+        """
+        Валюты по фильтрам в порядке ID, страница после ID after (keyset).
+
+        Каждый фильтр идет по своему индексу: type, code (IN и диапазон для
+        префикса), updated_at; страница - по первичному ключу, без OFFSET.
+        """
+        stmt = select(Currency)
+        if c_type is not None:
+            stmt = stmt.where(Currency.type == c_type)
+        if codes is not None:
+            stmt = stmt.where(Currency.code.in_(list(codes)))
+        if prefix:
+            # Диапазон вместо LIKE, чтобы работал индекс по code
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            stmt = stmt.where(Currency.code >= prefix, Currency.code < upper)
+        if updated_since is not None:
+            stmt = stmt.where(Currency.updated_at >= updated_since)
+        if after is not None:
+            stmt = stmt.where(Currency.id > after)
+        stmt = stmt.order_by(Currency.id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = await session.execute(stmt)
+        return result.scalars().all()
+
     @staticmethod
     async def get_currency_by_id(session: AsyncSession, currency_id: int) -> Currency | None:
         """Получить валюту по числовому ID."""
@@ -32,19 +73,43 @@ class CurrencyService:
         )
         return result.scalar_one_or_none()
     
+    @staticmethod
+    async def get_stored_rates(
+        session: AsyncSession,
+        codes: Iterable[str] | None = None
+    ) -> dict[str, tuple[float, str]]:
+        """Текущие курсы и названия из БД (code -> (rate, name)) без загрузки ORM объектов."""
+        stmt = select(Currency.code, Currency.rate, Currency.name)
+        if codes is None:
+            result = await session.execute(stmt)
+            return {code: (rate, name) for code, rate, name in result.all()}
+
+        codes = list(codes)
+        stored = {}
+        for i in range(0, len(codes), BULK_CHUNK_SIZE):
+            result = await session.execute(
+                stmt.where(Currency.code.in_(codes[i:i + BULK_CHUNK_SIZE]))
+            )
+            stored.update({code: (rate, name) for code, rate, name in result.all()})
+        return stored
+    
     @staticmethod
     async def create_currency(
         session: AsyncSession,
-        currency: CurrencyCreate
+        currency: CurrencyCreate,
+        commit: bool = True
     ) -> Currency:
-        """Создать валюту."""
+        """Создать валюту (commit=False - транзакцию завершает DBWriter)."""
         db_currency = Currency(
             code=currency.code,
             name=currency.name,
             rate=currency.rate
         )
         session.add(db_currency)
-        await session.commit()
+        if commit:
+            await session.commit()
+        else:
+            await session.flush()
         await session.refresh(db_currency)
         logger.info(f"Валюта создана: {currency.code}")
         return db_currency
@@ -53,9 +118,10 @@ class CurrencyService:
     async def update_currency(
         session: AsyncSession,
         currency_id: int,
-        currency_update: CurrencyUpdate
+        currency_update: CurrencyUpdate,
+        commit: bool = True
     ) -> Currency | None:
-        """Обновить валюту."""
+        """Обновить валюту (commit=False - транзакцию завершает DBWriter)."""
         result = await session.execute(
             select(Currency).where(Currency.id == currency_id)
         )
@@ -71,7 +137,10 @@ class CurrencyService:
         if currency_update.name is not None:
             db_currency.name = currency_update.name
         
-        await session.commit()
+        if commit:
+            await session.commit()
+        else:
+            await session.flush()
         await session.refresh(db_currency)
         logger.info(f"Валюта обновлена: {db_currency.code}")
         return db_currency
@@ -104,12 +173,85 @@ class CurrencyService:
             await session.refresh(db_currency)
             return db_currency, True
 
+    @staticmethod
+    async def bulk_upsert_currencies(
+        session: AsyncSession,
+        rates: Iterable[Tuple[str, str, str, float]],
+        commit: bool = True
+    ) -> list[tuple[Currency, bool]]:
+        """
+        Массовое обновление/создание валют одной транзакцией.
+
+        Принимает кортежи (type, code, name, rate) как их отдают фетчеры.
+        Для существующих кодов previous_rate сдвигается на текущий rate, а тип
+        берется переданный: код пишет один источник, и созданная вручную
+        валюта получает тип этого источника. Возвращает (валюта, создана ли).
+        commit=False - транзакцию завершает вызывающий (DBWriter).
+        """
+        rows_by_code = {}
+        for c_type, code, name, rate in rates:
+            rows_by_code[code] = (c_type, name, rate)
+        if not rows_by_code:
+            return []
+
+        codes = list(rows_by_code)
+        existing_codes = set()
+        for i in range(0, len(codes), BULK_CHUNK_SIZE):
+            result = await session.execute(
+                select(Currency.code).where(Currency.code.in_(codes[i:i + BULK_CHUNK_SIZE]))
+            )
+            existing_codes.update(result.scalars().all())
+
+        now = datetime.utcnow()
+        results: list[tuple[Currency, bool]] = []
+        try:
+            for i in range(0, len(codes), BULK_CHUNK_SIZE):
+                chunk = codes[i:i + BULK_CHUNK_SIZE]
+                stmt = sqlite_insert(Currency).values([
+                    {
+                        "code": code,
+                        "name": rows_by_code[code][1],
+                        "rate": rows_by_code[code][2],
+                        "type": rows_by_code[code][0],
+                        "updated_at": now,
+                        "created_at": now,
+                    }
+                    for code in chunk
+                ])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Currency.code],
+                    set_={
+                        "previous_rate": Currency.rate,
+                        "rate": stmt.excluded.rate,
+                        "name": stmt.excluded.name,
+                        "type": stmt.excluded.type,
+                        "updated_at": now,
+                    },
+                ).returning(Currency)
+
+                result = await session.execute(
+                    stmt, execution_options={"populate_existing": True}
+                )
+                for currency in result.scalars().all():
+                    results.append((currency, currency.code not in existing_codes))
+
+            if commit:
+                await session.commit()
+        except Exception:
+            if commit:
+                await session.rollback()
+            raise
+
+        logger.info(f"Массово обновлено валют: {len(results)}")
+        return results
+
     @staticmethod
     async def delete_currency(
         session: AsyncSession,
-        currency_id: int
+        currency_id: int,
+        commit: bool = True
     ) -> bool:
-        """Удалить валюту."""
+        """Удалить валюту (commit=False - транзакцию завершает DBWriter)."""
         result = await session.execute(
             select(Currency).where(Currency.id == currency_id)
         )
@@ -119,7 +261,10 @@ class CurrencyService:
             return False
         
         await session.delete(db_currency)
-        await session.commit()
+        if commit:
+            await session.commit()
+        else:
+            await session.flush()
         logger.info(f"Валюта удалена: {db_currency.code}")
         return True
     
@@ -0,0 +1,128 @@
+from sqlalchemy import select
+from app.config import get_settings
+from app.db.database import db
+from app.db.models import Currency, RateHistory, RateHistoryBar
+from app.encoding import dumps
+from app.services.history_service import from_epoch
+from typing import AsyncIterator, List, Optional, Sequence
+import asyncio
+import csv
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Формат -> media type
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Разрешения истории для выгрузки: сырые точки или свечи тира
+EXPORT_RESOLUTIONS = {
+    "raw": None,
+    "1m": 60,
+    "1h": 3600,
+    "1d": 86400,
+}
+
+# Строк в одной пачке из курсора и в одном куске ответа
+CHUNK_ROWS = 1000
+
+CURRENCY_COLUMNS = ["id", "code", "name", "type", "rate", "previous_rate", "updated_at", "created_at"]
+POINT_COLUMNS = ["code", "time", "rate"]
+BAR_COLUMNS = ["code", "time", "open", "high", "low", "close", "count"]
+
+
+def export_slots() -> int:
+    """Сколько выгрузок может читать одновременно: пул чтения не занимается целиком."""
+    settings = get_settings()
+    return max(1, min(settings.export_max_concurrent, settings.sqlite_read_pool_size - 1))
+
+
+def encode_rows(fmt: str, columns: List[str], rows: Sequence[Sequence]) -> bytes:
+    """Пачка строк в NDJSON или CSV."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue().encode("utf-8")
+    return b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+def encode_header(fmt: str, columns: List[str]) -> bytes:
+    """Заголовок (только для CSV)."""
+    if fmt == "csv":
+        return encode_rows(fmt, columns, [columns])
+    return b""
+
+
+class ExportService:
+    """
+    Потоковая выгрузка валют и истории.
+
+    Строки читаются курсором пачками по CHUNK_ROWS (stream / stream_scalars)
+    и сразу отдаются клиентом куском ответа, поэтому память не зависит от
+    объема выгрузки. Сессия открывается внутри генератора - она живет,
+    пока идет ответ, поэтому одновременно читают не больше export_slots()
+    выгрузок, остальным ручки отвечают 503 (busy()).
+    """
+
+    _slots = asyncio.Semaphore(export_slots())
+
+    @classmethod
+    def busy(cls) -> bool:
+        """Все слоты выгрузок заняты."""
+        return cls._slots.locked()
+
+    @staticmethod
+    async def stream_currencies(fmt: str) -> AsyncIterator[bytes]:
+        """Все валюты в порядке ID."""
+        yield encode_header(fmt, CURRENCY_COLUMNS)
+        async with ExportService._slots, db.read_session() as session:
+            result = await session.stream_scalars(
+                select(Currency).order_by(Currency.id).execution_options(yield_per=CHUNK_ROWS)
+            )
+            async for currencies in result.partitions(CHUNK_ROWS):
+                yield encode_rows(fmt, CURRENCY_COLUMNS, [
+                    (c.id, c.code, c.name, c.type, c.rate, c.previous_rate,
+                     c.updated_at.isoformat(), c.created_at.isoformat())
+                    for c in currencies
+                ])
+
+    @staticmethod
+    async def stream_history(
+        fmt: str,
+        codes: Optional[List[str]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        История по кодам (все, если не заданы) за [start, end):
+        сырые точки (resolution=None) или свечи тира resolution.
+        """
+        if resolution is None:
+            model, columns = RateHistory, POINT_COLUMNS
+            stmt = select(RateHistory.code, RateHistory.ts, RateHistory.rate)
+        else:
+            model, columns = RateHistoryBar, BAR_COLUMNS
+            stmt = select(
+                RateHistoryBar.code, RateHistoryBar.ts, RateHistoryBar.open, RateHistoryBar.high,
+                RateHistoryBar.low, RateHistoryBar.close, RateHistoryBar.count
+            ).where(RateHistoryBar.resolution == resolution)
+        if codes:
+            stmt = stmt.where(model.code.in_(codes))
+        if start is not None:
+            stmt = stmt.where(model.ts >= start)
+        if end is not None:
+            stmt = stmt.where(model.ts < end)
+        # По индексам (code, ts) / (code, resolution, ts)
+        stmt = stmt.order_by(model.code, model.ts).execution_options(yield_per=CHUNK_ROWS)
+
+        yield encode_header(fmt, columns)
+        async with ExportService._slots, db.read_session() as session:
+            result = await session.stream(stmt)
+            async for rows in result.partitions(CHUNK_ROWS):
+                yield encode_rows(fmt, columns, [
+                    (row[0], from_epoch(row[1]).isoformat(), *row[2:]) for row in rows
+                ])
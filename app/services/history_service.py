@@ -0,0 +1,278 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, delete, func, cast, literal, true, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.db.models import RateHistory, RateHistoryBar
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Интервалы свечей, сек
+INTERVALS = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "4h": 14400,
+    "1d": 86400,
+}
+
+# Разрешения сжатой истории (raw -> 1m -> 1h -> 1d)
+BAR_RESOLUTIONS = (60, 3600, 86400)
+
+
+def to_epoch(dt: datetime) -> float:
+    """datetime -> unix time; наивные datetime считаем UTC (как datetime.utcnow)."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def from_epoch(ts: float) -> datetime:
+    """unix time -> наивный UTC datetime (как в остальных моделях)."""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None)
+
+
+class HistoryService:
+    """БД логика истории курсов."""
+    
+    @staticmethod
+    async def record_rates(
+        session: AsyncSession,
+        points: Iterable[Tuple[str, float]],
+        ts: float | None = None,
+        commit: bool = True
+    ) -> int:
+        """Записать точки (code, rate) одной пачкой (commit=False - транзакцию завершает вызывающий)."""
+        ts = ts if ts is not None else to_epoch(datetime.utcnow())
+        rows = [{"code": code, "ts": ts, "rate": rate} for code, rate in points]
+        if not rows:
+            return 0
+        
+        await session.execute(insert(RateHistory), rows)
+        if commit:
+            await session.commit()
+        logger.debug(f"Записано точек истории: {len(rows)}")
+        return len(rows)
+    
+    @staticmethod
+    def _source_columns(resolution: Optional[int]):
+        """Колонки источника: сырые точки (resolution=None) или свечи тира."""
+        if resolution is None:
+            t = RateHistory
+            return t, t.rate, t.rate, t.rate, t.rate, literal(1), []
+        t = RateHistoryBar
+        return t, t.open, t.high, t.low, t.close, t.count, [t.resolution == resolution]
+
+    @staticmethod
+    def _aggregate(resolution: Optional[int], interval: int, where: list, by_code: bool):
+        """
+        SELECT свечей шага interval из источника.
+        
+        high/low/count - агрегаты, open/close - точечный запрос по индексу
+        к первой/последней точке свечи.
+        """
+        t, open_col, high_col, low_col, close_col, count_col, filters = (
+            HistoryService._source_columns(resolution)
+        )
+        bucket = (cast(t.ts / interval, Integer) * interval).label("bucket")
+        group = [t.code, bucket] if by_code else [bucket]
+        agg = (
+            select(
+                t.code.label("code"),
+                bucket,
+                func.max(high_col).label("high"),
+                func.min(low_col).label("low"),
+                func.sum(count_col).label("count"),
+                func.min(t.ts).label("first_ts"),
+                func.max(t.ts).label("last_ts"),
+            )
+            .where(*filters, *where)
+            .group_by(*group)
+            .subquery()
+        )
+        
+        def value_at(column, ts_column):
+            return (
+                select(column)
+                .where(*filters, t.code == agg.c.code, t.ts == ts_column)
+                .limit(1)
+                .scalar_subquery()
+            )
+        
+        return select(
+            agg.c.code,
+            agg.c.bucket,
+            value_at(open_col, agg.c.first_ts).label("open"),
+            agg.c.high,
+            agg.c.low,
+            value_at(close_col, agg.c.last_ts).label("close"),
+            agg.c.count,
+            agg.c.first_ts,
+            agg.c.last_ts,
+        )
+
+    @staticmethod
+    async def get_ohlc(
+        session: AsyncSession,
+        code: str,
+        start: float,
+        end: float,
+        interval: int
+    ) -> list[dict]:
+        """
+        OHLC свечи за [start, end) с шагом interval секунд.
+        
+        Агрегаты считаются в SQLite по индексам отдельно по сырым точкам и
+        по каждому тиру сжатой истории, кратному interval, затем сливаются.
+        """
+        sources = [None] + [r for r in BAR_RESOLUTIONS if interval % r == 0]
+        
+        buckets: dict[int, dict] = {}
+        for resolution in sources:
+            t = RateHistory if resolution is None else RateHistoryBar
+            stmt = HistoryService._aggregate(
+                resolution, interval,
+                [t.code == code, t.ts >= start, t.ts < end],
+                by_code=False,
+            )
+            result = await session.execute(stmt)
+            for row in result.all():
+                bar = buckets.get(row.bucket)
+                if bar is None:
+                    buckets[row.bucket] = {
+                        "open": row.open, "high": row.high, "low": row.low,
+                        "close": row.close, "count": row.count,
+                        "first_ts": row.first_ts, "last_ts": row.last_ts,
+                    }
+                    continue
+                # Сливаем части свечи из разных тиров
+                if row.first_ts < bar["first_ts"]:
+                    bar["open"], bar["first_ts"] = row.open, row.first_ts
+                if row.last_ts > bar["last_ts"]:
+                    bar["close"], bar["last_ts"] = row.close, row.last_ts
+                bar["high"] = max(bar["high"], row.high)
+                bar["low"] = min(bar["low"], row.low)
+                bar["count"] += row.count
+        
+        return [
+            {
+                "time": from_epoch(bucket),
+                "open": bar["open"],
+                "high": bar["high"],
+                "low": bar["low"],
+                "close": bar["close"],
+                "count": bar["count"],
+            }
+            for bucket, bar in sorted(buckets.items())
+        ]
+
+    @staticmethod
+    async def get_oldest_ts(session: AsyncSession, resolution: Optional[int]) -> Optional[float]:
+        """Самая старая точка источника (сырые точки или тир)."""
+        if resolution is None:
+            stmt = select(func.min(RateHistory.ts))
+        else:
+            stmt = select(func.min(RateHistoryBar.ts)).where(RateHistoryBar.resolution == resolution)
+        result = await session.execute(stmt)
+        return result.scalar()
+
+    @staticmethod
+    async def get_ts_at_offset(
+        session: AsyncSession,
+        resolution: Optional[int],
+        start: float,
+        offset: int
+    ) -> Optional[float]:
+        """ts строки источника через offset строк от start (по индексу ts), None если строк меньше."""
+        if resolution is None:
+            stmt = select(RateHistory.ts).where(RateHistory.ts >= start).order_by(RateHistory.ts)
+        else:
+            stmt = (
+                select(RateHistoryBar.ts)
+                .where(RateHistoryBar.resolution == resolution, RateHistoryBar.ts >= start)
+                .order_by(RateHistoryBar.ts)
+            )
+        result = await session.execute(stmt.offset(offset).limit(1))
+        return result.scalar()
+
+    @staticmethod
+    async def compact_window(
+        session: AsyncSession,
+        source_resolution: Optional[int],
+        target_resolution: int,
+        start: float,
+        end: float,
+        commit: bool = True
+    ) -> int:
+        """
+        Свернуть источник за [start, end) в свечи target_resolution и удалить его.
+        
+        Окно выровнено по target_resolution, поэтому каждая свеча целиком
+        попадает в одно окно. Всё окно - одна транзакция.
+        Возвращает число удаленных строк источника.
+        commit=False - транзакцию завершает вызывающий (DBWriter).
+        """
+        t = RateHistory if source_resolution is None else RateHistoryBar
+        where = [t.ts >= start, t.ts < end]
+        rollup = HistoryService._aggregate(
+            source_resolution, target_resolution, where, by_code=True
+        ).subquery()
+        
+        # WHERE true нужен SQLite, чтобы отличить ON CONFLICT от JOIN ... ON
+        select_rows = select(
+            rollup.c.code,
+            literal(target_resolution),
+            rollup.c.bucket,
+            rollup.c.open,
+            rollup.c.high,
+            rollup.c.low,
+            rollup.c.close,
+            rollup.c.count,
+        ).where(true())
+        stmt = sqlite_insert(RateHistoryBar).from_select(
+            ["code", "resolution", "ts", "open", "high", "low", "close", "count"],
+            select_rows,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["code", "resolution", "ts"],
+            set_={
+                "high": func.max(RateHistoryBar.high, stmt.excluded.high),
+                "low": func.min(RateHistoryBar.low, stmt.excluded.low),
+                "close": stmt.excluded.close,
+                "count": RateHistoryBar.count + stmt.excluded.count,
+            },
+        )
+        
+        try:
+            await session.execute(stmt)
+            delete_stmt = delete(t).where(*where)
+            if source_resolution is not None:
+                delete_stmt = delete_stmt.where(RateHistoryBar.resolution == source_resolution)
+            result = await session.execute(delete_stmt)
+            if commit:
+                await session.commit()
+        except Exception:
+            if commit:
+                await session.rollback()
+            raise
+        return result.rowcount
+
+    @staticmethod
+    async def delete_bars_before(
+        session: AsyncSession,
+        resolution: int,
+        before: float,
+        commit: bool = True
+    ) -> int:
+        """Удалить свечи тира старше before."""
+        result = await session.execute(
+            delete(RateHistoryBar).where(
+                RateHistoryBar.resolution == resolution,
+                RateHistoryBar.ts < before,
+            )
+        )
+        if commit:
+            await session.commit()
+        return result.rowcount
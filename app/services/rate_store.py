@@ -0,0 +1,106 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas.currency import CurrencyResponse, CurrencyListResponse
+from app.services.currency_service import CurrencyService
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateStore:
+    """
+    Курсы в памяти процесса для ручек чтения.
+
+    Обновляется фоновой задачей и ручками записи, поэтому чтение не ходит в БД.
+    Полный список сериализуется один раз после изменений и отдается с ETag.
+    """
+
+    def __init__(self):
+        self._by_code: Dict[str, CurrencyResponse] = {}
+        self._code_by_id: Dict[int, str] = {}
+        self._list_body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self.loaded = False
+        # Подписчики на изменения: listener(codes), None - поменялось все
+        self._listeners: List[Callable[[Optional[List[str]]], None]] = []
+
+    def add_listener(self, listener: Callable[[Optional[List[str]]], None]):
+        """Подписаться на изменения курсов (вызывается синхронно)."""
+        self._listeners.append(listener)
+
+    def _notify(self, codes: Optional[List[str]]):
+        for listener in self._listeners:
+            listener(codes)
+
+    async def load(self, session: AsyncSession):
+        """Загрузить все валюты из БД."""
+        currencies = await CurrencyService.get_all_currencies(session)
+        self._by_code.clear()
+        self._code_by_id.clear()
+        self.upsert(currencies)
+        self.loaded = True
+        self._notify(None)
+        logger.info(f"Кэш курсов загружен: {len(self._by_code)} валют")
+
+    def upsert(self, currencies: Iterable):
+        """Добавить/обновить валюты (ORM объекты или CurrencyResponse)."""
+        codes = []
+        for currency in currencies:
+            if not isinstance(currency, CurrencyResponse):
+                currency = CurrencyResponse.model_validate(currency)
+            old = self._by_code.get(currency.code)
+            if old is not None and old.id != currency.id:
+                self._code_by_id.pop(old.id, None)
+            self._by_code[currency.code] = currency
+            self._code_by_id[currency.id] = currency.code
+            self._invalidate()
+            codes.append(currency.code)
+        if codes:
+            self._notify(codes)
+
+    def remove(self, code: str):
+        """Убрать валюту."""
+        currency = self._by_code.pop(code, None)
+        if currency is not None:
+            self._code_by_id.pop(currency.id, None)
+            self._invalidate()
+            self._notify([code])
+
+    def clear(self):
+        self._by_code.clear()
+        self._code_by_id.clear()
+        self._invalidate()
+        self._notify(None)
+
+    def _invalidate(self):
+        self._list_body = None
+        self._etag = None
+
+    def get(self, identifier: str) -> Optional[CurrencyResponse]:
+        """Валюта по ID (число) или по коду."""
+        if identifier.isdigit():
+            code = self._code_by_id.get(int(identifier))
+            if code is not None:
+                return self._by_code[code]
+        return self._by_code.get(identifier.upper())
+
+    def all(self) -> List[CurrencyResponse]:
+        """Все валюты в порядке ID (как отдает БД)."""
+        return sorted(self._by_code.values(), key=lambda c: c.id)
+
+    def list_body(self) -> Tuple[bytes, str]:
+        """Готовый JSON полного списка и его ETag."""
+        if self._list_body is None:
+            currencies = self.all()
+            response = CurrencyListResponse(total=len(currencies), currencies=currencies)
+            self._list_body = response.model_dump_json().encode("utf-8")
+            self._etag = f'"{hashlib.blake2b(self._list_body, digest_size=16).hexdigest()}"'
+        return self._list_body, self._etag
+
+    def __len__(self) -> int:
+        return len(self._by_code)
+
+
+# Global rate store
+rate_store = RateStore()
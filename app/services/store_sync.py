@@ -0,0 +1,102 @@
+import logging
+import os
+import socket
+from typing import Callable, Iterable, List, Optional, Tuple
+from app.config import get_settings
+from app.encoding import EncodedFrame
+from app.nats.client import nats_client
+from app.schemas.currency import CurrencyResponse, StoreSyncMessage
+from app.services.rate_store import rate_store
+
+logger = logging.getLogger(__name__)
+
+
+class StoreSync:
+    """
+    Синхронизация кэша курсов между воркерами/репликами через NATS.
+
+    Каждая запись в БД (цикл источника, POST/PATCH/DELETE) публикует
+    изменившиеся валюты в nats_sync_subject - без порога рассылки, в отличие
+    от событий. Остальные процессы применяют их к своему rate_store (а через
+    него - к движку конвертации) и сбрасывают валидаторы источников, если
+    курсы поменяли через API. Свои сообщения процесс пропускает.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.origin = f"{socket.gethostname()}-{os.getpid()}"
+        self.subject: Optional[str] = None
+        self._invalidate_listeners: List[Callable[[], None]] = []
+        self.messages_received = 0
+
+    def add_invalidate_listener(self, listener: Callable[[], None]):
+        """listener() вызывается, когда курсы поменяли через API другого процесса."""
+        self._invalidate_listeners.append(listener)
+
+    def messages(
+        self,
+        upserted: Iterable = (),
+        removed: Iterable[str] = (),
+        invalidate: bool = False,
+    ) -> List[Tuple[str, EncodedFrame]]:
+        """Сообщения синхронизации для publish_batch (пусто, если NATS не подключен)."""
+        if not nats_client.nc:
+            return []
+        currencies = [
+            c if isinstance(c, CurrencyResponse) else CurrencyResponse.model_validate(c)
+            for c in upserted
+        ]
+        removed = list(removed)
+        if not (currencies or removed or invalidate):
+            return []
+        size = self.settings.nats_sync_batch_size or len(currencies) or 1
+        chunks = [currencies[i:i + size] for i in range(0, len(currencies), size)] or [[]]
+        return [
+            (self.settings.nats_sync_subject, EncodedFrame.encode(StoreSyncMessage(
+                origin=self.origin,
+                upserted=chunk,
+                # Удаления и сброс валидаторов - с последней частью
+                removed=removed if i == len(chunks) - 1 else [],
+                invalidate=invalidate and i == len(chunks) - 1,
+            )))
+            for i, chunk in enumerate(chunks)
+        ]
+
+    async def publish(self, upserted: Iterable = (), removed: Iterable[str] = (), invalidate: bool = False):
+        """Опубликовать изменения кэша."""
+        messages = self.messages(upserted, removed, invalidate)
+        if messages:
+            await nats_client.publish_batch(messages)
+
+    async def start(self):
+        """Подписаться на изменения других процессов."""
+        if not nats_client.nc:
+            return
+        self.subject = self.settings.nats_sync_subject
+        await nats_client.subscribe(self.subject, self._on_message)
+
+    async def stop(self):
+        if self.subject:
+            await nats_client.unsubscribe(self.subject)
+            self.subject = None
+
+    async def _on_message(self, msg):
+        try:
+            self.apply(StoreSyncMessage.model_validate_json(msg.data))
+        except Exception as e:
+            logger.error(f"Ошибка обработки синхронизации кэша {msg.subject}: {e}")
+
+    def apply(self, message: StoreSyncMessage):
+        """Применить изменения другого процесса к кэшу."""
+        if message.origin == self.origin:
+            return
+        self.messages_received += 1
+        rate_store.upsert(message.upserted)
+        for code in message.removed:
+            rate_store.remove(code)
+        if message.invalidate:
+            for listener in self._invalidate_listeners:
+                listener()
+
+
+store_sync = StoreSync()
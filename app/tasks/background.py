@@ -1,329 +1,373 @@
-import httpx
 import asyncio
 import logging
+import time
 from datetime import datetime
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from app.config import get_settings
 from app.db.database import db
 from app.services.currency_service import CurrencyService
+from app.services.rate_store import rate_store
+from app.services.history_service import HistoryService
+from app.services.store_sync import store_sync
 from app.nats.client import nats_client
+from app.http.client import http_client
 from app.ws.manager import ws_manager
-from app.schemas.currency import PriceChangeEvent, CurrencyResponse, CurrencyUpdate
+from app.providers.base import RateProvider, RateRow
+from app.providers.registry import create_providers
+from app.encoding import EncodedFrame, encode_batches
+from app.metrics import cycle_events, db_write_seconds, provider_cycles_total
+from app.schemas.currency import PriceChangeEvent, CurrencyResponse
 
 logger = logging.getLogger(__name__)
 
+# (обновлено, пропущено без изменений, событий ниже порога)
+UpdateCounts = Tuple[int, int, int]
+
 
 class BackgroundTaskManager:
+    """
+    Обновление курсов из внешних источников.
+
+    Каждый источник крутится в своем цикле со своим интервалом и таймаутом,
+    циклы одного источника не пересекаются; скачивание и чтение из БД идут параллельно,
+    запись - через очередь единственного писателя (db.writer).
+    """
+
     def __init__(self):
         self.settings = get_settings()
         self.is_running = False
-        self.task = None
+        self.tasks: List[asyncio.Task] = []
+        self.providers: List[RateProvider] = create_providers(self.settings)
         self.last_status = {
             "status": "idle",
             "message": "No tasks run yet",
             "updated_at": datetime.utcnow(),
-            "currencies_count": 0
+            "currencies_count": 0,
+            "duration_ms": None,
+            "skipped_unchanged": 0,
+            "suppressed_events": 0
         }
-    
-    async def fetch_all_fiat_rates(self, client) -> List[Tuple[str, str, str, float]]:
-        """Получаем ВСЕ фиатные курсы."""
-        try:
-            url = f"{self.settings.exchangerate_api_url}/{self.settings.base_currency}"
-            response = await client.get(url)
-            if response.status_code != 200:
-                logger.error(f"Fiat API error: {response.status_code}")
-                return []
-                
-            data = response.json()
-            rates = data.get("rates", {})
-            
-            results = []
-            for code, rate in rates.items():
-                if code != self.settings.base_currency:
-                    results.append(("fiat", f'{self.settings.base_currency}{code}', 
-                                  f"Fiat {self.settings.base_currency}/{code}", rate))
-            return results
-        except Exception as e:
-            logger.error(f"Error fetching all fiat: {e}")
-            return []
+        # Последний разосланный курс по коду - от него считаем порог изменения
+        self._last_broadcast: Dict[str, float] = {}
+        # Код -> источник, который его пишет. Один код может прийти от
+        # нескольких источников (USDRUB у fiat и cbr) - тогда пишет источник,
+        # стоящий в providers_enabled позже (как в общем цикле: cbr поверх fiat),
+        # иначе курс в БД скакал бы между источниками. Стоковые коды
+        # разбираем сразу, остальные - по мере прихода документов.
+        self._owners: Dict[str, str] = {}
+        self._priority = {provider.name: i for i, provider in enumerate(self.providers)}
+        for provider in self.providers:
+            self._claim(provider, [provider.row(code, 0.0)[1] for code in provider.default_codes])
+        # Курсы поменяли через API другого процесса
+        store_sync.add_invalidate_listener(self.invalidate_providers)
+        # Циклы одного источника не пересекаются (цикл по расписанию и ручной запуск)
+        self._cycle_locks = {provider.name: asyncio.Lock() for provider in self.providers}
 
-    async def fetch_all_crypto_rates(self, client) -> List[Tuple[str, str, str, float]]:
-        """Получаем ВСЕ крипто курсы с Binance (USDT pairs)."""
-        try:
-            url = f"{self.settings.binance_api_url}/api/v3/ticker/price"
-            response = await client.get(url)
-            if response.status_code != 200:
-                logger.error(f"Binance API error: {response.status_code}")
-                return []
-            
-            data = response.json()
-            
-            results = []
-            for item in data:
-                symbol = item["symbol"]
-                if symbol.endswith("USDT"):
-                    # Извлекаем код криптовалюты (убираем USDT)
-                    code = symbol.replace("USDT", "")
-                    price = float(item["price"])
-                    results.append(("crypto", code, f"Crypto {code}/USDT", price))
-                    
-            return results
-        except Exception as e:
-            logger.error(f"Error fetching all crypto: {e}")
-            return []
+    def _claim(self, provider: RateProvider, codes):
+        """Отдать коды источнику, если у них нет владельца с большим приоритетом."""
+        priority = self._priority[provider.name]
+        for code in codes:
+            owner = self._owners.get(code)
+            if owner == provider.name:
+                continue
+            if owner is None or priority > self._priority[owner]:
+                if owner is not None:
+                    logger.info(f"Код {code} есть у источников {owner} и {provider.name}, пишет {provider.name}")
+                self._owners[code] = provider.name
 
-    async def fetch_all_cbr_rates(self, client) -> List[Tuple[str, str, str, float]]:
-        """Получаем ВСЕ курсы ЦБ РФ."""
-        try:
-            response = await client.get(self.settings.cbr_api_url)
-            if response.status_code != 200:
-                logger.error(f"CBR API error: {response.status_code}")
-                return []
-            
-            data = response.json()
-            valute = data.get("Valute", {})
-            
-            results = []
-            for code, item in valute.items():
-                rate = item["Value"] / item["Nominal"]
-                results.append(("cbr", f"{code}RUB", f"CBR {code}/RUB", rate))
-            
-            return results
-        except Exception as e:
-            logger.error(f"Error fetching all CBR: {e}")
-            return []
+    def owned_rows(self, provider: RateProvider, rows: List[RateRow]) -> List[RateRow]:
+        """Строки источника без кодов, которые пишет другой источник."""
+        self._claim(provider, [row[1] for row in rows])
+        return [row for row in rows if self._owners[row[1]] == provider.name]
 
-    async def fetch_default_fiat_rates(self, client) -> List[Tuple[str, str, str, float]]:
-        """Получаем только стоковые фиатные курсы."""
-        try:
-            url = f"{self.settings.exchangerate_api_url}/{self.settings.base_currency}"
-            response = await client.get(url)
-            if response.status_code != 200:
-                logger.error(f"Fiat API error: {response.status_code}")
-                return []
-                
-            data = response.json()
-            rates = data.get("rates", {})
-            
-            results = []
-            for code in self.settings.default_fiat_currencies:
-                if code in rates and code != self.settings.base_currency:
-                    results.append(("fiat", f'{self.settings.base_currency}{code}', 
-                                  f"Fiat {self.settings.base_currency}/{code}", rates[code]))
-            return results
-        except Exception as e:
-            logger.error(f"Error fetching default fiat: {e}")
-            return []
+    async def update_all_mode(self, provider: RateProvider, rates: Dict[str, float]) -> UpdateCounts:
+        """Режим 'all': обновляем все валюты источника из БД + добавляем стоковые."""
+        available = {row[1]: row for row in self.owned_rows(provider, provider.rows(rates))}
+        
+        # 1. Текущие курсы валют из БД (тип не фильтруем - созданные вручную
+        # валюты могут быть записаны с другим типом, а курс найдется у источника)
+        # Потоковый источник присылает только изменившиеся - их и читаем
+        async with db.read_session() as session:
+            stored = await CurrencyService.get_stored_rates(
+                session, list(available) if provider.streaming else None
+            )
+        
+        # 2. Собираем обновления для существующих валют из БД
+        pending: List[RateRow] = []
+        for code in stored:
+            if code in available:
+                pending.append(available[code])
+            elif not provider.streaming and self._owners.get(code) == provider.name:
+                # Код этого источника пропал из документа (созданные вручную
+                # валюты, которых нет ни у одного источника, не в счет)
+                logger.warning(f"Курс для валюты из БД {code} не найден в API")
+        
+        # 3. Добавляем стоковые валюты (если их нет в БД) из того же документа
+        for row in provider.rows(rates, provider.default_codes):
+            if row[1] in available and row[1] not in stored:
+                pending.append(row)
+        
+        # 4. Пишем изменившиеся одной транзакцией и рассылаем события
+        return await self._write_and_send(provider, pending, stored)
 
-    async def fetch_default_crypto_rates(self, client) -> List[Tuple[str, str, str, float]]:
-        """Получаем только стоковые крипто курсы."""
-        try:
-            url = f"{self.settings.binance_api_url}/api/v3/ticker/price"
-            response = await client.get(url)
-            if response.status_code != 200:
-                logger.error(f"Binance API error: {response.status_code}")
-                return []
-            
-            data = response.json()
-            
-            results = []
-            target_symbols = {f"{t}USDT": t for t in self.settings.default_crypto_currencies}
-            
-            for item in data:
-                symbol = item["symbol"]
-                if symbol in target_symbols:
-                    code = target_symbols[symbol]
-                    price = float(item["price"])
-                    results.append(("crypto", code, f"Crypto {code}/USDT", price))
-                    
-            return results
-        except Exception as e:
-            logger.error(f"Error fetching default crypto: {e}")
-            return []
+    async def update_default_mode(self, provider: RateProvider, rates: Dict[str, float]) -> UpdateCounts:
+        """Режим 'default': обновляем только стоковые валюты."""
+        pending = self.owned_rows(provider, provider.rows(rates, provider.default_codes))
+        async with db.read_session() as session:
+            stored = await CurrencyService.get_stored_rates(
+                session, [code for _, code, _, _ in pending]
+            )
+        return await self._write_and_send(provider, pending, stored)
 
-    async def fetch_default_cbr_rates(self, client) -> List[Tuple[str, str, str, float]]:
-        """Получаем только стоковые курсы ЦБ РФ."""
-        try:
-            response = await client.get(self.settings.cbr_api_url)
-            if response.status_code != 200:
-                logger.error(f"CBR API error: {response.status_code}")
-                return []
-            
-            data = response.json()
-            valute = data.get("Valute", {})
-            
-            results = []
-            for code in self.settings.default_cbr_currencies:
-                if code in valute:
-                    item = valute[code]
-                    rate = item["Value"] / item["Nominal"]
-                    results.append(("cbr", f"{code}RUB", f"CBR {code}/RUB", rate))
-            
-            return results
-        except Exception as e:
-            logger.error(f"Error fetching default CBR: {e}")
-            return []
+    async def _write_and_send(
+        self,
+        provider: RateProvider,
+        pending: List[RateRow],
+        stored: Dict[str, Tuple[float, str]]
+    ) -> UpdateCounts:
+        """
+        Пишет в БД только изменившиеся курсы и рассылает события.
 
-    async def update_all_mode(self, session) -> int:
-        """Режим 'all': обновляем все валюты из БД + добавляем стоковые."""
-        try:
-            updated_count = 0
-            
-            # 1. Получаем все доступные курсы
-            async with httpx.AsyncClient(timeout=self.settings.api_timeout) as client:
-                all_fiat_data, all_crypto_data, all_cbr_data = await asyncio.gather(
-                    self.fetch_all_fiat_rates(client),
-                    self.fetch_all_crypto_rates(client),
-                    self.fetch_all_cbr_rates(client)
+        Неизменившиеся курсы не пишутся вовсе, а события о мелких
+        изменениях (ниже порогов min_change_*) не рассылаются.
+        """
+        changed = [
+            row for row in pending
+            if stored.get(row[1]) != (row[3], row[2])
+        ]
+        
+        async def write(session):
+            # Курсы и точки истории - одной транзакцией писателя
+            upserted = await CurrencyService.bulk_upsert_currencies(session, changed, commit=False)
+            if self.settings.history_enabled:
+                await HistoryService.record_rates(
+                    session, [(currency.code, currency.rate) for currency, _ in upserted], commit=False
                 )
-            
-            # Создаем словарь всех доступных курсов
-            all_available_rates: Dict[str, Tuple[str, float, str]] = {}
-            for c_type, code, name, rate in all_fiat_data + all_crypto_data + all_cbr_data:
-                all_available_rates[code] = (name, rate, c_type)
-            
-            # 2. Получаем все валюты из БД
-            db_currencies = await CurrencyService.get_all_currencies(session)
-            db_currency_codes = {c.code for c in db_currencies}
-            
-            # 3. Обновляем существующие валюты из БД
-            for currency in db_currencies:
-                if currency.code in all_available_rates:
-                    name, rate, c_type = all_available_rates[currency.code]
-                    
-                    update_data = CurrencyUpdate(rate=rate, name=name)
-                    updated_currency = await CurrencyService.update_currency(
-                        session, currency.id, update_data
-                    )
-                    
-                    if updated_currency:
-                        # Отправляем событие
-                        await self._send_currency_event(updated_currency, "updated")
-                        updated_count += 1
-                        logger.debug(f"Обновлена валюта из БД: {currency.code} -> {rate}")
-                else:
-                    logger.warning(f"Курс для валюты из БД {currency.code} не найден в API")
-            
-            # 4. Добавляем стоковые валюты (если их нет в БД)
-            async with httpx.AsyncClient(timeout=self.settings.api_timeout) as client:
-                default_fiat_data, default_crypto_data, default_cbr_data = await asyncio.gather(
-                    self.fetch_default_fiat_rates(client),
-                    self.fetch_default_crypto_rates(client),
-                    self.fetch_default_cbr_rates(client)
+            return upserted
+        
+        upserted = []
+        if changed:
+            started = time.perf_counter()
+            upserted = await db.writer.submit(write)
+            db_write_seconds.observe(time.perf_counter() - started, provider.name)
+        rate_store.upsert(currency for currency, _ in upserted)
+        
+        events = []
+        for currency, is_created in upserted:
+            if is_created or self._passes_threshold(currency):
+                self._last_broadcast[currency.code] = currency.rate
+                events.append(
+                    self._build_event(currency, "created" if is_created else "updated")
                 )
-            
-            # Добавляем только те стоковые, которых нет в БД
-            for c_type, code, name, rate in default_fiat_data + default_crypto_data + default_cbr_data:
-                if code not in db_currency_codes:
-                    # Добавляем новую валюту
-                    currency, is_created = await CurrencyService.update_or_create_currency(
-                        session, code=code, name=name, rate=rate, type=c_type
-                    )
-                    
-                    if is_created:
-                        await self._send_currency_event(currency, "created")
-                        updated_count += 1
-                        logger.debug(f"Добавлена стоковая валюта: {code} -> {rate}")
-            
-            return updated_count
-            
-        except Exception as e:
-            logger.error(f"Ошибка в режиме all: {e}")
-            return 0
+        await self._send_events(events, [currency for currency, _ in upserted])
+        cycle_events.observe(len(events), provider.name)
+        
+        return len(upserted), len(pending) - len(changed), len(upserted) - len(events)
 
-    async def update_default_mode(self, session) -> int:
-        """Режим 'default': обновляем только стоковые валюты."""
-        try:
-            updated_count = 0
-            
-            # Получаем только стоковые курсы
-            async with httpx.AsyncClient(timeout=self.settings.api_timeout) as client:
-                fiat_data, crypto_data, cbr_data = await asyncio.gather(
-                    self.fetch_default_fiat_rates(client),
-                    self.fetch_default_crypto_rates(client),
-                    self.fetch_default_cbr_rates(client)
-                )
-            
-            # Обрабатываем стоковые валюты
-            for c_type, code, name, rate in fiat_data + crypto_data + cbr_data:
-                currency, is_created = await CurrencyService.update_or_create_currency(
-                    session, code=code, name=name, rate=rate, type=c_type
-                )
-                
-                event_type = "created" if is_created else "updated"
-                await self._send_currency_event(currency, event_type)
-                updated_count += 1
-            
-            return updated_count
-            
-        except Exception as e:
-            logger.error(f"Ошибка в режиме default: {e}")
-            return 0
+    def _passes_threshold(self, currency) -> bool:
+        """Изменение относительно последнего разосланного курса выше порога типа."""
+        last = self._last_broadcast.get(currency.code, currency.previous_rate)
+        if last is None:
+            return True
+        
+        delta = abs(currency.rate - last)
+        if delta == 0:
+            return False
+        if delta < self.settings.min_change_abs.get(currency.type, 0.0):
+            return False
+        min_percent = self.settings.min_change_percent.get(currency.type, 0.0)
+        if min_percent and last != 0 and delta / abs(last) * 100 < min_percent:
+            return False
+        return True
+
+    def _build_event(self, currency, event_type: str) -> PriceChangeEvent:
+        """Собирает событие об изменении валюты."""
+        change_percent = None
+        if currency.previous_rate and currency.previous_rate != 0:
+            change_percent = ((currency.rate - currency.previous_rate) / 
+                            currency.previous_rate * 100)
+        
+        return PriceChangeEvent(
+            type=event_type,
+            currency=CurrencyResponse.from_orm(currency),
+            change_percent=change_percent
+        )
+
+    async def _send_events(self, events: List[PriceChangeEvent], upserted=()):
+        """
+        Отправляет события цикла через NATS и WebSocket.
 
-    async def _send_currency_event(self, currency, event_type: str):
-        """Отправляет событие о валюте через NATS и WebSocket."""
+        Каждое событие сериализуется один раз; сообщения "batch" склеиваются
+        из тех же байтов. Веб-сокеты получают только то, на что подписаны.
+        Все записанные курсы (и ниже порога) уходят другим процессам
+        сообщением синхронизации кэша в той же пачке.
+        """
+        sync = store_sync.messages(upserted)
+        if not events:
+            if sync:
+                await nats_client.publish_batch(sync)
+            return
         try:
-            change_percent = None
-            if currency.previous_rate and currency.previous_rate != 0:
-                change_percent = ((currency.rate - currency.previous_rate) / 
-                                currency.previous_rate * 100)
-            
-            currency_resp = CurrencyResponse.from_orm(currency)
-            
-            event = PriceChangeEvent(
-                type=event_type,
-                currency=currency_resp,
-                change_percent=change_percent
-            )
-            
-            dumped_event = event.model_dump(mode="json")
-            await nats_client.publish(self.settings.nats_subject, dumped_event)
-            await ws_manager.broadcast(dumped_event)
+            routed = [
+                (e.currency.code, e.currency.type, EncodedFrame.encode(e))
+                for e in events
+            ]
+            
+            if self.settings.nats_batch_mode:
+                frames = [frame for _, _, frame in routed]
+                subject = nats_client.batch_subject()
+                messages = [
+                    (subject, frame)
+                    for frame in encode_batches(frames, self.settings.event_batch_size)
+                ]
+            else:
+                messages = [
+                    (nats_client.currency_subject(c_type, code), frame)
+                    for code, c_type, frame in routed
+                ]
+            # Все сообщения цикла - одной пачкой с одним flush
+            await nats_client.publish_batch(sync + messages)
+            
+            # В режиме "nats" веб-сокеты всех воркеров получают события из NATS
+            if self.settings.ws_fanout_mode == "local":
+                await ws_manager.broadcast_events(routed, self.settings.event_batch_size)
             
         except Exception as e:
             logger.error(f"Ошибка при отправке события: {e}")
 
-    async def run_once(self) -> bool:
-        """Запуск цикла обновления."""
+    async def run_provider(self, provider: RateProvider) -> Optional[UpdateCounts]:
+        """Один цикл источника: скачать, разобрать, записать изменения и разослать."""
+        async with self._cycle_locks[provider.name]:
+            return await self._run_cycle(provider)
+
+    async def _run_cycle(self, provider: RateProvider) -> Optional[UpdateCounts]:
+        status = provider.last_status
+        status["status"] = "running"
+        started = time.perf_counter()
         try:
-            logger.info(f"Запуск обновления курсов (режим: {self.settings.update_mode})...")
-            self.last_status["status"] = "running"
-            self.last_status["updated_at"] = datetime.utcnow()
-            
-            async with db.async_session() as session:
-                if self.settings.update_mode == "all":
-                    updated_count = await self.update_all_mode(session)
-                else:  # default mode
-                    updated_count = await self.update_default_mode(session)
-            
-            self.last_status["status"] = "success"
-            self.last_status["message"] = f"Обновлено {updated_count} валют (режим: {self.settings.update_mode})"
-            self.last_status["currencies_count"] = updated_count
-            logger.info(f"Задача завершена: {updated_count} валют обновлено")
-            return True
+            rates = await provider.get_rates(http_client)
+            if provider.streaming and not rates:
+                # Ничего не изменилось с прошлой пачки
+                status["status"] = "success"
+                return 0, 0, 0
+            if rates is None:
+                # Документ не изменился - не разбираем, не пишем, не рассылаем
+                status["status"] = "success"
+                status["message"] = "Документ не изменился"
+                status["not_modified"] += 1
+                provider_cycles_total.inc(provider.name, "not_modified")
+                return 0, 0, 0
+            if not rates:
+                raise RuntimeError(f"Источник {provider.name} не вернул курсов")
+            
+            if self.settings.update_mode == "all":
+                counts = await self.update_all_mode(provider, rates)
+            else:  # default mode
+                counts = await self.update_default_mode(provider, rates)
+            provider.mark_processed()
+            
+            status["status"] = "success"
+            status["message"] = f"Обновлено {counts[0]} валют"
+            status["currencies_count"] = counts[0]
+            status["skipped_unchanged"] = counts[1]
+            status["suppressed_events"] = counts[2]
+            provider_cycles_total.inc(provider.name, "success")
+            return counts
             
         except Exception as e:
-            logger.error(f"Ошибка фоновой задачи: {e}")
-            self.last_status["status"] = "failed"
-            self.last_status["message"] = str(e)
-            return False
+            logger.error(f"Ошибка обновления источника {provider.name}: {e}")
+            status["status"] = "failed"
+            status["message"] = str(e)
+            provider_cycles_total.inc(provider.name, "failed")
+            return None
+        finally:
+            status["updated_at"] = datetime.utcnow()
+            status["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _set_status(self, results: List[Optional[UpdateCounts]], duration_ms: float, source: str):
+        """Общий статус по результатам одного или нескольких источников."""
+        done = [counts for counts in results if counts is not None]
+        updated_count = sum(counts[0] for counts in done)
+        failed = len(results) - len(done)
+        
+        self.last_status["status"] = "failed" if results and failed == len(results) else "success"
+        self.last_status["message"] = (
+            f"Обновлено {updated_count} валют (источник: {source}, режим: {self.settings.update_mode})"
+            + (f", ошибок источников: {failed}" if failed else "")
+        )
+        self.last_status["updated_at"] = datetime.utcnow()
+        self.last_status["currencies_count"] = updated_count
+        self.last_status["duration_ms"] = round(duration_ms, 2)
+        self.last_status["skipped_unchanged"] = sum(counts[1] for counts in done)
+        self.last_status["suppressed_events"] = sum(counts[2] for counts in done)
+
+    async def run_once(self) -> bool:
+        """
+        Запуск цикла обновления сразу по всем источникам.
+
+        Источники, чей цикл по расписанию идет прямо сейчас, пропускаются -
+        второй цикл поверх него ничего нового не запишет.
+        """
+        logger.info(f"Запуск обновления курсов (режим: {self.settings.update_mode})...")
+        self.last_status["status"] = "running"
+        self.last_status["updated_at"] = datetime.utcnow()
+        started = time.perf_counter()
+        
+        busy = [p.name for p in self.providers if self._cycle_locks[p.name].locked()]
+        results = await asyncio.gather(*(
+            self.run_provider(p) for p in self.providers if p.name not in busy
+        ))
+        
+        duration_ms = (time.perf_counter() - started) * 1000
+        source = "все" + (f", пропущены (уже в цикле): {', '.join(busy)}" if busy else "")
+        self._set_status(results, duration_ms, source)
+        logger.info(f"Задача завершена: {self.last_status['currencies_count']} валют обновлено за {duration_ms:.1f} мс")
+        return self.last_status["status"] == "success"
 
     async def start(self):
         if self.is_running: return
         self.is_running = True
-        self.task = asyncio.create_task(self._loop())
+        for provider in self.providers:
+            await provider.start()
+        self.tasks = [
+            asyncio.create_task(self._provider_loop(provider))
+            for provider in self.providers
+        ]
 
     async def stop(self):
         self.is_running = False
-        if self.task: self.task.cancel()
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        for provider in self.providers:
+            await provider.stop()
 
-    async def _loop(self):
+    async def _provider_loop(self, provider: RateProvider):
+        """Цикл одного источника со своим интервалом."""
         while self.is_running:
-            await self.run_once()
-            await asyncio.sleep(self.settings.background_task_interval)
-            
+            started = time.perf_counter()
+            result = await self.run_provider(provider)
+            # Пустые пачки потокового источника не затирают общий статус
+            if result != (0, 0, 0):
+                self._set_status([result], (time.perf_counter() - started) * 1000, provider.name)
+            # Интервал считаем от начала цикла, чтобы частые источники не отставали
+            await asyncio.sleep(max(0.0, provider.interval - (time.perf_counter() - started)))
+            
+    @property
+    def is_leader(self) -> bool:
+        """Этот процесс сам обновляет курсы."""
+        return self.is_running
+
     def get_status(self):
         return self.last_status
 
+    def invalidate_providers(self):
+        """Следующий цикл источников обработает документ, даже если он не менялся."""
+        for provider in self.providers:
+            provider.invalidate()
+
+    def get_providers_status(self) -> Dict[str, dict]:
+        return {provider.name: provider.get_status() for provider in self.providers}
+
 
 background_manager = BackgroundTaskManager()
\ No newline at end of file
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Optional
+from app.config import get_settings
+from app.db.database import db
+from app.services.history_service import HistoryService, to_epoch
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryCompactionManager:
+    """
+    Фоновое сжатие истории курсов.
+
+    Сырые точки старше history_raw_retention_hours сворачиваются в 1m свечи,
+    1m старше history_1m_retention_days - в 1h, 1h старше
+    history_1h_retention_days - в 1d. Работает окнами примерно по
+    history_compaction_batch_rows строк, каждое окно - одна короткая
+    транзакция и уступает event loop между окнами, чтобы не блокировать
+    цикл обновления курсов.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.is_running = False
+        self.task = None
+        self.last_status = {
+            "status": "idle",
+            "message": "No compaction run yet",
+            "updated_at": datetime.utcnow(),
+            "rows_compacted": 0,
+            "rows_deleted": 0,
+            "duration_ms": None
+        }
+
+    def _tiers(self):
+        """(источник, цель, сколько хранить источник в секундах)."""
+        return [
+            (None, 60, self.settings.history_raw_retention_hours * 3600),
+            (60, 3600, self.settings.history_1m_retention_days * 86400),
+            (3600, 86400, self.settings.history_1h_retention_days * 86400),
+        ]
+
+    async def compact_tier(
+        self,
+        source: Optional[int],
+        target: int,
+        retention: float,
+        now: float
+    ) -> int:
+        """
+        Свернуть один тир; возвращает число свернутых строк источника.
+
+        Границы окна читаются из пула чтения, каждое окно пишется отдельной
+        задачей в очереди писателя - между окнами проходят записи курсов.
+        """
+        cutoff = math.floor((now - retention) / target) * target
+        batch_rows = self.settings.history_compaction_batch_rows
+
+        compacted = 0
+        while True:
+            # Каждое окно начинаем с самой старой оставшейся точки,
+            # пустые промежутки пропускаются сами
+            async with db.read_session() as session:
+                oldest = await HistoryService.get_oldest_ts(session, source)
+                if oldest is None or oldest >= cutoff:
+                    break
+                start = math.floor(oldest / target) * target
+                # Окно ~batch_rows строк источника, выровненное по целевому разрешению
+                batch_end = await HistoryService.get_ts_at_offset(session, source, start, batch_rows)
+            end = cutoff
+            if batch_end is not None:
+                end = min(cutoff, max(start + target, math.ceil(batch_end / target) * target))
+            compacted += await db.writer.submit(
+                lambda session: HistoryService.compact_window(
+                    session, source, target, start, end, commit=False
+                )
+            )
+            # Отдаем управление циклу обновления между окнами
+            await asyncio.sleep(0)
+        return compacted
+
+    async def run_once(self) -> bool:
+        """Один проход сжатия по всем тирам."""
+        try:
+            logger.info("Запуск сжатия истории курсов...")
+            self.last_status["status"] = "running"
+            self.last_status["updated_at"] = datetime.utcnow()
+            started = time.perf_counter()
+            now = to_epoch(datetime.utcnow())
+
+            compacted = 0
+            deleted = 0
+            for source, target, retention in self._tiers():
+                compacted += await self.compact_tier(source, target, retention, now)
+
+            # Дневные свечи храним history_1d_retention_days (0 - всегда)
+            if self.settings.history_1d_retention_days > 0:
+                before = now - self.settings.history_1d_retention_days * 86400
+                deleted = await db.writer.submit(
+                    lambda session: HistoryService.delete_bars_before(session, 86400, before, commit=False)
+                )
+
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.last_status["status"] = "success"
+            self.last_status["message"] = f"Свернуто {compacted} строк истории, удалено {deleted}"
+            self.last_status["rows_compacted"] = compacted
+            self.last_status["rows_deleted"] = deleted
+            self.last_status["duration_ms"] = round(duration_ms, 2)
+            logger.info(f"Сжатие истории завершено: {compacted} строк за {duration_ms:.1f} мс")
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка сжатия истории: {e}")
+            self.last_status["status"] = "failed"
+            self.last_status["message"] = str(e)
+            return False
+
+    async def start(self):
+        if self.is_running: return
+        self.is_running = True
+        self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self.is_running = False
+        if self.task: self.task.cancel()
+
+    async def _loop(self):
+        while self.is_running:
+            await self.run_once()
+            await asyncio.sleep(self.settings.history_compaction_interval)
+
+    def get_status(self):
+        return self.last_status
+
+
+compaction_manager = HistoryCompactionManager()
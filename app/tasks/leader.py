@@ -0,0 +1,285 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from nats.js.api import KeyValueConfig
+from nats.js.errors import KeyNotFoundError, KeyWrongLastSequenceError
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.config import get_settings
+from app.db.database import db
+from app.db.models import LeaderLease
+from app.nats.client import nats_client
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "background"
+
+
+class LeaseBackend(ABC):
+    """Хранилище аренды лидерства."""
+
+    @abstractmethod
+    async def acquire(self, node_id: str, ttl: float) -> bool:
+        """Захватить или продлить аренду. True - этот узел лидер."""
+
+    @abstractmethod
+    async def release(self, node_id: str):
+        """Отпустить аренду, если она наша."""
+
+    @abstractmethod
+    async def current_leader(self) -> Optional[str]:
+        """Кто сейчас держит аренду."""
+
+
+class MemoryLeaseBackend(LeaseBackend):
+    """Аренда в памяти процесса (один процесс, тесты)."""
+
+    def __init__(self):
+        self.leases: Dict[str, Tuple[str, float]] = {}
+
+    async def acquire(self, node_id: str, ttl: float) -> bool:
+        now = time.time()
+        holder = self.leases.get(LEASE_NAME)
+        if holder is None or holder[0] == node_id or holder[1] < now:
+            self.leases[LEASE_NAME] = (node_id, now + ttl)
+            return True
+        return False
+
+    async def release(self, node_id: str):
+        holder = self.leases.get(LEASE_NAME)
+        if holder is not None and holder[0] == node_id:
+            del self.leases[LEASE_NAME]
+
+    async def current_leader(self) -> Optional[str]:
+        holder = self.leases.get(LEASE_NAME)
+        if holder is None or holder[1] < time.time():
+            return None
+        return holder[0]
+
+
+class DBLeaseBackend(LeaseBackend):
+    """
+    Аренда строкой в таблице leader_leases.
+
+    Захват - один условный UPDATE (наша аренда или истекшая), атомарный
+    в SQLite; если строки еще нет - INSERT ... ON CONFLICT DO NOTHING.
+    Пишется отдельным коротким соединением (db.lease_session), мимо очереди
+    писателя: продление не ждет пачек записи курсов и истории.
+    """
+
+    async def acquire(self, node_id: str, ttl: float) -> bool:
+        now = time.time()
+        async with db.lease_session() as session:
+            result = await session.execute(
+                update(LeaderLease)
+                .where(
+                    LeaderLease.name == LEASE_NAME,
+                    (LeaderLease.holder == node_id) | (LeaderLease.expires_at < now),
+                )
+                .values(holder=node_id, expires_at=now + ttl)
+            )
+            acquired = result.rowcount == 1
+            if not acquired:
+                result = await session.execute(
+                    sqlite_insert(LeaderLease)
+                    .values(name=LEASE_NAME, holder=node_id, expires_at=now + ttl)
+                    .on_conflict_do_nothing(index_elements=["name"])
+                )
+                acquired = result.rowcount == 1
+            await session.commit()
+        return acquired
+
+    async def release(self, node_id: str):
+        async with db.lease_session() as session:
+            await session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == LEASE_NAME, LeaderLease.holder == node_id)
+                .values(expires_at=0)
+            )
+            await session.commit()
+
+    async def current_leader(self) -> Optional[str]:
+        async with db.read_session() as session:
+            result = await session.execute(
+                select(LeaderLease).where(LeaderLease.name == LEASE_NAME)
+            )
+            lease = result.scalar_one_or_none()
+        if lease is None or lease.expires_at < time.time():
+            return None
+        return lease.holder
+
+
+class NATSKVLeaseBackend(LeaseBackend):
+    """
+    Аренда в NATS JetStream KV (для реплик на разных машинах).
+
+    Ключ живет ttl секунд (TTL бакета). Захват - create (только если ключа нет),
+    продление - update с проверкой ревизии, поэтому чужую аренду перезаписать нельзя.
+    """
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+        self.kv = None
+        self.revision: Optional[int] = None
+
+    async def _kv(self, ttl: float):
+        if self.kv is None:
+            js = nats_client.nc.jetstream()
+            try:
+                self.kv = await js.key_value(self.bucket)
+            except Exception:
+                self.kv = await js.create_key_value(KeyValueConfig(bucket=self.bucket, ttl=ttl))
+        return self.kv
+
+    async def acquire(self, node_id: str, ttl: float) -> bool:
+        kv = await self._kv(ttl)
+        if self.revision is not None:
+            try:
+                self.revision = await kv.update(LEASE_NAME, node_id.encode(), last=self.revision)
+                return True
+            except KeyWrongLastSequenceError:
+                self.revision = None
+        try:
+            self.revision = await kv.create(LEASE_NAME, node_id.encode())
+            return True
+        except KeyWrongLastSequenceError:
+            return False
+
+    async def release(self, node_id: str):
+        if self.kv is not None and self.revision is not None:
+            try:
+                await self.kv.delete(LEASE_NAME, last=self.revision)
+            finally:
+                self.revision = None
+
+    async def current_leader(self) -> Optional[str]:
+        kv = await self._kv(get_settings().leader_lease_ttl)
+        try:
+            entry = await kv.get(LEASE_NAME)
+        except KeyNotFoundError:
+            return None
+        return entry.value.decode() if entry.value else None
+
+
+def create_lease_backend(name: str) -> LeaseBackend:
+    if name == "db":
+        return DBLeaseBackend()
+    if name == "nats_kv":
+        return NATSKVLeaseBackend(get_settings().leader_kv_bucket)
+    if name == "memory":
+        return MemoryLeaseBackend()
+    raise ValueError(f"Unknown leader_election backend: {name}")
+
+
+class LeaderElector:
+    """
+    Выбор одного узла, который крутит фоновые задачи.
+
+    Каждые ttl/3 секунды узел пытается захватить/продлить аренду. Лидер,
+    который не смог продлить аренду, слагает полномочия до ее истечения,
+    поэтому два лидера одновременно не работают; после падения лидера
+    другой узел подхватывает задачи не позже чем через ttl.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.node_id = self.settings.node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.backend: Optional[LeaseBackend] = None
+        self.is_leader = False
+        self.leader: Optional[str] = None
+        self.task = None
+        self._last_renewed = 0.0
+        self._on_elected: Optional[Callable[[], Awaitable]] = None
+        self._on_demoted: Optional[Callable[[], Awaitable]] = None
+
+    async def start(
+        self,
+        on_elected: Callable[[], Awaitable],
+        on_demoted: Callable[[], Awaitable],
+        backend: Optional[LeaseBackend] = None
+    ):
+        self.backend = backend or create_lease_backend(self.settings.leader_election)
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        await self.tick()
+        self.task = asyncio.create_task(self._loop())
+        logger.info(f"Выбор лидера запущен: узел {self.node_id}, бэкенд {self.settings.leader_election}")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.is_leader:
+            await self._set_leader(False)
+            try:
+                await self.backend.release(self.node_id)
+            except Exception as e:
+                logger.error(f"Не удалось отпустить аренду лидера: {e}")
+
+    async def tick(self):
+        """Одна попытка захватить/продлить аренду."""
+        ttl = self.settings.leader_lease_ttl
+        now = time.time()
+        try:
+            acquired = await self.backend.acquire(self.node_id, ttl)
+            if acquired:
+                self._last_renewed = now
+                self.leader = self.node_id
+            else:
+                self.leader = await self.backend.current_leader()
+        except Exception as e:
+            logger.error(f"Ошибка аренды лидера: {e}")
+            # Не знаем, продлена ли аренда: лидер слагает полномочия заранее
+            acquired = self.is_leader and now - self._last_renewed < ttl * 2 / 3
+        await self._set_leader(acquired)
+
+    async def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if not leader:
+            logger.warning(f"Узел {self.node_id} больше не лидер")
+            await self._demote()
+            return
+        logger.info(f"Узел {self.node_id} стал лидером")
+        try:
+            await self._on_elected()
+        except Exception as e:
+            # Задачи не запустились: не держим аренду, пусть ее возьмет другой узел
+            # (или этот - на следующей попытке)
+            logger.error(f"Не удалось запустить задачи лидера: {e}")
+            self.is_leader = False
+            self.leader = None
+            await self._demote()
+            try:
+                await self.backend.release(self.node_id)
+            except Exception as e:
+                logger.error(f"Не удалось отпустить аренду лидера: {e}")
+
+    async def _demote(self):
+        try:
+            await self._on_demoted()
+        except Exception as e:
+            logger.error(f"Ошибка остановки задач лидера: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.settings.leader_lease_ttl / 3)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Ошибка выбора лидера: {e}")
+
+    def get_status(self) -> dict:
+        return {
+            "node_id": self.node_id,
+            "is_leader": self.is_leader,
+            "leader": self.leader,
+        }
+
+
+leader_elector = LeaderElector()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+from typing import List, Optional
+from app.config import get_settings
+from app.encoding import EncodedFrame, dumps
+from app.nats.client import nats_client
+from app.ws.manager import ws_manager, RoutedEvent
+
+logger = logging.getLogger(__name__)
+
+
+class NATSFanout:
+    """
+    Раздача обновлений веб-сокетам из NATS (ws_fanout_mode="nats").
+
+    Каждый воркер подписан на subject событий и кормит свой WebSocketManager,
+    поэтому клиенты могут быть подключены к любому воркеру/реплике, а цикл
+    обновления курсов работает только на одном узле. Сообщения, пришедшие
+    в течение ws_fanout_window_ms, рассылаются одной пачкой (для клиентов batch).
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.subject: Optional[str] = None
+        self._pending: List[RoutedEvent] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.messages_received = 0
+
+    async def start(self) -> bool:
+        """
+        Подписаться на события.
+
+        Без NATS события не дошли бы ни до одного клиента, поэтому тогда
+        процесс переключается на локальную рассылку (ws_fanout_mode="local").
+        """
+        if not nats_client.nc:
+            self._fall_back("NATS не подключен")
+            return False
+        base = self.settings.nats_subject
+        subject = f"{base}.>" if self.settings.nats_per_currency_subjects else base
+        try:
+            await nats_client.subscribe(subject, self._on_message)
+        except Exception as e:
+            self._fall_back(f"не удалось подписаться на {subject}: {e}")
+            return False
+        self.subject = subject
+        return True
+
+    def _fall_back(self, reason: str):
+        logger.warning(
+            f"WS_FANOUT_MODE=nats, но {reason} - события рассылаются веб-сокетам локально, "
+            "их получат только клиенты узла, который обновляет курсы"
+        )
+        self.settings.ws_fanout_mode = "local"
+
+    async def stop(self):
+        if self.subject:
+            await nats_client.unsubscribe(self.subject)
+            self.subject = None
+        if self._flush_task:
+            self._flush_task.cancel()
+
+    async def _on_message(self, msg):
+        try:
+            self.messages_received += 1
+            # Кэш курсов обновляется отдельно, через store_sync
+            events = self._parse(msg.subject, msg.data)
+            self._pending.extend(events)
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._flush_later())
+        except Exception as e:
+            logger.error(f"Ошибка обработки сообщения NATS {msg.subject}: {e}")
+
+    def _parse(self, subject: str, data: bytes) -> List[RoutedEvent]:
+        """Разбор сообщения в (код, тип, кадр); одиночное событие не декодируется."""
+        if self.settings.nats_per_currency_subjects and subject != nats_client.batch_subject():
+            # currency.updates.<type>.<code>
+            _, c_type, code = subject.rsplit(".", 2)
+            return [(code, c_type, EncodedFrame(data))]
+
+        message = json.loads(data)
+        if message.get("type") == "batch":
+            return [
+                (e["currency"]["code"], e["currency"]["type"], EncodedFrame(dumps(e)))
+                for e in message.get("events", [])
+            ]
+        currency = message["currency"]
+        return [(currency["code"], currency["type"], EncodedFrame(data))]
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.settings.ws_fanout_window_ms / 1000)
+        events, self._pending = self._pending, []
+        await ws_manager.broadcast_events(events, self.settings.event_batch_size)
+
+
+nats_fanout = NATSFanout()
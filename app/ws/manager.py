@@ -1,58 +1,511 @@
 from fastapi import WebSocket
+from collections import OrderedDict
+from app.config import get_settings
+from app.encoding import BinaryFrame, EncodedFrame, encode_batches, encode_compact_batches
+from app.metrics import COUNT_BUCKETS, metrics, ws_broadcast_seconds
+from app.services.rate_store import rate_store
+import asyncio
 import json
 import logging
-from typing import Set
+import time
+from itertools import count
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Политики для медленных клиентов, у которых переполнилась очередь
+POLICY_DROP_OLDEST = "drop_oldest"  # выкидываем самое старое сообщение
+POLICY_CONFLATE = "conflate"        # по ключу (код валюты) оставляем только последнее
+POLICY_DISCONNECT = "disconnect"    # отключаем клиента
+SLOW_CONSUMER_POLICIES = (POLICY_DROP_OLDEST, POLICY_CONFLATE, POLICY_DISCONNECT)
+
+# Кодировка событий для клиента: JSON текстом (по умолчанию) или компактный
+# бинарный формат обновлений (см. app/encoding.py), управляющие сообщения - всегда JSON
+ENCODING_JSON = "json"
+ENCODING_COMPACT = "compact"
+WS_ENCODINGS = (ENCODING_JSON, ENCODING_COMPACT)
+
+WILDCARD = "*"
+CURRENCY_TYPES = ("fiat", "crypto", "cbr")
+
+# (код, тип, закодированное событие)
+RoutedEvent = Tuple[str, str, EncodedFrame]
+
+
+class ClientConnection:
+    """Соединение клиента со своей ограниченной очередью отправки."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int,
+        policy: str,
+        batch: bool = False,
+        encoding: str = ENCODING_JSON
+    ):
+        self.websocket = websocket
+        self.batch = batch  # клиент получает одно сообщение "batch" за цикл
+        self.compact = encoding == ENCODING_COMPACT
+        # Подписки: "*" - все валюты, иначе по кодам и/или типам
+        self.wildcard = False
+        self.codes: Set[str] = set()
+        self.types: Set[str] = set()
+        self.max_queue = max_queue
+        self.policy = policy
+        # ключ -> сообщение, порядок вставки = порядок отправки
+        self.pending: "OrderedDict[Any, Any]" = OrderedDict()
+        self.wakeup = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.conflated = 0
+        self._seq = count()
+
+    def enqueue(self, message: Any, key: Optional[str] = None) -> bool:
+        """
+        Положить сообщение в очередь без ожидания.
+
+        Возвращает False, если клиента нужно отключить по политике.
+        """
+        if self.policy == POLICY_CONFLATE and key is not None and key in self.pending:
+            # Заменяем устаревшее значение на месте, очередь не растет
+            self.pending[key] = message
+            self.conflated += 1
+            return True
+
+        if len(self.pending) >= self.max_queue:
+            if self.policy == POLICY_DISCONNECT:
+                return False
+            self.pending.popitem(last=False)
+            self.dropped += 1
+
+        if self.policy != POLICY_CONFLATE or key is None:
+            key = ("seq", next(self._seq))
+        self.pending[key] = message
+        self.wakeup.set()
+        return True
+
+    async def next_message(self) -> Any:
+        """Дождаться следующего сообщения из очереди."""
+        while not self.pending:
+            self.wakeup.clear()
+            await self.wakeup.wait()
+        _, message = self.pending.popitem(last=False)
+        return message
+
 
 class WebSocketManager:
     """Управление Веб-сокетом."""
-    
+
     def __init__(self):
-        self.active_connections: Set[WebSocket] = set()
-    
-    async def connect(self, websocket: WebSocket):
-        """Принимаем и регистрируем соединение веб-сокета."""
+        self.settings = get_settings()
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.dropped_messages = 0
+        self.conflated_messages = 0
+        self.evicted_connections = 0
+
+        # Индекс подписок: кто хочет получать какой код / тип
+        self.wildcard_subscribers: Set[ClientConnection] = set()
+        self.code_subscribers: Dict[str, Set[ClientConnection]] = {}
+        self.type_subscribers: Dict[str, Set[ClientConnection]] = {}
+
+        policy = self.settings.ws_slow_consumer_policy
+        if policy not in SLOW_CONSUMER_POLICIES:
+            logger.warning(f"Неизвестная политика ws_slow_consumer_policy={policy}, используем {POLICY_DROP_OLDEST}")
+            policy = POLICY_DROP_OLDEST
+        self.policy = policy
+
+        # id валют, уже разосланные клиентам compact (полным словарем или добавкой)
+        self._announced_ids: Set[int] = set()
+        rate_store.add_listener(self._on_rates_changed)
+
+    def _on_rates_changed(self, codes: Optional[List[str]]):
+        """
+        Новые валюты (из циклов источников, API или другого процесса) -
+        сообщение "codes" с добавкой словаря клиентам compact. Кладется в
+        очередь раньше событий цикла: кэш обновляется до рассылки.
+        """
+        if codes is None:
+            self._announced_ids = {c.id for c in rate_store.all()}
+            message = self.codes_message()
+        else:
+            added = []
+            for code in codes:
+                currency = rate_store.get(code)
+                if currency is not None and currency.id not in self._announced_ids:
+                    self._announced_ids.add(currency.id)
+                    added.append(currency)
+            if not added:
+                return
+            message = {"type": "codes", "codes": [[c.id, c.code, c.type] for c in added]}
+
+        compact = [conn for conn in self.active_connections.values() if conn.compact]
+        if not compact:
+            return
+        frame = EncodedFrame.encode(message)
+        for conn in compact:
+            if not conn.enqueue(frame):
+                self._evict(conn.websocket)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        batch: bool = False,
+        codes: Iterable[str] = (),
+        types: Iterable[str] = (),
+        encoding: str = ENCODING_JSON
+    ):
+        """
+        Принимаем и регистрируем соединение веб-сокета.
+
+        Без codes/types клиент подписан на все валюты ("*").
+        """
         await websocket.accept()
-        self.active_connections.add(websocket)
+        conn = ClientConnection(websocket, self.settings.ws_send_queue_size, self.policy, batch, encoding)
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.active_connections[websocket] = conn
+        codes, types = list(codes), list(types)
+        if codes or types:
+            rejected = self._subscribe(conn, codes, types)
+            if any(rejected):
+                await self.send_personal(websocket, self._rejected_message(*rejected))
+        else:
+            self._subscribe(conn, [WILDCARD], [])
         logger.info(f"Веб-сокет подключен. Активные соедниения: {len(self.active_connections)}")
-    
+
     async def disconnect(self, websocket: WebSocket):
         """Отключение соединения веб-сокета."""
-        self.active_connections.discard(websocket)
+        self._remove(websocket)
+
+    def _remove(self, websocket: WebSocket) -> bool:
+        """Убрать соединение из активных и остановить его задачу отправки."""
+        conn = self.active_connections.pop(websocket, None)
+        if conn is None:
+            return False
+        self.dropped_messages += conn.dropped
+        self.conflated_messages += conn.conflated
+        self._unsubscribe(conn, [WILDCARD, *conn.codes], list(conn.types))
+        if conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
         logger.info(f"Веб-сокет отключен. Активные соедниения: {len(self.active_connections)}")
-    
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients."""
+        return True
+
+    def _subscribe(
+        self, conn: ClientConnection, codes: Iterable[str], types: Iterable[str]
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Добавить подписки клиента в индекс.
+
+        Возвращает отклоненные коды (сверх ws_max_subscriptions) и типы
+        (неизвестные) - о них клиенту сообщается ошибкой.
+        """
+        rejected_codes, rejected_types = [], []
+        for code in codes:
+            code = code.upper()
+            if code == WILDCARD:
+                conn.wildcard = True
+                self.wildcard_subscribers.add(conn)
+            elif code in conn.codes or len(conn.codes) < self.settings.ws_max_subscriptions:
+                conn.codes.add(code)
+                self.code_subscribers.setdefault(code, set()).add(conn)
+            else:
+                rejected_codes.append(code)
+        for c_type in types:
+            c_type = c_type.lower()
+            if c_type in CURRENCY_TYPES:
+                conn.types.add(c_type)
+                self.type_subscribers.setdefault(c_type, set()).add(conn)
+            else:
+                rejected_types.append(c_type)
+        return rejected_codes, rejected_types
+
+    def _unsubscribe(self, conn: ClientConnection, codes: Iterable[str], types: Iterable[str]):
+        """Убрать подписки клиента из индекса."""
+        for code in codes:
+            code = code.upper()
+            if code == WILDCARD:
+                conn.wildcard = False
+                self.wildcard_subscribers.discard(conn)
+                continue
+            conn.codes.discard(code)
+            subscribers = self.code_subscribers.get(code)
+            if subscribers is not None:
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self.code_subscribers[code]
+        for c_type in types:
+            c_type = c_type.lower()
+            conn.types.discard(c_type)
+            subscribers = self.type_subscribers.get(c_type)
+            if subscribers is not None:
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self.type_subscribers[c_type]
+
+    def _subscribers(self, code: str, c_type: str) -> Iterable[ClientConnection]:
+        """Клиенты, подписанные на валюту: без дублей, без перебора всех соединений."""
+        yield from self.wildcard_subscribers
+        for conn in self.code_subscribers.get(code, ()):
+            if not conn.wildcard:
+                yield conn
+        for conn in self.type_subscribers.get(c_type, ()):
+            if not conn.wildcard and code not in conn.codes:
+                yield conn
+
+    async def _writer(self, conn: ClientConnection):
+        """Отдельная задача отправки для каждого клиента."""
+        try:
+            while True:
+                message = await conn.next_message()
+                if isinstance(message, EncodedFrame):
+                    # Один и тот же уже закодированный текст для всех клиентов
+                    await conn.websocket.send_text(message.text)
+                elif isinstance(message, BinaryFrame):
+                    await conn.websocket.send_bytes(message.data)
+                else:
+                    await conn.websocket.send_json(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка отправки сообщения на веб-сокет: {e}")
+            await self.disconnect(conn.websocket)
+
+    def _evict(self, websocket: WebSocket):
+        """Отключить медленного клиента, закрытие сокета - в фоне."""
+        if not self._remove(websocket):
+            return
+        self.evicted_connections += 1
+        logger.warning("Веб-сокет не успевает читать сообщения, отключаем")
+        asyncio.create_task(self._close(websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=1)
+        except Exception:
+            pass
+
+    async def broadcast(self, message: Any, key: Optional[str] = None, batch: Optional[bool] = None):
+        """
+        Broadcast message to all connected clients.
+
+        Не ждет отправки: сообщение кладется в очередь каждого клиента,
+        key (код валюты) используется политикой conflate. Если batch задан,
+        сообщение получают только клиенты с этим режимом.
+        """
         if not self.active_connections:
             logger.debug("Нет активных соединений broadcast")
             return
-        
-        disconnected = []
-        for websocket in self.active_connections:
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Ошибка отправки сообщения на веб-сокет: {e}")
-                disconnected.append(websocket)
-        
-        # Убераем соедниение
-        for ws in disconnected:
-            await self.disconnect(ws)
-    
+
+        started = time.perf_counter()
+        slow = [
+            websocket for websocket, conn in self.active_connections.items()
+            if (batch is None or conn.batch == batch) and not conn.enqueue(message, key)
+        ]
+
+        # Убераем медленные соедниения, не блокируя рассылку
+        for ws in slow:
+            self._evict(ws)
+        ws_broadcast_seconds.observe(time.perf_counter() - started)
+
+    async def broadcast_events(self, events: List[RoutedEvent], batch_size: int = 0):
+        """
+        Разослать события цикла только подписанным клиентам.
+
+        Клиенты в режиме single получают событие на валюту, клиенты в режиме
+        batch - сообщения "batch" только с их валютами. Полный батч для
+        подписчиков "*" склеивается один раз на кодировку и общий для всех.
+        """
+        if not self.active_connections or not events:
+            return
+
+        started = time.perf_counter()
+        slow: Set[ClientConnection] = set()
+        per_client: Dict[ClientConnection, List[EncodedFrame]] = {}
+        for code, c_type, frame in events:
+            for conn in self._subscribers(code, c_type):
+                if conn.batch:
+                    if not conn.wildcard:
+                        per_client.setdefault(conn, []).append(frame)
+                elif not conn.enqueue(frame.compact if conn.compact else frame, code):
+                    slow.add(conn)
+
+        full = {}
+        for conn in self.wildcard_subscribers:
+            if not conn.batch:
+                continue
+            if conn.compact not in full:
+                frames = [frame for _, _, frame in events]
+                full[conn.compact] = self._encode_batches(frames, batch_size, conn.compact)
+            for frame in full[conn.compact]:
+                if not conn.enqueue(frame):
+                    slow.add(conn)
+        for conn, frames in per_client.items():
+            for frame in self._encode_batches(frames, batch_size, conn.compact):
+                if not conn.enqueue(frame):
+                    slow.add(conn)
+
+        for conn in slow:
+            self._evict(conn.websocket)
+        ws_broadcast_seconds.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _encode_batches(frames: List[EncodedFrame], batch_size: int, compact: bool) -> list:
+        if compact:
+            return encode_compact_batches(frames, batch_size)
+        return encode_batches(frames, batch_size)
+
     async def send_personal(self, websocket: WebSocket, message: dict):
         """Отправки специфичного сообщения."""
+        conn = self.active_connections.get(websocket)
+        if conn is not None:
+            if not conn.enqueue(message):
+                self._evict(websocket)
+            return
         try:
             await websocket.send_json(message)
         except Exception as e:
             logger.error(f"Ошибка отправки специфичного сообщения в веб-сокет: {e}")
             await self.disconnect(websocket)
-    
+
+    async def handle_client_message(self, websocket: WebSocket, data: str):
+        """
+        Обработка управляющих сообщений клиента.
+
+        {"action": "set_mode", "mode": "batch" | "single"}
+        {"action": "set_encoding", "encoding": "json" | "compact"}
+        {"action": "subscribe" | "unsubscribe", "codes": ["BTC", "*"], "types": ["crypto"]}
+        """
+        try:
+            message = json.loads(data)
+        except ValueError:
+            await self.send_personal(websocket, {"type": "error", "message": "Invalid JSON"})
+            return
+        if not isinstance(message, dict):
+            await self.send_personal(websocket, {"type": "error", "message": "Expected JSON object"})
+            return
+
+        conn = self.active_connections.get(websocket)
+        if conn is None:
+            return
+
+        action = message.get("action")
+        if action == "set_mode":
+            mode = message.get("mode")
+            if mode not in ("batch", "single"):
+                await self.send_personal(websocket, {"type": "error", "message": f"Unknown mode: {mode}"})
+                return
+            conn.batch = mode == "batch"
+            await self.send_personal(websocket, {"type": "mode", "mode": mode})
+        elif action == "set_encoding":
+            encoding = message.get("encoding")
+            if encoding not in WS_ENCODINGS:
+                await self.send_personal(websocket, {"type": "error", "message": f"Unknown encoding: {encoding}"})
+                return
+            conn.compact = encoding == ENCODING_COMPACT
+            await self.send_personal(websocket, {"type": "encoding", "encoding": encoding})
+            if conn.compact:
+                await self.send_personal(websocket, self.codes_message())
+        elif action in ("subscribe", "unsubscribe"):
+            codes = message.get("codes") or []
+            types = message.get("types") or []
+            if not isinstance(codes, list) or not isinstance(types, list):
+                await self.send_personal(websocket, {"type": "error", "message": "codes/types must be lists"})
+                return
+            codes = [str(c) for c in codes]
+            types = [str(t) for t in types]
+            if action == "subscribe":
+                rejected = self._subscribe(conn, codes, types)
+                if any(rejected):
+                    await self.send_personal(websocket, self._rejected_message(*rejected))
+            else:
+                self._unsubscribe(conn, codes, types)
+            await self.send_personal(websocket, self._subscriptions_message(conn))
+        else:
+            await self.send_personal(websocket, {"type": "error", "message": f"Unknown action: {action}"})
+
+    @staticmethod
+    def codes_message() -> dict:
+        """
+        Словарь id -> код для клиентов compact (бинарные обновления несут только id).
+
+        Полный словарь - при подключении; новые валюты потом приходят таким же
+        сообщением только с ними, записи добавляются к уже известным.
+        """
+        return {
+            "type": "codes",
+            "codes": [[c.id, c.code, c.type] for c in rate_store.all()],
+        }
+
+    def _rejected_message(self, codes: List[str], types: List[str]) -> dict:
+        return {
+            "type": "error",
+            "message": (
+                f"Subscriptions rejected: at most {self.settings.ws_max_subscriptions} codes "
+                f"per connection, types must be one of {', '.join(sorted(CURRENCY_TYPES))}"
+            ),
+            "rejected": {"codes": codes, "types": types},
+        }
+
+    @staticmethod
+    def _subscriptions_message(conn: ClientConnection) -> dict:
+        return {
+            "type": "subscriptions",
+            "wildcard": conn.wildcard,
+            "codes": sorted(conn.codes),
+            "types": sorted(conn.types),
+        }
+
+    async def close_all(self):
+        """Остановить задачи отправки всех клиентов."""
+        for websocket in list(self.active_connections):
+            await self.disconnect(websocket)
+
     def get_active_count(self) -> int:
         """Получить активные соединения."""
         return len(self.active_connections)
 
+    def has_clients(self, batch: Optional[bool] = None) -> bool:
+        """Есть ли клиенты (с заданным режимом batch)."""
+        if batch is None:
+            return bool(self.active_connections)
+        return any(conn.batch == batch for conn in self.active_connections.values())
+
+    def get_stats(self) -> dict:
+        """Счетчики очередей отправки."""
+        conns = self.active_connections.values()
+        return {
+            "policy": self.policy,
+            "batch_clients": sum(1 for c in conns if c.batch),
+            "compact_clients": sum(1 for c in conns if c.compact),
+            "wildcard_subscribers": len(self.wildcard_subscribers),
+            "subscribed_codes": len(self.code_subscribers),
+            "queued_messages": sum(len(c.pending) for c in conns),
+            "dropped_messages": self.dropped_messages + sum(c.dropped for c in conns),
+            "conflated_messages": self.conflated_messages + sum(c.conflated for c in conns),
+            "evicted_connections": self.evicted_connections,
+        }
+
+    def collect_metrics(self):
+        """Соединения, очереди и потери для /metrics."""
+        stats = self.get_stats()
+        yield ("currency_ws_connections", "gauge", "Активные веб-сокет соединения",
+               [({}, len(self.active_connections))])
+        yield ("currency_ws_queued_messages", "gauge", "Сообщений в очередях клиентов",
+               [({}, stats["queued_messages"])])
+        # Глубина очередей - снимок в момент запроса, а не на каждой рассылке
+        depths = [len(c.pending) for c in self.active_connections.values()]
+        yield ("currency_ws_queue_depth_max", "gauge", "Самая глубокая очередь клиента",
+               [({}, max(depths, default=0))])
+        yield ("currency_ws_queue_depth_clients", "gauge", "Клиентов с глубиной очереди не больше le",
+               [({"le": str(bound)}, sum(1 for d in depths if d <= bound)) for bound in COUNT_BUCKETS]
+               + [({"le": "+Inf"}, len(depths))])
+        yield ("currency_ws_dropped_messages_total", "counter", "Сообщений выброшено из очередей медленных клиентов",
+               [({"reason": "drop_oldest"}, stats["dropped_messages"]),
+                ({"reason": "conflated"}, stats["conflated_messages"])])
+        yield ("currency_ws_evicted_connections_total", "counter", "Медленных клиентов отключено",
+               [({}, stats["evicted_connections"])])
+
 
 # Global WebSocket manager
 ws_manager = WebSocketManager()
+metrics.add_collector(ws_manager.collect_metrics)
@@ -0,0 +1,448 @@
+"""
+Сквозной бенчмарк: источники-заглушки -> приложение -> WebSocket/NATS клиенты.
+
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --currencies 9000 --clients 500 --interval 1 --duration 30
+    python -m benchmarks.e2e --batch --nats-url nats://127.0.0.1:4222 --nats-subscribers 2
+
+Поднимает локальные заглушки exchangerate / Binance / ЦБ (в отдельном
+потоке), заливает в чистую БД --currencies валют (поровну на источник) и
+запускает приложение отдельным процессом (uvicorn), направив на заглушки
+через *_API_URL. Каждый запрос к заглушке сдвигает --change долю цен и
+запоминает момент сдвига; --clients веб-сокет клиентов (и --nats-subscribers
+подписчиков NATS) по коду и курсу из события считают задержку от тика до
+клиента. Задержку разбирают только первые --measure-clients клиентов,
+остальные только читают, чтобы не мерить разбор JSON в самом бенчмарке.
+
+Отчет: длительность циклов источников (из /api/v1/tasks/status), задержка
+тик -> клиент, сообщения и байты, RSS и CPU процесса приложения (из /proc,
+только Linux). --json печатает результат одной строкой для сравнения
+между прогонами.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+import websockets
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app.config import Settings
+from app.db.database import Database
+from app.encoding import decode_compact, dumps, loads
+from app.services.currency_service import CurrencyService
+from benchmarks.stats import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = ("fiat", "binance", "cbr")
+
+
+class StubState:
+    """Цены заглушек и моменты их изменения по (код в БД, курс)."""
+
+    def __init__(self, currencies: int, change: float, seed: int = 0):
+        self.rnd = random.Random(seed)
+        self.change = change
+        per_source = max(1, currencies // len(SOURCES))
+        self.prices: Dict[str, Dict[str, float]] = {
+            "fiat": {f"F{i:05d}": round(1 + i * 0.01, 6) for i in range(per_source)},
+            "binance": {f"B{i:05d}": round(10 + i * 0.1, 6) for i in range(per_source)},
+            "cbr": {f"C{i:05d}": round(50 + i * 0.01, 6) for i in range(per_source)},
+        }
+        self.ticks: Dict[Tuple[str, float], float] = {}
+        self.requests = {source: 0 for source in SOURCES}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stored_code(source: str, code: str) -> str:
+        """Код валюты в приложении (как его строят провайдеры)."""
+        if source == "fiat":
+            return f"USD{code}"
+        if source == "cbr":
+            return f"{code}RUB"
+        return code
+
+    def seed_rows(self) -> List[Tuple[str, str, str, float]]:
+        rows = []
+        for source, c_type in (("fiat", "fiat"), ("binance", "crypto"), ("cbr", "cbr")):
+            for code, price in self.prices[source].items():
+                rows.append((c_type, self.stored_code(source, code), code, price))
+        return rows
+
+    def tick(self, source: str) -> Dict[str, float]:
+        """Сдвинуть долю цен источника и запомнить, когда это случилось."""
+        with self._lock:
+            prices = self.prices[source]
+            now = time.perf_counter()
+            moved = self.rnd.sample(sorted(prices), max(1, int(len(prices) * self.change)))
+            for code in moved:
+                prices[code] = round(prices[code] * (1 + self.rnd.uniform(-0.001, 0.001)), 6)
+                self.ticks[(self.stored_code(source, code), prices[code])] = now
+            self.requests[source] += 1
+            return dict(prices)
+
+
+def stub_app(state: StubState) -> Starlette:
+    """Заглушки трех источников в формате их настоящих API."""
+
+    def json_response(obj) -> Response:
+        return Response(dumps(obj), media_type="application/json")
+
+    async def fiat(request):
+        rates = state.tick("fiat")
+        return json_response({"base": "USD", "rates": {"USD": 1, **rates}})
+
+    async def binance(request):
+        prices = state.tick("binance")
+        return json_response([
+            {"symbol": f"{code}USDT", "price": str(price)} for code, price in prices.items()
+        ])
+
+    async def cbr(request):
+        prices = state.tick("cbr")
+        return json_response({"Valute": {
+            code: {"CharCode": code, "Nominal": 1, "Name": code, "Value": price}
+            for code, price in prices.items()
+        }})
+
+    return Starlette(routes=[
+        Route("/v4/latest/{base}", fiat),
+        Route("/api/v3/ticker/price", binance),
+        Route("/daily_json.js", cbr),
+    ])
+
+
+class Receiver:
+    """Счетчики и задержки для одного вида клиентов (ws / nats)."""
+
+    def __init__(self, ticks: Dict[Tuple[str, float], float]):
+        self.ticks = ticks
+        self.messages = 0
+        self.bytes = 0
+        self.events = 0
+        self.latencies: List[float] = []
+        self.measure_from = float("inf")
+        # id -> код для encoding=compact (из сообщений "codes" и "created")
+        self.codes: Dict[int, str] = {}
+
+    def count(self, data):
+        self.messages += 1
+        self.bytes += len(data)
+
+    def measure(self, data, received: float):
+        if isinstance(data, bytes) and data[:1] != b"{":
+            # Бинарные обновления encoding=compact
+            for currency_id, rate, _, _ in decode_compact(data):
+                self._record(self.codes.get(currency_id), rate, received)
+            return
+        message = loads(data)
+        if message.get("type") == "codes":
+            self.codes.update((currency_id, code) for currency_id, code, _ in message["codes"])
+            return
+        for event in message.get("events") or [message]:
+            currency = event.get("currency")
+            if not currency:
+                continue
+            self.codes[currency["id"]] = currency["code"]
+            self._record(currency["code"], currency["rate"], received)
+
+    def _record(self, code: Optional[str], rate: float, received: float):
+        self.events += 1
+        ticked = self.ticks.get((code, rate))
+        if ticked is not None and ticked >= self.measure_from:
+            self.latencies.append((received - ticked) * 1000)
+
+
+async def ws_client(url: str, receiver: Receiver, measure: bool):
+    async with websockets.connect(url, max_size=None, open_timeout=30) as websocket:
+        async for data in websocket:
+            received = time.perf_counter()
+            receiver.count(data)
+            if measure:
+                receiver.measure(data, received)
+
+
+async def nats_subscriber(url: str, subject: str, receiver: Receiver):
+    import nats
+
+    nc = await nats.connect(url)
+
+    async def handler(msg):
+        received = time.perf_counter()
+        receiver.count(msg.data)
+        receiver.measure(msg.data, received)
+
+    await nc.subscribe(f"{subject}.>", cb=handler)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await nc.drain()
+
+
+class ProcessSampler:
+    """RSS и процессорное время процесса из /proc."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.rss_kb: List[int] = []
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._start: Optional[Tuple[float, float]] = None
+
+    def _cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime, stime - 12 и 13 поля после имени процесса
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def _rss(self) -> int:
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+        return 0
+
+    def start(self):
+        self._start = (time.perf_counter(), self._cpu_seconds())
+
+    def sample(self):
+        self.rss_kb.append(self._rss())
+
+    def cpu_percent(self) -> float:
+        wall, cpu = self._start
+        return (self._cpu_seconds() - cpu) / max(time.perf_counter() - wall, 1e-9) * 100
+
+
+async def poll_cycles(client: httpx.AsyncClient, cycles: Dict[str, Dict[str, float]], sampler: ProcessSampler,
+                      period: float, measure_from: List[float]):
+    """Длительности циклов источников и память приложения."""
+    while True:
+        sampler.sample()
+        try:
+            status = (await client.get("/api/v1/tasks/status")).json()
+        except httpx.HTTPError:
+            status = {}
+        for name, provider in (status.get("providers") or {}).items():
+            if provider.get("duration_ms") is not None and time.perf_counter() >= measure_from[0]:
+                cycles.setdefault(name, {})[provider["updated_at"]] = provider["duration_ms"]
+        await asyncio.sleep(period)
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Приложение завершилось с кодом {process.returncode}")
+        try:
+            if (await client.get("/api/v1/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Приложение не поднялось")
+
+
+def app_env(args, db_url: str, stub_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": db_url,
+        "EXCHANGERATE_API_URL": f"{stub_url}/v4/latest",
+        "BINANCE_API_URL": stub_url,
+        "CBR_API_URL": f"{stub_url}/daily_json.js",
+        "BASE_CURRENCY": "USD",
+        "PROVIDERS_ENABLED": json.dumps(list(SOURCES)),
+        "PROVIDER_INTERVALS": json.dumps({source: args.interval for source in SOURCES}),
+        "BACKGROUND_TASK_INTERVAL": str(max(1, int(args.interval))),
+        "UPDATE_MODE": "all",
+        "DEFAULT_FIAT_CURRENCIES": "[]",
+        "DEFAULT_CRYPTO_CURRENCIES": "[]",
+        "DEFAULT_CBR_CURRENCIES": "[]",
+        "WS_FANOUT_MODE": "local",
+        "LEADER_ELECTION": "none",
+        "RUN_BACKGROUND_TASKS": "true",
+        "NATS_ENABLED": "true" if args.nats_url else "false",
+    })
+    if args.nats_url:
+        env["NATS_URL"] = args.nats_url
+    return env
+
+
+async def seed(db_url: str, state: StubState):
+    db = Database(Settings(database_url=db_url))
+    await db.connect()
+    try:
+        rows = state.seed_rows()
+        await db.writer.submit(
+            lambda session: CurrencyService.bulk_upsert_currencies(session, rows, commit=False)
+        )
+    finally:
+        await db.disconnect()
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="e2e_bench_")
+    db_url = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+    state = StubState(args.currencies, args.change)
+    await seed(db_url, state)
+
+    stub = uvicorn.Server(uvicorn.Config(
+        stub_app(state), host="127.0.0.1", port=args.stub_port, log_level="warning"
+    ))
+    stub_thread = threading.Thread(target=stub.run, daemon=True)
+    stub_thread.start()
+
+    # Логи приложения - в файл рядом с БД, чтобы не мешали отчету
+    log = open(os.path.join(workdir, "app.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(args.app_port), "--log-level", "warning"],
+        cwd=ROOT, env=app_env(args, db_url, f"http://127.0.0.1:{args.stub_port}"),
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    ws_receiver = Receiver(state.ticks)
+    nats_receiver = Receiver(state.ticks)
+    cycles: Dict[str, Dict[str, float]] = {}
+    tasks: List[asyncio.Task] = []
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.app_port}", timeout=30) as client:
+            await wait_ready(client, process)
+            sampler = ProcessSampler(process.pid)
+
+            ws_url = (
+                f"ws://127.0.0.1:{args.app_port}/ws/currencies?encoding={args.encoding}"
+                + ("&mode=batch" if args.batch else "")
+            )
+            tasks += [
+                asyncio.create_task(ws_client(ws_url, ws_receiver, i < args.measure_clients))
+                for i in range(args.clients)
+            ]
+            if args.nats_url:
+                tasks += [
+                    asyncio.create_task(nats_subscriber(args.nats_url, "currency.updates", nats_receiver))
+                    for _ in range(args.nats_subscribers)
+                ]
+            measure_from = [float("inf")]
+            tasks.append(asyncio.create_task(
+                poll_cycles(client, cycles, sampler, max(0.1, args.interval / 4), measure_from)
+            ))
+
+            # Прогрев: первые циклы и подключение клиентов не считаем
+            await asyncio.sleep(args.warmup)
+            measure_from[0] = ws_receiver.measure_from = nats_receiver.measure_from = time.perf_counter()
+            sampler.start()
+            rss_before = sampler.rss_kb[-1] if sampler.rss_kb else 0
+            await asyncio.sleep(args.duration)
+            cpu = sampler.cpu_percent()
+            sampler.sample()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        stub.should_exit = True
+        stub_thread.join(timeout=5)
+
+    def latency_report(receiver: Receiver) -> dict:
+        values = receiver.latencies
+        return {
+            "messages": receiver.messages,
+            "bytes": receiver.bytes,
+            "measured_events": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(max(values, default=0.0), 2),
+        }
+
+    return {
+        "log": log.name,
+        "currencies": args.currencies,
+        "clients": args.clients,
+        "interval": args.interval,
+        "duration": args.duration,
+        "batch": args.batch,
+        "encoding": args.encoding,
+        "cycles": {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(list(values.values()), 50), 1),
+                "p95_ms": round(percentile(list(values.values()), 95), 1),
+                "max_ms": round(max(values.values(), default=0.0), 1),
+            }
+            for name, values in sorted(cycles.items())
+        },
+        "ws": latency_report(ws_receiver),
+        "nats": latency_report(nats_receiver) if args.nats_url else None,
+        "app_rss_mb": {
+            "start": round(rss_before / 1024, 1),
+            "peak": round(max(sampler.rss_kb, default=0) / 1024, 1),
+        },
+        "app_cpu_percent": round(cpu, 1),
+    }
+
+
+def print_report(result: dict):
+    print(
+        f"{result['currencies']} валют, {result['clients']} клиентов, интервал {result['interval']} с, "
+        f"замер {result['duration']} с, {result['encoding']}{', batch' if result['batch'] else ''}"
+    )
+    print(f"Логи приложения: {result['log']}")
+    print("\nЦиклы источников:")
+    print(f"  {'provider':<10} {'count':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name, c in result["cycles"].items():
+        print(f"  {name:<10} {c['count']:>5} {c['p50_ms']:>8.1f} {c['p95_ms']:>8.1f} {c['max_ms']:>8.1f}")
+    print("\nТик -> клиент:")
+    print(f"  {'':<5} {'messages':>9} {'MB':>8} {'events':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name in ("ws", "nats"):
+        r = result[name]
+        if r is None:
+            continue
+        print(
+            f"  {name:<5} {r['messages']:>9} {r['bytes'] / 1e6:>8.1f} {r['measured_events']:>8} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}"
+        )
+    print(
+        f"\nПриложение: RSS {result['app_rss_mb']['start']} -> {result['app_rss_mb']['peak']} МБ (пик), "
+        f"CPU {result['app_cpu_percent']}%"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--currencies", type=int, default=3000, help="всего валют, поровну на источник")
+    parser.add_argument("--change", type=float, default=0.2, help="доля цен, меняющихся за запрос")
+    parser.add_argument("--clients", type=int, default=50, help="веб-сокет клиентов")
+    parser.add_argument("--measure-clients", type=int, default=5, help="сколько из них мерят задержку")
+    parser.add_argument("--batch", action="store_true", help="клиенты в режиме batch")
+    parser.add_argument("--encoding", choices=["json", "compact"], default="json", help="кодировка событий клиентов")
+    parser.add_argument("--nats-url", default=None, help="NATS для приложения и подписчиков (по умолчанию без NATS)")
+    parser.add_argument("--nats-subscribers", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=1.0, help="интервал источников, с")
+    parser.add_argument("--warmup", type=float, default=5.0, help="прогрев, с")
+    parser.add_argument("--duration", type=float, default=20.0, help="замер, с")
+    parser.add_argument("--app-port", type=int, default=18000)
+    parser.add_argument("--stub-port", type=int, default=18001)
+    parser.add_argument("--json", action="store_true", help="результат одной строкой JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        print_report(result)
@@ -0,0 +1,150 @@
+"""
+Задержка чтения из SQLite во время циклов обновления режима "all".
+
+    python -m benchmarks.sqlite_read_latency
+    python -m benchmarks.sqlite_read_latency --currencies 5000 --cycles 20 --readers 8
+
+Для каждого режима (sqlite_tuning выключен / включен) создается чистая БД,
+в нее заливается --currencies валют, затем --cycles раз переписываются
+все курсы с точками истории (как update_all_mode через db.writer), а
+--readers параллельных читателей все это время читают валюты по коду и
+страницы списка. Читатели по умолчанию работают в отдельном потоке со
+своим event loop, чтобы мерить ожидание блокировок БД, а не занятость
+общего event loop (--same-loop - как в приложении). В конце печатаются
+перцентили задержки чтения, число ошибок ("database is locked") и
+длительность циклов записи.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from app.config import Settings
+from app.db.database import Database
+from app.services.currency_service import CurrencyService
+from app.services.history_service import HistoryService
+from benchmarks.stats import percentile
+
+
+def rows_for(codes, rnd: random.Random):
+    return [("crypto", code, code, round(rnd.uniform(1, 1000), 6)) for code in codes]
+
+
+async def write_cycle(db: Database, rows) -> float:
+    """Один цикл "all": все курсы и точки истории одной задачей писателя."""
+    async def job(session):
+        upserted = await CurrencyService.bulk_upsert_currencies(session, rows, commit=False)
+        await HistoryService.record_rates(
+            session, [(currency.code, currency.rate) for currency, _ in upserted], commit=False
+        )
+        return upserted
+
+    started = time.perf_counter()
+    await db.writer.submit(job)
+    return (time.perf_counter() - started) * 1000
+
+
+async def reader(db: Database, codes, stop: threading.Event, latencies, errors, seed: int):
+    rnd = random.Random(seed)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            async with db.read_session() as session:
+                if rnd.random() < 0.8:
+                    await CurrencyService.get_currency_by_code(session, rnd.choice(codes))
+                else:
+                    await CurrencyService.list_currencies(session, after=rnd.randrange(len(codes)), limit=100)
+        except Exception as e:
+            errors.append(repr(e))
+        else:
+            latencies.append((time.perf_counter() - started) * 1000)
+        # Читатели не должны занимать event loop целиком
+        await asyncio.sleep(0.001)
+
+
+async def read_until(settings: Settings, codes, stop, readers: int):
+    """Читатели со своим event loop и своими соединениями (в отдельном потоке)."""
+    db = Database(settings)
+    await db.connect()
+    latencies, errors = [], []
+    try:
+        await asyncio.gather(*[
+            reader(db, codes, stop, latencies, errors, seed) for seed in range(readers)
+        ])
+    finally:
+        await db.disconnect()
+    return latencies, errors
+
+
+async def run_mode(tuned: bool, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="sqlite_bench_"), "bench.db")
+    settings = Settings(
+        database_url=f"sqlite+aiosqlite:///{path}",
+        sqlite_tuning=tuned,
+        sqlite_read_pool_size=args.readers,
+    )
+    db = Database(settings)
+    await db.connect()
+    rnd = random.Random(0)
+    codes = [f"C{i}USDT" for i in range(args.currencies)]
+    try:
+        await write_cycle(db, rows_for(codes, rnd))
+
+        stop = threading.Event()
+        if args.same_loop:
+            # Как в приложении: чтение и запись делят один event loop
+            readers = asyncio.create_task(read_until(settings, codes, stop, args.readers))
+        else:
+            # Отдельный поток: видно только ожидание блокировок БД
+            readers = asyncio.create_task(asyncio.to_thread(
+                asyncio.run, read_until(settings, codes, stop, args.readers)
+            ))
+        await asyncio.sleep(0.2)
+        cycles = []
+        for _ in range(args.cycles):
+            cycles.append(await write_cycle(db, rows_for(codes, rnd)))
+            await asyncio.sleep(args.pause)
+        stop.set()
+        latencies, errors = await readers
+    finally:
+        await db.disconnect()
+
+    return {
+        "mode": "tuned" if tuned else "default",
+        "reads": len(latencies),
+        "errors": len(errors),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0),
+        "cycle_ms": statistics.mean(cycles) if cycles else 0.0,
+    }
+
+
+async def main(args):
+    results = []
+    for tuned in (False, True):
+        results.append(await run_mode(tuned, args))
+
+    print(f"{args.currencies} валют, {args.cycles} циклов, {args.readers} читателей")
+    print(f"{'mode':<8} {'reads':>7} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'cycle ms':>9}")
+    for r in results:
+        print(
+            f"{r['mode']:<8} {r['reads']:>7} {r['errors']:>6} {r['p50']:>8.2f} {r['p95']:>8.2f} "
+            f"{r['p99']:>8.2f} {r['max']:>8.2f} {r['cycle_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--currencies", type=int, default=5000)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--pause", type=float, default=0.05, help="пауза между циклами, с")
+    parser.add_argument("--same-loop", action="store_true", help="читать в том же event loop, что и писать")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,11 @@
+"""Общие функции для отчетов бенчмарков."""
+
+from typing import Sequence
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Перцентиль p (0-100) без интерполяции, 0 для пустого списка."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
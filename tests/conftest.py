@@ -0,0 +1,33 @@
+import os
+
+import pytest
+import pytest_asyncio
+
+from app.config import Settings
+from app.db.database import Database
+
+
+def make_settings(**overrides) -> Settings:
+    """Настройки без .env и переменных окружения проекта."""
+    values = {
+        "default_fiat_currencies": [],
+        "default_crypto_currencies": [],
+        "default_cbr_currencies": [],
+    }
+    values.update(overrides)
+    return Settings(_env_file=None, **values)
+
+
+@pytest_asyncio.fixture
+async def database(tmp_path):
+    """Отдельная файловая SQLite база."""
+    db = Database()
+    db.settings = make_settings(database_url=f"sqlite+aiosqlite:///{os.path.join(tmp_path, 'test.db')}")
+    await db.connect()
+    yield db
+    await db.disconnect()
+
+
+@pytest.fixture
+def settings():
+    return make_settings()
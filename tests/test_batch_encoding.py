@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from app.encoding import EncodedFrame, encode_batches, loads
+from app.schemas.currency import CurrencyResponse, PriceChangeEvent
+
+
+def event(id, rate):
+    now = datetime(2024, 5, 1, 12, 0)
+    currency = CurrencyResponse(id=id, code=f"C{id}", name=f"c{id}", rate=rate, type="crypto",
+                                updated_at=now, created_at=now)
+    return PriceChangeEvent(type="updated", currency=currency)
+
+
+def test_batches_carry_events_unchanged():
+    events = [event(i, float(i)) for i in range(1, 6)]
+    batches = [loads(frame.data) for frame in encode_batches([EncodedFrame.encode(e) for e in events], 2)]
+
+    assert [(b["type"], b["chunk"], b["chunks"], b["count"]) for b in batches] == [
+        ("batch", 1, 3, 2), ("batch", 2, 3, 2), ("batch", 3, 3, 1),
+    ]
+    parsed = [PriceChangeEvent.model_validate(e) for b in batches for e in b["events"]]
+    assert parsed == events
+
+
+def test_single_batch_without_size():
+    frames = [EncodedFrame.encode(event(1, 1.0))]
+    assert loads(encode_batches(frames)[0].data)["count"] == 1
@@ -0,0 +1,60 @@
+import pytest
+
+from app.providers.binance_stream import BinanceStreamProvider
+from app.tasks import background
+from tests.conftest import make_settings
+
+
+def ticker(symbol, price):
+    return {"s": f"{symbol}USDT", "c": str(price)}
+
+
+@pytest.fixture
+def provider():
+    return BinanceStreamProvider(make_settings())
+
+
+@pytest.mark.asyncio
+async def test_batch_kept_until_processed(provider):
+    provider.apply([ticker("BTC", 100), ticker("ETH", 10)])
+    assert await provider.fetch(None) == {"BTC": 100.0, "ETH": 10.0}
+
+    # Запись упала (mark_processed не вызван), пока шла - пришла новая цена
+    provider.apply([ticker("BTC", 101)])
+    assert await provider.fetch(None) == {"BTC": 101.0, "ETH": 10.0}
+
+    provider.mark_processed()
+    assert await provider.fetch(None) == {}
+
+
+@pytest.mark.asyncio
+async def test_unchanged_price_not_repeated(provider):
+    provider.apply({"stream": "btcusdt@miniTicker", "data": ticker("BTC", 100)})
+    assert await provider.fetch(None) == {"BTC": 100.0}
+    provider.mark_processed()
+
+    provider.apply([ticker("BTC", 100), ticker("BNB", 1), {"s": "BTCEUR", "c": "1"}])
+    assert await provider.fetch(None) == {"BNB": 1.0}
+
+
+@pytest.mark.asyncio
+async def test_failed_write_retried_next_cycle(monkeypatch):
+    settings = make_settings(providers_enabled=["binance_stream"], update_mode="all")
+    monkeypatch.setattr(background, "get_settings", lambda: settings)
+    manager = background.BackgroundTaskManager()
+    stream = manager.providers[0]
+    written = []
+
+    async def update_all_mode(provider, rates):
+        if not written:
+            written.append(None)
+            raise RuntimeError("database is locked")
+        written.append(dict(rates))
+        return len(rates), 0, 0
+
+    monkeypatch.setattr(manager, "update_all_mode", update_all_mode)
+    stream.apply([ticker("BTC", 100)])
+    assert await manager.run_provider(stream) is None
+    assert await manager.run_provider(stream) == (1, 0, 0)
+    assert written[-1] == {"BTC": 100.0}
+    assert await manager.run_provider(stream) == (0, 0, 0)
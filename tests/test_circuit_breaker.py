@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.http import client as client_module
+from app.http.client import CircuitBreaker, CircuitOpenError, HTTPClient
+from tests.conftest import make_settings
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(client_module, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_state_transitions(clock):
+    breaker = CircuitBreaker("fiat", failure_threshold=3, cooldown=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert (breaker.state, breaker.allow()) == ("closed", True)
+
+    breaker.record_failure()
+    assert (breaker.state, breaker.allow(), breaker.times_opened) == ("open", False, 1)
+    assert breaker.retry_in() == 30
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # один пробный запрос
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert (breaker.state, breaker.failures, breaker.allow()) == ("closed", 0, True)
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("fiat", failure_threshold=3, cooldown=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert (breaker.state, breaker.times_opened) == ("open", 2)
+
+    # Пробный запрос потерялся (ни успеха, ни ошибки) - через cooldown пускаем новый
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def http_client(handler, **overrides):
+    client = HTTPClient()
+    client.settings = make_settings(http_retry_backoff=0, http_retry_max_backoff=0, **overrides)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+@pytest.mark.asyncio
+async def test_retries_then_success():
+    statuses = [503, 502, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0))
+
+    client = http_client(handler, http_retries=2)
+    response = await client.get("http://source/", "fiat")
+    assert response.status_code == 200
+    assert client.stats["retries"] == 2
+    assert client.breaker("fiat").state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_breaker_rejects_without_request(clock):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500)
+
+    client = http_client(handler, http_retries=0, http_breaker_failure_threshold=2, http_breaker_cooldown=60)
+    for _ in range(2):
+        assert (await client.get("http://source/", "cbr")).status_code == 500
+    with pytest.raises(CircuitOpenError):
+        await client.get("http://source/", "cbr")
+    assert len(calls) == 2
+    assert client.stats["rejected"] == 1
+    # Автоматы у источников свои
+    assert client.breaker("fiat").allow()
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.encoding import (
+    BinaryFrame, EncodedFrame, decode_compact, encode_compact, encode_compact_batches, loads,
+)
+from app.schemas.currency import CurrencyResponse, PriceChangeEvent
+
+UPDATED_AT = datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+
+def event(id, rate, previous=None, event_type="updated"):
+    currency = CurrencyResponse(
+        id=id, code=f"C{id}", name=f"c{id}", rate=rate, type="crypto", previous_rate=previous,
+        updated_at=UPDATED_AT, created_at=UPDATED_AT,
+    )
+    return EncodedFrame.encode(PriceChangeEvent(type=event_type, currency=currency))
+
+
+def test_round_trip():
+    frames = [event(1, 101.5, 100.0), event(70000, 1e-8, None), event(3, 123456789.123, 0.5)]
+    data = encode_compact(frames)
+    assert len(data) == 6 + 28 * 3
+
+    ts = UPDATED_AT.replace(tzinfo=timezone.utc).timestamp()
+    assert decode_compact(data) == [
+        (1, 101.5, 100.0, ts),
+        (70000, 1e-8, None, ts),
+        (3, 123456789.123, 0.5, ts),
+    ]
+
+
+def test_empty_and_bad_version():
+    assert decode_compact(encode_compact([])) == []
+    data = bytearray(encode_compact([event(1, 1.0)]))
+    data[0] = 2
+    with pytest.raises(ValueError):
+        decode_compact(bytes(data))
+
+
+def test_frame_compact_only_for_updates():
+    updated, created = event(1, 2.0, 1.0), event(2, 5.0, event_type="created")
+    assert isinstance(updated.compact, BinaryFrame)
+    assert updated.compact is updated.compact  # кодируется один раз
+    assert decode_compact(updated.compact.data)[0][:3] == (1, 2.0, 1.0)
+    assert created.compact is created
+
+
+def test_batches_send_created_first():
+    frames = [event(1, 1.0, 0.5), event(2, 2.0, event_type="created"), event(3, 3.0, 2.5), event(4, 4.0, 3.5)]
+    messages = encode_compact_batches(frames, size=2)
+
+    assert isinstance(messages[0], EncodedFrame)
+    batch = loads(messages[0].data)
+    assert [e["currency"]["id"] for e in batch["events"]] == [2]
+    decoded = [decode_compact(m.data) for m in messages[1:]]
+    assert [[row[0] for row in rows] for rows in decoded] == [[1, 3], [4]]
@@ -0,0 +1,88 @@
+import httpx
+import pytest
+
+from app.providers.base import NOT_MODIFIED
+from app.providers.fiat import FiatProvider
+from app.tasks import background
+from tests.conftest import make_settings
+
+BODY = b'{"rates": {"USD": 1, "EUR": 0.9}}'
+
+
+class FakeClient:
+    """Отвечает заданными ответами и запоминает заголовки запросов."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def get(self, url, name, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        status, body, response_headers = self.responses.pop(0)
+        return httpx.Response(status, content=body, headers=response_headers,
+                              request=httpx.Request("GET", url))
+
+
+@pytest.fixture
+def provider():
+    return FiatProvider(make_settings())
+
+
+@pytest.mark.asyncio
+async def test_validators_sent_only_after_processed(provider):
+    client = FakeClient(
+        (200, BODY, {"etag": '"v1"', "last-modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+        (200, BODY, {"etag": '"v1"'}),
+        (304, b"", {}),
+    )
+    assert await provider.fetch(client) == BODY
+    # Документ не записан - повторный запрос без валидаторов
+    assert await provider.fetch(client) == BODY
+    assert client.requests[1] == {}
+
+    provider.mark_processed()
+    assert await provider.fetch(client) is NOT_MODIFIED
+    assert client.requests[2] == {"If-None-Match": '"v1"'}
+
+
+@pytest.mark.asyncio
+async def test_same_body_skipped_by_hash(provider):
+    # Сервер без ETag/Last-Modified: сравниваем хэш тела
+    client = FakeClient((200, BODY, {}), (200, BODY, {}), (200, BODY.replace(b"0.9", b"0.8"), {}))
+    assert await provider.fetch(client) == BODY
+    provider.mark_processed()
+    assert await provider.fetch(client) is NOT_MODIFIED
+    assert await provider.fetch(client) != BODY
+
+
+@pytest.mark.asyncio
+async def test_invalidate_forgets_validators(provider):
+    client = FakeClient((200, BODY, {"etag": '"v1"'}), (200, BODY, {"etag": '"v1"'}))
+    await provider.fetch(client)
+    provider.mark_processed()
+    provider.invalidate()
+    assert await provider.fetch(client) == BODY
+    assert client.requests[1] == {}
+
+
+@pytest.mark.asyncio
+async def test_not_modified_cycle_does_not_write(monkeypatch):
+    settings = make_settings(providers_enabled=["fiat"])
+    monkeypatch.setattr(background, "get_settings", lambda: settings)
+    manager = background.BackgroundTaskManager()
+    fiat = manager.providers[0]
+    client = FakeClient((200, BODY, {"etag": '"v1"'}), (304, b"", {}))
+    monkeypatch.setattr(background, "http_client", client)
+    writes = []
+
+    async def update_all_mode(provider, rates):
+        writes.append(rates)
+        return len(rates), 0, 0
+
+    monkeypatch.setattr(manager, "update_all_mode", update_all_mode)
+    monkeypatch.setattr(manager, "update_default_mode", update_all_mode)
+
+    assert await manager.run_provider(fiat) == (1, 0, 0)
+    assert await manager.run_provider(fiat) == (0, 0, 0)
+    assert writes == [{"EUR": 0.9}]
+    assert fiat.last_status["not_modified"] == 1
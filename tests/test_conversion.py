@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.schemas.currency import CurrencyResponse
+from app.services import conversion
+from app.services.conversion import ConversionEngine, split_pair
+from app.services.rate_store import RateStore
+from tests.conftest import make_settings
+
+
+def currency(id, code, rate, c_type):
+    now = datetime.utcnow()
+    return CurrencyResponse(id=id, code=code, name=code, rate=rate, type=c_type,
+                            updated_at=now, created_at=now)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = RateStore()
+    monkeypatch.setattr(conversion, "rate_store", store)
+    monkeypatch.setattr(conversion, "get_settings", lambda: make_settings())
+    store.upsert([
+        currency(1, "USDEUR", 0.9, "fiat"),
+        currency(2, "USDRUB", 90.0, "cbr"),
+        currency(3, "EURRUB", 101.0, "cbr"),  # расходится с USD путем - в дерево не попадет
+        currency(4, "BTC", 60000.0, "crypto"),
+    ])
+    return store
+
+
+@pytest.fixture
+def engine(store):
+    return ConversionEngine()
+
+
+def test_split_pair():
+    assert split_pair("crypto", "BTC") == ("BTC", "USDT")
+    assert split_pair("cbr", "USDRUB") == ("USD", "RUB")
+    assert split_pair("fiat", "EURO") is None
+
+
+def test_rates_follow_cheapest_paths(engine):
+    assert engine.rate("USD", "EUR") == pytest.approx(0.9)
+    # EUR -> RUB через USD (fiat + cbr), а не прямым курсом ЦБ
+    assert engine.rate("EUR", "RUB") == pytest.approx(100.0)
+    # USDT привязан к USD
+    assert engine.rate("BTC", "EUR") == pytest.approx(54000.0)
+    rate, amount = engine.convert("eur", "usd", 9)
+    assert (rate, amount) == (pytest.approx(1 / 0.9), pytest.approx(10.0))
+
+
+def test_matrix_is_consistent(engine):
+    assets = ["USD", "EUR", "RUB", "BTC"]
+    matrix = engine.matrix(assets)
+    assert np.allclose(np.diag(matrix), 1.0)
+    assert np.allclose(matrix * matrix.T, 1.0)
+    assert matrix[1][2] == pytest.approx(engine.rate("EUR", "RUB"))
+
+
+def test_unknown_assets(engine):
+    assert engine.unknown(["USD", "XYZ"]) == ["XYZ"]
+    with pytest.raises(KeyError):
+        engine.rate("XYZ", "USD")
+
+
+def test_incremental_update_and_rebuild(engine, store):
+    engine.rate("USD", "EUR")
+    rebuilds = engine.stats["rebuilds"]
+
+    store.upsert([currency(4, "BTC", 61000.0, "crypto")])
+    assert engine.rate("BTC", "USD") == pytest.approx(61000.0)
+    assert engine.stats["rebuilds"] == rebuilds
+    assert engine.stats["incremental_updates"] == 1
+
+    # Новое ребро - граф перестраивается
+    store.upsert([currency(5, "ETH", 3000.0, "crypto")])
+    assert engine.rate("ETH", "BTC") == pytest.approx(3000.0 / 61000.0)
+    assert engine.stats["rebuilds"] == rebuilds + 1
+
+    store.remove("USDRUB")
+    # RUB все еще достижим через EURRUB
+    assert engine.rate("EUR", "RUB") == pytest.approx(101.0)
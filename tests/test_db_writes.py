@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import routes
+from app.db.models import RateHistory
+from app.schemas.currency import CurrencyCreate, CurrencyUpdate
+from app.services.currency_service import CurrencyService
+from app.services.history_service import HistoryService, to_epoch
+from app.tasks import compaction
+from tests.conftest import make_settings
+
+
+@pytest.fixture
+def writer_only(monkeypatch, database):
+    """Прямые сессии писателя запрещены - записи только через очередь."""
+    monkeypatch.setattr(routes, "db", database)
+    monkeypatch.setattr(compaction, "db", database)
+
+    def forbidden():
+        raise AssertionError("запись мимо db.writer")
+
+    submitted = []
+    submit = database.writer.submit
+
+    async def counting_submit(job):
+        submitted.append(job)
+        return await submit(job)
+
+    monkeypatch.setattr(database.writer, "submit", counting_submit)
+    monkeypatch.setattr(database, "async_session", forbidden)
+    return submitted
+
+
+@pytest.mark.asyncio
+async def test_api_writes_go_through_writer(writer_only, database):
+    created = await routes.create_currency(CurrencyCreate(code="AAA", name="a", rate=1.0))
+    patched = await routes.patch_currency("AAA", CurrencyUpdate(rate=2.0))
+    assert (patched.id, patched.rate, patched.previous_rate) == (created.id, 2.0, 1.0)
+
+    await routes.delete_currency(str(created.id))
+    with pytest.raises(HTTPException) as exc:
+        await routes.delete_currency("AAA")
+    assert exc.value.status_code == 404
+    assert len(writer_only) == 4
+
+    async with database.read_session() as session:
+        assert await CurrencyService.get_currency_by_code(session, "AAA") is None
+
+
+@pytest.mark.asyncio
+async def test_compaction_goes_through_writer(writer_only, database, monkeypatch):
+    manager = compaction.HistoryCompactionManager()
+    manager.settings = make_settings(history_raw_retention_hours=1, history_compaction_batch_rows=2)
+    old = to_epoch(datetime.utcnow() - timedelta(days=1))
+    async with database.lease_session() as session:
+        session.add_all([RateHistory(code="BTC", ts=old + i * 600, rate=100.0 + i) for i in range(5)])
+        await session.commit()
+
+    assert await manager.run_once()
+    assert manager.last_status["rows_compacted"] == 5
+    assert writer_only  # окна ушли в очередь писателя
+    async with database.read_session() as session:
+        assert await HistoryService.get_oldest_ts(session, None) is None
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from app.api import routes
+from app.services import export_service
+from app.services.export_service import ExportService, export_slots
+from tests.conftest import make_settings
+
+
+def test_export_slots_below_read_pool(monkeypatch):
+    settings = make_settings(export_max_concurrent=8, sqlite_read_pool_size=4)
+    monkeypatch.setattr(export_service, "get_settings", lambda: settings)
+    assert export_slots() == 3
+
+    settings = make_settings(export_max_concurrent=2, sqlite_read_pool_size=1)
+    monkeypatch.setattr(export_service, "get_settings", lambda: settings)
+    assert export_slots() == 1
+
+
+@pytest.mark.asyncio
+async def test_busy_rejects_new_export(monkeypatch):
+    monkeypatch.setattr(ExportService, "_slots", asyncio.Semaphore(1))
+    async with ExportService._slots:
+        assert ExportService.busy()
+        with pytest.raises(routes.HTTPException) as exc:
+            routes._check_export("csv")
+        assert exc.value.status_code == 503
+    assert not ExportService.busy()
+    routes._check_export("csv")
+
+
+@pytest.mark.asyncio
+async def test_stalled_client_is_dropped(monkeypatch):
+    monkeypatch.setattr(routes.settings, "export_send_timeout", 0.05)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if message.get("body"):
+            await asyncio.sleep(10)  # клиент не читает
+
+    async def body():
+        yield b"chunk"
+
+    response = routes.ExportResponse(body(), media_type="text/csv")
+    with pytest.raises(asyncio.TimeoutError):
+        await response.stream_response(send)
+    assert [m["type"] for m in sent] == ["http.response.start", "http.response.body"]
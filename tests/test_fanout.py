@@ -0,0 +1,41 @@
+import pytest
+
+from app.ws import fanout as fanout_module
+from app.ws.fanout import NATSFanout
+from tests.conftest import make_settings
+
+
+class FakeNATS:
+    def __init__(self, nc):
+        self.nc = nc
+        self.subscribed = []
+
+    async def subscribe(self, subject, handler):
+        if self.nc == "broken":
+            raise RuntimeError("permissions violation")
+        self.subscribed.append(subject)
+
+
+@pytest.fixture
+def fanout():
+    fanout = NATSFanout()
+    fanout.settings = make_settings(ws_fanout_mode="nats")
+    return fanout
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("nc", [None, "broken"])
+async def test_falls_back_to_local_without_nats(monkeypatch, fanout, nc):
+    monkeypatch.setattr(fanout_module, "nats_client", FakeNATS(nc))
+    assert not await fanout.start()
+    assert fanout.settings.ws_fanout_mode == "local"
+    assert fanout.subject is None
+
+
+@pytest.mark.asyncio
+async def test_subscribes_when_connected(monkeypatch, fanout):
+    nats = FakeNATS(object())
+    monkeypatch.setattr(fanout_module, "nats_client", nats)
+    assert await fanout.start()
+    assert fanout.settings.ws_fanout_mode == "nats"
+    assert nats.subscribed == [fanout.subject] == ["currency.updates"]
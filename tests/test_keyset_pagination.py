@@ -0,0 +1,69 @@
+import pytest
+import pytest_asyncio
+
+from app.api import routes
+from app.services.currency_service import CurrencyService
+
+
+@pytest_asyncio.fixture
+async def seeded(monkeypatch, database):
+    monkeypatch.setattr(routes, "db", database)
+    rows = [("crypto", f"C{i:02d}", f"c{i}", float(i)) for i in range(1, 8)]
+    rows += [("fiat", "USDEUR", "eur", 0.9), ("fiat", "USDGBP", "gbp", 0.8)]
+    await database.writer.submit(
+        lambda session: CurrencyService.bulk_upsert_currencies(session, rows, commit=False)
+    )
+    return database
+
+
+async def page(**params):
+    params = {"c_type": None, "codes": None, "prefix": None, "updated_since": None,
+              "after": None, "limit": None, **params}
+    return await routes.get_currencies(None, **params)
+
+
+async def walk(**params):
+    """Все страницы подряд: коды по страницам."""
+    pages, after = [], None
+    while True:
+        response = await page(after=after, **params)
+        pages.append([c.code for c in response.currencies])
+        if response.next_after is None:
+            return pages
+        after = response.next_after
+
+
+@pytest.mark.asyncio
+async def test_pages_cover_everything_once(seeded):
+    pages = await walk(limit=4)
+    assert [len(p) for p in pages] == [4, 4, 1]
+    codes = [code for p in pages for code in p]
+    assert len(codes) == len(set(codes)) == 9
+
+
+@pytest.mark.asyncio
+async def test_exact_multiple_has_no_empty_last_page(seeded):
+    # 7 крипто по 7 - одна полная страница без курсора дальше
+    assert await walk(c_type="crypto", limit=7) == [[f"C{i:02d}" for i in range(1, 8)]]
+
+
+@pytest.mark.asyncio
+async def test_cursor_past_end_and_gaps(seeded):
+    first = await page(limit=2)
+    assert first.next_after == first.currencies[-1].id
+
+    # Удаленная валюта внутри следующей страницы не сбивает курсор
+    gap = first.next_after + 1
+    await seeded.writer.submit(lambda session: CurrencyService.delete_currency(session, gap, commit=False))
+    second = await page(limit=2, after=first.next_after)
+    assert [c.id for c in second.currencies] == [first.next_after + 2, first.next_after + 3]
+
+    last = await page(after=10_000, limit=5)
+    assert (last.total, last.next_after) == (0, None)
+
+
+@pytest.mark.asyncio
+async def test_cursor_with_prefix_filter(seeded):
+    pages = await walk(prefix="usd", limit=1)
+    assert pages == [["USDEUR"], ["USDGBP"]]
+    assert (await page(prefix="C0", after=3)).total == 4
@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.tasks import leader
+from app.tasks.leader import DBLeaseBackend, LeaderElector, MemoryLeaseBackend
+from tests.conftest import make_settings
+
+TTL = 15.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(leader, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture(params=["memory", "db"])
+def backend(request, monkeypatch, clock):
+    if request.param == "memory":
+        return MemoryLeaseBackend()
+    monkeypatch.setattr(leader, "db", request.getfixturevalue("database"))
+    return DBLeaseBackend()
+
+
+@pytest.mark.asyncio
+async def test_lease_expiry_and_takeover(backend, clock):
+    assert await backend.acquire("a", TTL)
+    assert not await backend.acquire("b", TTL)
+    assert await backend.current_leader() == "a"
+
+    # Продление сдвигает срок
+    clock.now += TTL - 1
+    assert await backend.acquire("a", TTL)
+    clock.now += TTL - 1
+    assert not await backend.acquire("b", TTL)
+
+    # Лидер пропал - после истечения аренду забирает другой узел
+    clock.now += 2
+    assert await backend.current_leader() is None
+    assert await backend.acquire("b", TTL)
+    assert not await backend.acquire("a", TTL)
+    assert await backend.current_leader() == "b"
+
+
+@pytest.mark.asyncio
+async def test_release_only_by_holder(backend, clock):
+    assert await backend.acquire("a", TTL)
+    await backend.release("b")
+    assert not await backend.acquire("b", TTL)
+    await backend.release("a")
+    assert await backend.acquire("b", TTL)
+
+
+def elector(node_id, events):
+    elector = LeaderElector()
+    elector.settings = make_settings(leader_lease_ttl=TTL)
+    elector.node_id = node_id
+
+    async def elected():
+        events.append((node_id, "elected"))
+
+    async def demoted():
+        events.append((node_id, "demoted"))
+
+    elector._on_elected, elector._on_demoted = elected, demoted
+    return elector
+
+
+@pytest.mark.asyncio
+async def test_elector_takeover_and_demotion(clock):
+    backend = MemoryLeaseBackend()
+    events = []
+    a, b = elector("a", events), elector("b", events)
+    a.backend = b.backend = backend
+
+    await a.tick()
+    await b.tick()
+    assert (a.is_leader, b.is_leader, b.leader) == (True, False, "a")
+
+    # "a" завис и не продлевает аренду
+    clock.now += TTL + 1
+    await b.tick()
+    await a.tick()
+    assert (a.is_leader, b.is_leader, a.leader) == (False, True, "b")
+    assert events == [("a", "elected"), ("b", "elected"), ("a", "demoted")]
+
+
+@pytest.mark.asyncio
+async def test_leader_steps_down_when_backend_fails(clock):
+    events = []
+    a = elector("a", events)
+    a.backend = MemoryLeaseBackend()
+    await a.tick()
+
+    async def broken(node_id, ttl):
+        raise RuntimeError("backend down")
+
+    a.backend.acquire = broken
+    clock.now += TTL / 3
+    await a.tick()
+    assert a.is_leader  # продлен недавно - аренда еще наша
+    clock.now += TTL / 3
+    await a.tick()
+    assert not a.is_leader  # слагаем полномочия до истечения аренды
+    assert events == [("a", "elected"), ("a", "demoted")]
+
+
+@pytest.mark.asyncio
+async def test_failed_start_gives_up_lease(clock):
+    events = []
+    backend = MemoryLeaseBackend()
+    a, b = elector("a", events), elector("b", events)
+    a.backend = b.backend = backend
+    failures = [RuntimeError("database is locked")]
+
+    async def elected():
+        if failures:
+            raise failures.pop()
+        events.append(("a", "elected"))
+
+    a._on_elected = elected
+    await a.tick()
+    assert (a.is_leader, a.leader) == (False, None)
+    assert events == [("a", "demoted")]
+    assert await backend.current_leader() is None
+
+    # Следующая попытка (или другой узел) снова берет аренду
+    await a.tick()
+    await b.tick()
+    assert (a.is_leader, b.is_leader, b.leader) == (True, False, "a")
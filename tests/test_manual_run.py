@@ -0,0 +1,68 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api import routes
+from app.tasks import background
+from tests.conftest import make_settings
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    settings = make_settings(providers_enabled=["fiat", "binance"])
+    monkeypatch.setattr(background, "get_settings", lambda: settings)
+    manager = background.BackgroundTaskManager()
+    cycles = []
+
+    async def run_cycle(provider):
+        cycles.append(provider.name)
+        return 1, 0, 0
+
+    monkeypatch.setattr(manager, "_run_cycle", run_cycle)
+    manager.cycles = cycles
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_run_once_skips_provider_mid_cycle(manager):
+    async with manager._cycle_locks["binance"]:
+        assert await manager.run_once()
+    assert manager.cycles == ["fiat"]
+    assert "пропущены (уже в цикле): binance" in manager.last_status["message"]
+
+    assert await manager.run_once()
+    assert manager.cycles == ["fiat", "fiat", "binance"]
+
+
+@pytest.mark.asyncio
+async def test_manual_run_rejected_on_follower(manager, monkeypatch):
+    monkeypatch.setattr(routes, "background_manager", manager)
+    manager.is_running = False
+    with pytest.raises(HTTPException) as exc:
+        await routes.run_background_task()
+    assert exc.value.status_code == 409
+    assert exc.value.detail["leader"] is None
+    assert manager.cycles == []
+
+    manager.is_running = True
+    response = await routes.run_background_task()
+    assert response.currencies_count == 2
+
+
+@pytest.mark.asyncio
+async def test_compaction_run_rejected_on_follower(manager, monkeypatch):
+    monkeypatch.setattr(routes, "background_manager", manager)
+    runs = []
+
+    async def run_once():
+        runs.append(1)
+
+    monkeypatch.setattr(routes.compaction_manager, "run_once", run_once)
+    manager.is_running = False
+    with pytest.raises(HTTPException) as exc:
+        await routes.run_compaction()
+    assert exc.value.status_code == 409
+    assert runs == []
+
+    manager.is_running = True
+    await routes.run_compaction()
+    assert runs == [1]
@@ -0,0 +1,44 @@
+import httpx
+import pytest
+
+from app.metrics import provider_fetch_seconds, provider_parse_seconds
+from app.providers.cbr import CBRProvider
+from app.ws.manager import ClientConnection, WebSocketManager
+from tests.conftest import make_settings
+
+
+def families(collector):
+    return {name: samples for name, _, _, samples in collector()}
+
+
+def test_queue_depth_sampled_at_scrape():
+    manager = WebSocketManager()
+    for i, depth in enumerate((0, 3, 70)):
+        conn = ClientConnection(object(), max_queue=1000, policy="drop_oldest")
+        for n in range(depth):
+            conn.enqueue(n)
+        manager.active_connections[i] = conn
+
+    samples = families(manager.collect_metrics)
+    assert samples["currency_ws_queue_depth_max"] == [({}, 70)]
+    clients = {labels["le"]: value for labels, value in samples["currency_ws_queue_depth_clients"]}
+    assert (clients["0"], clients["5"], clients["50"], clients["100"], clients["+Inf"]) == (1, 2, 2, 3, 3)
+
+
+class FakeClient:
+    async def get(self, url, name, **kwargs):
+        body = b'{"Valute": {"USD": {"Value": 90.0, "Nominal": 1}}}'
+        return httpx.Response(200, content=body, request=httpx.Request("GET", url))
+
+
+@pytest.mark.asyncio
+async def test_json_decoded_in_parse_timing(monkeypatch):
+    observed = []
+    monkeypatch.setattr(provider_fetch_seconds, "observe", lambda v, name: observed.append("fetch"))
+    monkeypatch.setattr(provider_parse_seconds, "observe", lambda v, name: observed.append("parse"))
+    provider = CBRProvider(make_settings())
+
+    assert await provider.fetch(FakeClient()) == b'{"Valute": {"USD": {"Value": 90.0, "Nominal": 1}}}'
+    provider.invalidate()
+    assert await provider.get_rates(FakeClient()) == {"USD": 90.0}
+    assert observed == ["fetch", "parse"]
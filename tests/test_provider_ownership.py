@@ -0,0 +1,84 @@
+import pytest
+
+from app.services.currency_service import CurrencyService
+from app.tasks import background
+from tests.conftest import make_settings
+
+
+@pytest.fixture
+def manager(monkeypatch, database):
+    settings = make_settings(
+        providers_enabled=["fiat", "binance", "cbr"],
+        default_fiat_currencies=["EUR"],
+        default_cbr_currencies=["USD"],
+        history_enabled=False,
+    )
+    monkeypatch.setattr(background, "get_settings", lambda: settings)
+    monkeypatch.setattr(background, "db", database)
+    return background.BackgroundTaskManager()
+
+
+def provider(manager, name):
+    return next(p for p in manager.providers if p.name == name)
+
+
+def test_colliding_code_is_owned_by_later_provider(manager):
+    fiat = provider(manager, "fiat")
+    rows = fiat.rows({"RUB": 92.5, "EUR": 0.9})
+    assert [row[1] for row in manager.owned_rows(fiat, rows)] == ["USDEUR"]
+
+    cbr = provider(manager, "cbr")
+    assert [row[1] for row in manager.owned_rows(cbr, cbr.rows({"USD": 91.1}))] == ["USDRUB"]
+
+
+def test_non_default_collision_resolved_once_both_seen(manager):
+    fiat = provider(manager, "fiat")
+    cbr = provider(manager, "cbr")
+    # Код вне стоковых: пока его приносит только fiat - пишет fiat,
+    # после первого документа cbr с тем же кодом - только cbr
+    assert manager.owned_rows(fiat, [("fiat", "XXXRUB", "x", 1.0)])
+    assert manager.owned_rows(cbr, [("cbr", "XXXRUB", "x", 2.0)])
+    assert manager.owned_rows(fiat, [("fiat", "XXXRUB", "x", 1.0)]) == []
+
+
+@pytest.mark.asyncio
+async def test_usdrub_not_flipped_between_cbr_and_fiat(manager, database):
+    fiat = provider(manager, "fiat")
+    cbr = provider(manager, "cbr")
+
+    await manager.update_all_mode(cbr, {"USD": 91.1})
+    updated, _, _ = await manager.update_all_mode(fiat, {"RUB": 92.5, "EUR": 0.9})
+    assert updated == 1  # только USDEUR
+    await manager.update_all_mode(cbr, {"USD": 91.2})
+
+    async with database.read_session() as session:
+        usdrub = await CurrencyService.get_currency_by_code(session, "USDRUB")
+    assert usdrub.rate == 91.2
+    assert usdrub.previous_rate == 91.1
+    assert usdrub.type == "cbr"
+
+
+@pytest.mark.asyncio
+async def test_missing_rate_warning_and_type_follow_owner(manager, database, caplog):
+    # Созданные вручную: BTC с неверным типом, USDXYZ - нет ни у одного источника
+    rows = [("fiat", "BTC", "btc", 1.0), ("fiat", "USDXYZ", "xyz", 1.0)]
+    await database.writer.submit(
+        lambda session: CurrencyService.bulk_upsert_currencies(session, rows, commit=False)
+    )
+    fiat = provider(manager, "fiat")
+    binance = provider(manager, "binance")
+
+    with caplog.at_level("WARNING", logger=background.logger.name):
+        await manager.update_all_mode(fiat, {"USD": 1.0, "EUR": 0.9})
+        await manager.update_all_mode(binance, {"BTC": 60000.0})
+    assert "не найден в API" not in caplog.text
+
+    async with database.read_session() as session:
+        btc = await CurrencyService.get_currency_by_code(session, "BTC")
+    assert (btc.rate, btc.type) == (60000.0, "crypto")
+
+    # BTC теперь пишет binance - его пропажа из документа заметна
+    with caplog.at_level("WARNING", logger=background.logger.name):
+        await manager.update_all_mode(binance, {"ETH": 3000.0})
+    missing = [r.getMessage() for r in caplog.records if "не найден в API" in r.getMessage()]
+    assert missing == ["Курс для валюты из БД BTC не найден в API"]
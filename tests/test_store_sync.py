@@ -0,0 +1,113 @@
+from datetime import datetime
+
+import pytest
+
+from app.schemas.currency import CurrencyResponse, StoreSyncMessage
+from app.services import store_sync as store_sync_module
+from app.services.rate_store import RateStore
+from app.services.store_sync import StoreSync
+from app.tasks import background
+from tests.conftest import make_settings
+
+
+class FakeNATS:
+    """Вместо nats_client: копит опубликованное."""
+
+    def __init__(self):
+        self.nc = object()
+        self.published = []
+
+    async def publish_batch(self, messages):
+        self.published.extend(messages)
+
+    def currency_subject(self, c_type, code):
+        return f"currency.updates.{c_type}.{code}"
+
+    def batch_subject(self):
+        return "currency.updates.batch"
+
+
+@pytest.fixture
+def nats(monkeypatch):
+    fake = FakeNATS()
+    monkeypatch.setattr(store_sync_module, "nats_client", fake)
+    monkeypatch.setattr(background, "nats_client", fake)
+    return fake
+
+
+@pytest.fixture
+def remote_store(monkeypatch):
+    """Кэш "другого процесса"."""
+    store = RateStore()
+    monkeypatch.setattr(store_sync_module, "rate_store", store)
+    return store
+
+
+def sync_messages(nats):
+    return [
+        StoreSyncMessage.model_validate_json(frame.data)
+        for subject, frame in nats.published
+        if subject == "currency.sync"
+    ]
+
+
+def currency(code, rate, id=1):
+    now = datetime.utcnow()
+    return CurrencyResponse(id=id, code=code, name=code, rate=rate, type="crypto",
+                            updated_at=now, created_at=now)
+
+
+def test_messages_empty_without_nats(monkeypatch):
+    monkeypatch.setattr(store_sync_module.nats_client, "nc", None)
+    assert StoreSync().messages([currency("BTCUSDT", 1.0)]) == []
+
+
+def test_messages_are_split_and_own_origin_skipped(nats, remote_store):
+    sync = StoreSync()
+    sync.settings = make_settings(nats_sync_batch_size=2)
+    messages = sync.messages(
+        [currency(f"C{i}USDT", i, id=i) for i in range(5)], removed=["OLD"], invalidate=True
+    )
+    parsed = [StoreSyncMessage.model_validate_json(frame.data) for _, frame in messages]
+    assert [len(m.upserted) for m in parsed] == [2, 2, 1]
+    assert [m.removed for m in parsed] == [[], [], ["OLD"]]
+    assert [m.invalidate for m in parsed] == [False, False, True]
+
+    for message in parsed:
+        sync.apply(message)
+    assert remote_store.all() == []
+
+    other = StoreSync()
+    other.origin = "other-node"
+    calls = []
+    other.add_invalidate_listener(lambda: calls.append(1))
+    for message in parsed:
+        other.apply(message)
+    assert len(remote_store.all()) == 5
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_cycle_below_threshold_still_synced(nats, remote_store, monkeypatch, database):
+    settings = make_settings(
+        providers_enabled=["binance"],
+        default_crypto_currencies=["BTCUSDT"],
+        history_enabled=False,
+        min_change_percent={"crypto": 50.0},
+    )
+    monkeypatch.setattr(background, "get_settings", lambda: settings)
+    monkeypatch.setattr(background, "db", database)
+    manager = background.BackgroundTaskManager()
+    binance = manager.providers[0]
+
+    await manager.update_all_mode(binance, {"BTCUSDT": 100.0})
+    nats.published.clear()
+    # +1% - ниже порога: событий нет, но другие процессы получают новый курс
+    await manager.update_all_mode(binance, {"BTCUSDT": 101.0})
+
+    assert [subject for subject, _ in nats.published] == ["currency.sync"]
+    other = StoreSync()
+    other.origin = "other-node"
+    for message in sync_messages(nats):
+        other.apply(message)
+    assert remote_store.get("BTCUSDT").rate == 101.0
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from app.encoding import loads
+from app.schemas.currency import CurrencyResponse
+from app.services.rate_store import RateStore
+from app.ws import manager as manager_module
+from app.ws.manager import ClientConnection, ENCODING_COMPACT, WebSocketManager
+
+
+def currency(id, code, rate):
+    now = datetime.utcnow()
+    return CurrencyResponse(id=id, code=code, name=code, rate=rate, type="crypto",
+                            updated_at=now, created_at=now)
+
+
+def queued(conn):
+    return [loads(frame.data) for frame in conn.pending.values()]
+
+
+def test_new_codes_sent_to_compact_clients(monkeypatch):
+    store = RateStore()
+    monkeypatch.setattr(manager_module, "rate_store", store)
+    store.upsert([currency(1, "BTC", 100.0)])
+    manager = WebSocketManager()
+    store._notify(None)  # загрузка кэша при старте
+
+    compact = ClientConnection(object(), 100, "drop_oldest", encoding=ENCODING_COMPACT)
+    plain = ClientConnection(object(), 100, "drop_oldest")
+    manager.active_connections.update({1: compact, 2: plain})
+
+    store.upsert([currency(1, "BTC", 101.0)])
+    assert queued(compact) == []
+
+    store.upsert([currency(1, "BTC", 102.0), currency(2, "ETH", 10.0)])
+    assert queued(compact) == [{"type": "codes", "codes": [[2, "ETH", "crypto"]]}]
+    assert queued(plain) == []
+
+    # Полная перезагрузка кэша - полный словарь
+    compact.pending.clear()
+    store._notify(None)
+    assert queued(compact) == [{"type": "codes", "codes": [[1, "BTC", "crypto"], [2, "ETH", "crypto"]]}]
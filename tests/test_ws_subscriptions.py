@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from app.ws.manager import ClientConnection, WebSocketManager
+from tests.conftest import make_settings
+
+
+@pytest.fixture
+def manager():
+    manager = WebSocketManager()
+    manager.settings = make_settings(ws_max_subscriptions=2)
+    return manager
+
+
+@pytest.fixture
+def conn(manager):
+    conn = ClientConnection(object(), 100, "drop_oldest")
+    manager.active_connections[conn.websocket] = conn
+    return conn
+
+
+async def send(manager, conn, **message):
+    conn.pending.clear()
+    await manager.handle_client_message(conn.websocket, json.dumps(message))
+    return list(conn.pending.values())
+
+
+@pytest.mark.asyncio
+async def test_rejected_subscriptions_reported(manager, conn):
+    error, subscriptions = await send(
+        manager, conn, action="subscribe", codes=["btc", "eth", "sol"], types=["CBR", "stocks"]
+    )
+    assert error["type"] == "error"
+    assert error["rejected"] == {"codes": ["SOL"], "types": ["stocks"]}
+    assert (subscriptions["codes"], subscriptions["types"]) == (["BTC", "ETH"], ["cbr"])
+    assert conn in manager.type_subscribers["cbr"]
+
+    # Повторная подписка на уже подписанные коды в лимит не упирается
+    [subscriptions] = await send(manager, conn, action="subscribe", codes=["BTC"], types=["Crypto"])
+    assert subscriptions["types"] == ["cbr", "crypto"]
+
+    [subscriptions] = await send(manager, conn, action="unsubscribe", codes=["eth"], types=["CBR"])
+    assert (subscriptions["codes"], subscriptions["types"]) == (["BTC"], ["crypto"])
+    assert "cbr" not in manager.type_subscribers